@@ -1,12 +1,25 @@
-from flask import Flask
+from flask import Flask, g, jsonify, request
 from flask_cors import CORS
 from .routes.email import email_bp
+from .routes.health import health_bp
+from .routes.metrics import metrics_bp
+from .routes.admin import admin_bp
 from .auth import authenticate, callback
+from .resilience import UpstreamUnavailableError, deadline_from_header, reset_deadline, start_deadline
+from .log import configure_logging, end_request_context, request_id_var, start_request_context
+from .metrics import REQUEST_SECONDS, current_route
+from .profiling import request_profiler
+from .responses import FastJSONProvider, compress_response
+from . import tracing
+import logging
 import os
+import time
 
 def create_app():
     """Create and configure the Flask application."""
+    configure_logging()
     app = Flask(__name__)
+    app.json = FastJSONProvider(app)
     
     # Configure session
     app.secret_key = os.getenv('FLASK_SECRET_KEY', 'dev')
@@ -26,4 +39,88 @@ def create_app():
     # Register email routes blueprint
     app.register_blueprint(email_bp, url_prefix='/api/email')
     
+    # Register liveness/readiness probes and the Prometheus endpoint
+    app.register_blueprint(health_bp)
+    app.register_blueprint(metrics_bp)
+    
+    # Token-protected admin endpoints (on-demand profiling)
+    app.register_blueprint(admin_bp, url_prefix='/admin')
+    
+    # Every request gets a deadline that outbound Gmail, Gemini and Supabase calls respect
+    @app.before_request
+    def start_request_deadline():
+        g.deadline_token = start_deadline(deadline_from_header(request.headers.get('X-Request-Timeout')))
+    
+    # Correlation id for every log line of the request, echoed back to the client
+    @app.before_request
+    def start_request_logging():
+        g.log_tokens = start_request_context(request.headers.get('X-Request-ID'))
+    
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        g.route_token = current_route.set(request.url_rule.rule if request.url_rule else "unmatched")
+    
+    # Root span of the request timeline; exported when sampled, slow or failed
+    @app.before_request
+    def start_request_trace():
+        g.trace_token = tracing.start_trace(f"{request.method} {current_route.get()}", **{
+            "http.method": request.method,
+            "http.route": current_route.get(),
+            "request_id": request_id_var.get(),
+        })
+    
+    # Only does work while an admin has asked to profile requests to a route
+    @app.before_request
+    def start_request_profile():
+        if request_profiler.session is not None:
+            g.profile_session = request_profiler.enter(current_route.get())
+    
+    # Registered first so it runs last, once every other hook has finished with the body
+    @app.after_request
+    def compress(response):
+        return compress_response(response)
+    
+    @app.after_request
+    def add_request_id(response):
+        response.headers['X-Request-ID'] = request_id_var.get() or ''
+        return response
+    
+    @app.after_request
+    def observe_request(response):
+        started = g.get('request_started')
+        if started is not None:
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - started, current_route.get(), request.method, str(response.status_code)
+            )
+        tracing.set_attribute('http.status_code', response.status_code)
+        return response
+    
+    @app.teardown_request
+    def clear_request_deadline(exc):
+        profile_session = g.pop('profile_session', None)
+        if profile_session is not None:
+            request_profiler.exit(profile_session)
+        trace_token = g.pop('trace_token', None)
+        if trace_token is not None:
+            tracing.end_trace(trace_token, exc)
+        token = g.pop('deadline_token', None)
+        if token is not None:
+            reset_deadline(token)
+        log_tokens = g.pop('log_tokens', None)
+        if log_tokens is not None:
+            end_request_context(log_tokens)
+        route_token = g.pop('route_token', None)
+        if route_token is not None:
+            current_route.reset(route_token)
+    
+    @app.errorhandler(UpstreamUnavailableError)
+    def upstream_unavailable(e):
+        logging.getLogger(__name__).warning("Upstream unavailable: %s", e)
+        response = jsonify({"success": False, "error": str(e)})
+        response.status_code = e.status_code
+        if e.retry_after is not None:
+            response.headers['Retry-After'] = str(max(1, int(e.retry_after)))
+        return response
+    
     return app 
\ No newline at end of file
@@ -0,0 +1,223 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import threading
+import time
+from typing import Any, Awaitable, Dict, List, Optional
+
+from .config import GMAIL_BACKEND, SUPABASE_URL, SUPABASE_KEY
+from . import tracing
+from .metrics import record_gmail
+from .resilience import CircuitOpenError, DeadlineExceededError, gmail_breaker, remaining, timeout_for
+
+GMAIL_API_URL = "https://gmail.googleapis.com/gmail/v1/users/"
+
+# ---------------- Shared I/O event loop ----------------
+# All async clients live on one background loop so their connection pools are
+# shared across requests. Sync Flask views submit coroutines with run_async;
+# async views await them with run_on_io_loop.
+_io_loop: Optional[asyncio.AbstractEventLoop] = None
+_io_loop_lock = threading.Lock()
+
+def get_io_loop() -> asyncio.AbstractEventLoop:
+    global _io_loop
+    if _io_loop is None:
+        with _io_loop_lock:
+            if _io_loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="io-loop", daemon=True)
+                thread.start()
+                _io_loop = loop
+    return _io_loop
+
+async def _in_context(coro: Awaitable, context: contextvars.Context) -> Any:
+    # Tasks on the I/O loop do not inherit the caller's context; carry its
+    # variables (request deadline, log correlation id, trace span) over
+    for var, value in context.items():
+        var.set(value)
+    return await coro
+
+def run_async(coro: Awaitable, timeout: Optional[float] = None) -> Any:
+    """
+    Run a coroutine on the shared I/O loop from synchronous code.
+    The caller's request deadline applies to the coroutine and caps `timeout`.
+    """
+    left = remaining()
+    if left is not None:
+        timeout = left if timeout is None else min(timeout, left)
+    future = asyncio.run_coroutine_threadsafe(_in_context(coro, contextvars.copy_context()), get_io_loop())
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        if future.done():
+            # The coroutine's own TimeoutError (e.g. a socket timeout), not our wait
+            raise
+        future.cancel()
+        raise DeadlineExceededError("Deadline exceeded waiting for an upstream call")
+
+async def run_on_io_loop(coro: Awaitable) -> Any:
+    """Await a coroutine on the shared I/O loop from any event loop."""
+    loop = get_io_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        return await coro
+    return await asyncio.wrap_future(
+        asyncio.run_coroutine_threadsafe(_in_context(coro, contextvars.copy_context()), loop)
+    )
+
+# ---------------- Gmail ----------------
+class AsyncGmailClient:
+    """
+    Minimal asyncio Gmail REST client over one pooled httpx connection pool.
+    Mirrors the calls the app makes through googleapiclient and returns the
+    same JSON shapes.
+    """
+    def __init__(self, max_connections: int = 100, timeout: float = 30.0, transport=None):
+        import httpx
+        self.timeout = timeout
+        self._client = httpx.AsyncClient(
+            base_url=GMAIL_API_URL,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=20),
+            transport=transport,
+        )
+        self._refresh_lock: Optional[asyncio.Lock] = None
+
+    async def _ensure_valid(self, creds) -> None:
+        """Refresh expired credentials once, however many requests notice at the same time."""
+        if creds.valid:
+            return
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        async with self._refresh_lock:
+            if creds.valid:
+                return
+            # google-auth refresh is blocking; keep it off the event loop
+            from google.auth.transport.requests import Request
+            await asyncio.get_running_loop().run_in_executor(
+                None, tracing.wrap(creds.refresh, "gmail.token_refresh"), Request()
+            )
+
+    async def _request(self, creds, api_method: str, method: str, path: str, **kwargs) -> Dict:
+        timeout = timeout_for(self.timeout)
+
+        async def send():
+            await self._ensure_valid(creds)
+            response = await self._client.request(
+                method, path, headers={"Authorization": f"Bearer {creds.token}"},
+                timeout=timeout, **kwargs
+            )
+            response.raise_for_status()
+            return response.json()
+
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            with tracing.span(f"gmail.{api_method}", **{"gmail.method": method}):
+                result = await gmail_breaker.call_async(send)
+            outcome = "ok"
+            return result
+        except CircuitOpenError:
+            outcome = "rejected"
+            raise
+        finally:
+            record_gmail(api_method, time.perf_counter() - started, outcome)
+
+    async def list_messages(self, creds, user_id: str = "me", q: str = "", page_token: Optional[str] = None,
+                            max_results: int = 100) -> Dict:
+        params = {"q": q, "maxResults": max_results}
+        if page_token:
+            params["pageToken"] = page_token
+        return await self._request(creds, "users.messages.list", "GET", f"{user_id}/messages", params=params)
+
+    async def get_message(self, creds, message_id: str, user_id: str = "me", format: str = "full",
+                          metadata_headers: Optional[List[str]] = None) -> Dict:
+        params = [("format", format)] + [("metadataHeaders", h) for h in metadata_headers or []]
+        return await self._request(creds, "users.messages.get", "GET", f"{user_id}/messages/{message_id}", params=params)
+
+    async def get_messages(self, creds, message_ids: List[str], user_id: str = "me", format: str = "full",
+                           concurrency: int = 10) -> List[Any]:
+        """Fetch many messages concurrently. Failed fetches come back as exceptions."""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(message_id):
+            async with semaphore:
+                return await self.get_message(creds, message_id, user_id=user_id, format=format)
+
+        return await asyncio.gather(*(fetch(i) for i in message_ids), return_exceptions=True)
+
+    async def list_threads(self, creds, user_id: str = "me", q: str = "", page_token: Optional[str] = None,
+                           max_results: int = 100) -> Dict:
+        params = {"q": q, "maxResults": max_results}
+        if page_token:
+            params["pageToken"] = page_token
+        return await self._request(creds, "users.threads.list", "GET", f"{user_id}/threads", params=params)
+
+    async def get_thread(self, creds, thread_id: str, user_id: str = "me", format: str = "metadata",
+                         metadata_headers: Optional[List[str]] = None) -> Dict:
+        params = [("format", format)] + [("metadataHeaders", h) for h in metadata_headers or []]
+        return await self._request(creds, "users.threads.get", "GET", f"{user_id}/threads/{thread_id}", params=params)
+
+    async def get_threads(self, creds, thread_ids: List[str], user_id: str = "me", format: str = "metadata",
+                          metadata_headers: Optional[List[str]] = None, concurrency: int = 10) -> List[Any]:
+        """Fetch many threads concurrently. Failed fetches come back as exceptions."""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(thread_id):
+            async with semaphore:
+                return await self.get_thread(creds, thread_id, user_id=user_id, format=format,
+                                             metadata_headers=metadata_headers)
+
+        return await asyncio.gather(*(fetch(i) for i in thread_ids), return_exceptions=True)
+
+    async def list_history(self, creds, start_history_id: str, user_id: str = "me",
+                           page_token: Optional[str] = None, history_types: Optional[List[str]] = None) -> Dict:
+        params = [("startHistoryId", start_history_id)] + [("historyTypes", t) for t in history_types or []]
+        if page_token:
+            params.append(("pageToken", page_token))
+        return await self._request(creds, "users.history.list", "GET", f"{user_id}/history", params=params)
+
+    async def watch(self, creds, topic_name: str, label_ids: Optional[List[str]] = None, user_id: str = "me") -> Dict:
+        body = {"topicName": topic_name, "labelIds": label_ids or ["INBOX"], "labelFilterBehavior": "include"}
+        return await self._request(creds, "users.watch", "POST", f"{user_id}/watch", json=body)
+
+    async def send_message(self, creds, body: Dict, user_id: str = "me") -> Dict:
+        return await self._request(creds, "users.messages.send", "POST", f"{user_id}/messages/send", json=body)
+
+    async def get_profile(self, creds, user_id: str = "me") -> Dict:
+        return await self._request(creds, "users.getProfile", "GET", f"{user_id}/profile")
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+_gmail_client: Optional[AsyncGmailClient] = None
+
+def get_gmail_client() -> AsyncGmailClient:
+    """Return the shared Gmail client. Only use it from the I/O loop."""
+    global _gmail_client
+    if _gmail_client is None:
+        transport = None
+        if GMAIL_BACKEND == "fake":
+            from .fakes import fake_gmail_transport
+            transport = fake_gmail_transport()
+        _gmail_client = AsyncGmailClient(transport=transport)
+    return _gmail_client
+
+# ---------------- Supabase ----------------
+_supabase_client = None
+_supabase_lock: Optional[asyncio.Lock] = None
+
+async def get_async_supabase():
+    """Create the async Supabase client on first use. Only use it from the I/O loop."""
+    global _supabase_client, _supabase_lock
+    if _supabase_client is None:
+        if _supabase_lock is None:
+            _supabase_lock = asyncio.Lock()
+        async with _supabase_lock:
+            if _supabase_client is None:
+                from supabase import acreate_client
+                _supabase_client = await acreate_client(SUPABASE_URL, SUPABASE_KEY)
+    return _supabase_client
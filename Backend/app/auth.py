@@ -1,13 +1,20 @@
-from typing import Optional, Dict, Any
-from .config import supabase
+from typing import Optional, Dict, Any, Tuple
+from .aio import get_async_supabase, run_async, run_on_io_loop
+from .credentials import credential_store
 from .db import DatabaseService
 from .models import User
 from flask import Blueprint, redirect, url_for, session, request, jsonify
-from google_auth_oauthlib.flow import Flow
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
+import hashlib
 import os
-import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# How long a verified session token is trusted before Supabase is asked again
+SESSION_CACHE_SECONDS = float(os.getenv("SESSION_CACHE_SECONDS", "60"))
+SESSION_CACHE_SIZE = 10000
 
 # Define the scopes needed for Gmail API
 SCOPES = [
@@ -18,15 +25,22 @@ SCOPES = [
     'https://www.googleapis.com/auth/gmail.modify'
 ]
 
+async def _auth_call(call):
+    """Run a Supabase auth call with the async client on the I/O loop."""
+    async def run():
+        client = await get_async_supabase()
+        return await call(client.auth)
+    return await run_on_io_loop(run())
+
 class AuthService:
     @staticmethod
     async def sign_up(email: str, password: str, name: str) -> Dict[str, Any]:
         try:
             # Sign up with Supabase Auth
-            auth_response = supabase.auth.sign_up({
+            auth_response = await _auth_call(lambda auth: auth.sign_up({
                 "email": email,
                 "password": password
-            })
+            }))
             
             if auth_response.user:
                 # Create user in our database
@@ -49,10 +63,10 @@ class AuthService:
     async def sign_in(email: str, password: str) -> Dict[str, Any]:
         try:
             # Sign in with Supabase Auth
-            auth_response = supabase.auth.sign_in_with_password({
+            auth_response = await _auth_call(lambda auth: auth.sign_in_with_password({
                 "email": email,
                 "password": password
-            })
+            }))
             
             if auth_response.user:
                 # Get user from our database
@@ -73,7 +87,7 @@ class AuthService:
     @staticmethod
     async def sign_out(session_token: str) -> None:
         try:
-            supabase.auth.sign_out()
+            await _auth_call(lambda auth: auth.sign_out())
         except Exception as e:
             raise Exception(f"Sign out failed: {str(e)}")
 
@@ -81,7 +95,7 @@ class AuthService:
     async def get_current_user(session_token: str) -> Optional[User]:
         try:
             # Get user from session
-            user_response = supabase.auth.get_user(session_token)
+            user_response = await _auth_call(lambda auth: auth.get_user(session_token))
             
             if user_response.user:
                 # Get user from our database
@@ -92,24 +106,32 @@ class AuthService:
         except Exception as e:
             raise Exception(f"Failed to get current user: {str(e)}")
 
+    @staticmethod
+    async def get_user_id(session_token: str) -> Optional[str]:
+        """Id of the Supabase user the session token belongs to, or None."""
+        user_response = await _auth_call(lambda auth: auth.get_user(session_token))
+        return user_response.user.id if user_response and user_response.user else None
+
     @staticmethod
     async def reset_password(email: str) -> None:
         try:
-            supabase.auth.reset_password_for_email(email)
+            await _auth_call(lambda auth: auth.reset_password_for_email(email))
         except Exception as e:
             raise Exception(f"Password reset failed: {str(e)}")
 
     @staticmethod
     async def update_password(new_password: str, session_token: str) -> None:
         try:
-            supabase.auth.update_user({
+            await _auth_call(lambda auth: auth.update_user({
                 "password": new_password
-            })
+            }))
         except Exception as e:
             raise Exception(f"Password update failed: {str(e)}")
 
 def authenticate():
     """Authenticate with Gmail API."""
+    from google_auth_oauthlib.flow import Flow
+
     try:
         credentials_path = os.path.join(os.path.dirname(__file__), "credentials.json")
         token_path = os.path.join(os.path.dirname(__file__), "token.json")
@@ -137,11 +159,12 @@ def authenticate():
 
 def callback():
     """Handle the OAuth 2.0 callback."""
+    from google_auth_oauthlib.flow import Flow
+
     try:
         credentials_path = os.path.join(os.path.dirname(__file__), "credentials.json")
-        token_path = os.path.join(os.path.dirname(__file__), "token.json")
         
-        print(f"Saving token to: {token_path}")
+        logger.debug("Saving token to %s", credential_store.path)
 
         # Create flow instance with the stored credentials
         flow = Flow.from_client_secrets_file(
@@ -153,24 +176,56 @@ def callback():
         # Use the authorization server's response to fetch the OAuth 2.0 tokens
         flow.fetch_token(authorization_response=request.url)
 
-        # Store credentials
-        credentials = flow.credentials
-        token_data = {
-            'token': credentials.token,
-            'refresh_token': credentials.refresh_token,
-            'token_uri': credentials.token_uri,
-            'client_id': credentials.client_id,
-            'client_secret': credentials.client_secret,
-            'scopes': credentials.scopes
-        }
-
-        # Save the credentials for the next run
-        with open(token_path, 'w') as token_file:
-            json.dump(token_data, token_file)
-            print("Token saved successfully")
+        # Save the credentials (with their expiry) for the next run; every
+        # worker picks up the new token.json within TOKEN_CHECK_SECONDS
+        credential_store.save(flow.credentials)
+        logger.info("Token saved")
 
         # Redirect to the frontend dashboard on port 3000
         return redirect("http://localhost:3000/dashboard")
     except Exception as e:
-        print(f"Error in callback: {str(e)}")
-        return jsonify({"error": str(e), "success": False}), 500 
\ No newline at end of file
+        logger.exception("Error in OAuth callback")
+        return jsonify({"error": str(e), "success": False}), 500 
+
+class SessionUsers:
+    """
+    Session token -> Supabase user id, verified with Supabase and cached for
+    `ttl_seconds` so each request does not cost an auth round trip. Tokens
+    are kept only as hashes; failed verifications are not cached.
+    """
+    def __init__(self, ttl_seconds: float = SESSION_CACHE_SECONDS, max_entries: int = SESSION_CACHE_SIZE):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._users: Dict[str, Tuple[float, str]] = {}
+        self._lock = threading.Lock()
+
+    def user_id(self, session_token: str) -> Optional[str]:
+        key = hashlib.sha256(session_token.encode()).hexdigest()
+        with self._lock:
+            cached = self._users.get(key)
+        if cached and time.monotonic() - cached[0] < self.ttl_seconds:
+            return cached[1]
+        user_id = run_async(AuthService.get_user_id(session_token))
+        if user_id:
+            with self._lock:
+                if len(self._users) >= self.max_entries:
+                    self._users.clear()
+                self._users[key] = (time.monotonic(), user_id)
+        return user_id
+
+session_users = SessionUsers()
+
+def authenticated_user_id() -> Optional[str]:
+    """
+    The user behind the request's `Authorization: Bearer <Supabase access token>`
+    header, or None. Ids in request bodies are never trusted for access to
+    a user's data.
+    """
+    token = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    if not token:
+        return None
+    try:
+        return session_users.user_id(token)
+    except Exception as e:
+        logger.warning("Could not verify session token: %s", e)
+        return None
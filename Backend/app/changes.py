@@ -0,0 +1,376 @@
+import base64
+import json
+import logging
+import os
+import queue
+import tempfile
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from .aio import get_gmail_client, run_async
+from .config import GMAIL_BACKEND
+from .credentials import credential_store
+from .lifecycle import inflight
+from .mailbox import mailbox_version
+
+logger = logging.getLogger(__name__)
+
+# projects/<project>/topics/<topic> that Gmail publishes watch notifications to
+GMAIL_PUBSUB_TOPIC = os.getenv("GMAIL_PUBSUB_TOPIC", "")
+# Shared secret the Pub/Sub push subscription sends as ?token=
+PUBSUB_VERIFICATION_TOKEN = os.getenv("PUBSUB_VERIFICATION_TOKEN", "")
+# pubsub (Gmail watch notifications), poll (incremental sync loop) or local (fake mailbox)
+CHANGE_SOURCE = os.getenv(
+    "CHANGE_SOURCE", "local" if GMAIL_BACKEND == "fake" else "pubsub" if GMAIL_PUBSUB_TOPIC else "poll"
+)
+CHANGE_MARKER_PATH = os.getenv("CHANGE_MARKER_PATH", os.path.join(os.path.dirname(__file__), "mailbox_history.json"))
+CHANGE_CHECK_SECONDS = float(os.getenv("CHANGE_CHECK_SECONDS", "1"))
+CHANGE_POLL_SECONDS = float(os.getenv("CHANGE_POLL_SECONDS", "15"))
+CHANGE_RETRY_SECONDS = float(os.getenv("CHANGE_RETRY_SECONDS", "10"))
+CHANGE_BACKLOG = int(os.getenv("CHANGE_BACKLOG", "500"))
+# Open streams per worker; each one holds a worker thread
+CHANGE_MAX_STREAMS = int(os.getenv("CHANGE_MAX_STREAMS", "4"))
+# Streams are closed after this long and the browser reconnects with Last-Event-ID
+CHANGE_STREAM_MAX_SECONDS = float(os.getenv("CHANGE_STREAM_MAX_SECONDS", "300"))
+CHANGE_KEEPALIVE_SECONDS = float(os.getenv("CHANGE_KEEPALIVE_SECONDS", "20"))
+# Keep syncing this long after the last stream closes, so a page reload resumes without a gap
+CHANGE_LINGER_SECONDS = float(os.getenv("CHANGE_LINGER_SECONDS", "60"))
+STREAM_QUEUE_SIZE = 100
+# Renew the Gmail watch when it has less than this left (Gmail lets it run for 7 days)
+WATCH_RENEW_SECONDS = 86400
+
+class HistoryMarker:
+    """
+    The newest historyId announced by Gmail, kept in a small file. A Pub/Sub
+    push lands on one worker, but every worker's feed reads the file.
+    """
+    def __init__(self, path: str = CHANGE_MARKER_PATH):
+        self.path = path
+        self._mtime: Optional[float] = None
+        self._history_id: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def read(self) -> Optional[str]:
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return None
+        if mtime != self._mtime:
+            try:
+                with open(self.path) as f:
+                    self._history_id = str(json.load(f)["historyId"])
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning("Unreadable history marker %s: %s", self.path, e)
+                return self._history_id
+            self._mtime = mtime
+        return self._history_id
+
+    def record(self, history_id: str) -> None:
+        with self._lock:
+            current = self.read()
+            if current is not None and int(current) >= int(history_id):
+                return
+            directory = os.path.dirname(self.path) or "."
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".history-")
+            with os.fdopen(fd, "w") as f:
+                json.dump({"historyId": str(history_id)}, f)
+            os.replace(tmp_path, self.path)
+
+# ---------------- Notification sources ----------------
+class NotificationSource:
+    """Where the change feed hears about mailbox changes. latest() is consulted every `interval` seconds."""
+    interval = CHANGE_CHECK_SECONDS
+
+    def start(self, creds, wake: Callable[[], None]) -> None:
+        """Called when the feed starts; `wake` makes it consult latest() right away."""
+
+    def latest(self, creds) -> Optional[str]:
+        """The newest historyId this source knows of, or None."""
+        raise NotImplementedError
+
+class PubSubSource(NotificationSource):
+    """
+    Gmail watch notifications from a Cloud Pub/Sub push subscription to
+    POST /api/email/notifications, which records them in the history marker.
+    Reading the marker is free; the only upstream call is renewing the watch.
+    """
+    def __init__(self, topic: str, marker: HistoryMarker):
+        self.topic = topic
+        self.marker = marker
+        self._watch_expires = 0.0
+
+    def start(self, creds, wake: Callable[[], None]) -> None:
+        self._renew_if_due(creds)
+
+    def latest(self, creds) -> Optional[str]:
+        self._renew_if_due(creds)
+        return self.marker.read()
+
+    def _renew_if_due(self, creds) -> None:
+        if time.time() < self._watch_expires - WATCH_RENEW_SECONDS:
+            return
+        response = run_async(get_gmail_client().watch(creds, self.topic))
+        self._watch_expires = int(response["expiration"]) / 1000
+        self.marker.record(str(response["historyId"]))
+        logger.info("Gmail watch renewed", extra={"fields": {
+            "topic": self.topic, "expires_in": round(self._watch_expires - time.time()),
+        }})
+
+class PollingSource(NotificationSource):
+    """Incremental sync loop without Pub/Sub: reads the profile historyId every `interval` seconds."""
+    interval = CHANGE_POLL_SECONDS
+
+    def latest(self, creds) -> Optional[str]:
+        return run_async(mailbox_version.current(creds))
+
+class LocalSource(NotificationSource):
+    """Stand-in for tests and GMAIL_BACKEND=fake: the in-process fake mailbox announces its own changes."""
+    def __init__(self):
+        self._mailbox = None
+        self._wake: Optional[Callable[[], None]] = None
+
+    def start(self, creds, wake: Callable[[], None]) -> None:
+        self._wake = wake
+
+    def latest(self, creds) -> Optional[str]:
+        from .fakes import get_fake_gmail
+
+        mailbox = get_fake_gmail().mailbox
+        if mailbox is not self._mailbox:
+            # Benchmarks swap the mailbox out
+            mailbox.listeners.append(self._wake)
+            self._mailbox = mailbox
+        return str(mailbox.history_id)
+
+def make_source(name: str = CHANGE_SOURCE) -> NotificationSource:
+    if name == "pubsub":
+        if not GMAIL_PUBSUB_TOPIC:
+            raise ValueError("CHANGE_SOURCE=pubsub needs GMAIL_PUBSUB_TOPIC")
+        return PubSubSource(GMAIL_PUBSUB_TOPIC, history_marker)
+    if name == "poll":
+        return PollingSource()
+    if name == "local":
+        return LocalSource()
+    raise ValueError(f"Unknown CHANGE_SOURCE: {name}")
+
+def parse_push_message(body: Optional[Dict]) -> str:
+    """historyId from a Pub/Sub push request body. Raises ValueError if it has none."""
+    try:
+        data = json.loads(base64.b64decode(body["message"]["data"]))
+        return str(int(data["historyId"]))
+    except (TypeError, KeyError, ValueError) as e:
+        raise ValueError(f"Malformed Pub/Sub message: {e}")
+
+# ---------------- Change feed ----------------
+def format_event(event: Dict) -> str:
+    """One server-sent event."""
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
+def _parse_history_id(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+class ChangeFeed:
+    """
+    Unread-list deltas pushed to open dashboard streams.
+    While a stream is open (and CHANGE_LINGER_SECONDS after the last one closes)
+    a background thread asks the notification source for the newest historyId.
+    When it has moved, users.history.list is turned into added/read/removed
+    events. Recent events are kept so a stream reconnecting with Last-Event-ID
+    misses nothing. With no streams open the feed stops and calls nothing upstream.
+    """
+    def __init__(self, source: NotificationSource, backlog: int = CHANGE_BACKLOG,
+                 max_streams: int = CHANGE_MAX_STREAMS):
+        self.source = source
+        self.max_streams = max_streams
+        self._events: Deque[Tuple[int, Dict]] = deque(maxlen=backlog)
+        # Every event after this historyId is still in _events
+        self._oldest = 0
+        # Last synced historyId; None while the feed is stopped
+        self._history_id: Optional[int] = None
+        self._pending = False
+        self._streams: List[queue.Queue] = []
+        self._idle_since = 0.0
+        self._retry_at = 0.0
+        self._running = False
+        self._pid: Optional[int] = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def stream_count(self) -> int:
+        return len(self._streams) if self._pid == os.getpid() else 0
+
+    def subscribe(self, creds, last_event_id: Optional[str] = None) -> Optional[queue.Queue]:
+        """
+        Open a stream, resuming after `last_event_id` when given. Returns None
+        when this worker already serves max_streams. An id this feed cannot
+        resume from (older than its backlog, or newer than the mailbox) gets
+        "resync".
+        """
+        since = _parse_history_id(last_event_id)
+        latest: Optional[int] = None
+        while True:
+            with self._lock:
+                if self._pid != os.getpid():
+                    # Forked: the streams and the thread belong to the parent
+                    self._streams, self._running, self._history_id = [], False, None
+                    self._pid = os.getpid()
+                if len(self._streams) >= self.max_streams:
+                    return None
+                if self._history_id is not None or latest is not None:
+                    if self._history_id is None:
+                        self._start(latest, since)
+                    stream: queue.Queue = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+                    self._replay(stream, since)
+                    self._streams.append(stream)
+                    return stream
+            # The feed is stopped. Starting it calls Gmail (watch, getProfile), which
+            # must not hold the lock that other subscribers and notify() wait on.
+            latest = self._latest(creds)
+
+    def _replay(self, stream: queue.Queue, since: Optional[int]) -> None:
+        if since is None or since == self._history_id:
+            stream.put_nowait(self._event("ready"))
+            return
+        replay = [event for history_id, event in self._events if history_id > since]
+        if not self._oldest <= since < self._history_id or len(replay) >= STREAM_QUEUE_SIZE:
+            stream.put_nowait(self._event("resync"))
+            return
+        for event in replay:
+            stream.put_nowait(event)
+
+    def unsubscribe(self, stream: queue.Queue) -> None:
+        with self._lock:
+            if stream in self._streams:
+                self._streams.remove(stream)
+            if not self._streams:
+                self._idle_since = time.monotonic()
+
+    def events(self, stream: queue.Queue) -> Iterator[str]:
+        """Server-sent event text for one stream, until it times out or the worker drains."""
+        try:
+            yield f"retry: {int(CHANGE_RETRY_SECONDS * 1000)}\n\n"
+            ends = time.monotonic() + CHANGE_STREAM_MAX_SECONDS
+            keepalive_at = time.monotonic() + CHANGE_KEEPALIVE_SECONDS
+            while time.monotonic() < ends and not inflight.draining:
+                try:
+                    event = stream.get(timeout=1.0)
+                except queue.Empty:
+                    if time.monotonic() >= keepalive_at:
+                        keepalive_at = time.monotonic() + CHANGE_KEEPALIVE_SECONDS
+                        yield ": keepalive\n\n"
+                    continue
+                yield format_event(event)
+        finally:
+            self.unsubscribe(stream)
+
+    def notify(self, history_id: str) -> None:
+        """A change notification arrived in this worker (e.g. a Pub/Sub push)."""
+        history_marker.record(history_id)
+        mailbox_version.observe(history_id)
+        self._wake.set()
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    # -- feed thread --
+    def _latest(self, creds) -> int:
+        """Start the notification source and read the mailbox's newest historyId (upstream calls)."""
+        self.source.start(creds, self._wake.set)
+        return int(self.source.latest(creds) or run_async(mailbox_version.current(creds)))
+
+    def _start(self, latest: int, since: Optional[int]) -> None:
+        if since is not None and 0 < since < latest:
+            # Catch up from where the reconnecting client left off
+            self._history_id, self._pending = since, True
+        else:
+            # No id, or one the mailbox has not reached (which _replay answers with
+            # "resync"): a client-supplied id never moves the shared feed ahead
+            self._history_id, self._pending = latest, False
+        self._oldest = self._history_id
+        self._events.clear()
+        self._retry_at = 0.0
+        if not self._running:
+            self._running = True
+            threading.Thread(target=self._run, name="change-feed", daemon=True).start()
+        if self._pending:
+            self._wake.set()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.source.interval)
+            self._wake.clear()
+            with self._lock:
+                if not self._streams and time.monotonic() - self._idle_since > CHANGE_LINGER_SECONDS:
+                    self._running, self._history_id = False, None
+                    self._events.clear()
+                    return
+            if time.monotonic() < self._retry_at or inflight.draining:
+                continue
+            try:
+                creds = credential_store.credentials()
+                if creds is None:
+                    continue
+                latest = self.source.latest(creds)
+                if self._pending or (latest is not None and int(latest) > self._history_id):
+                    self._sync(creds)
+                self._retry_at = 0.0
+            except Exception as e:
+                logger.warning("Change feed sync failed: %s", e)
+                self._retry_at = time.monotonic() + CHANGE_RETRY_SECONDS
+
+    def _sync(self, creds) -> None:
+        import httpx
+        from .email_assistant import get_unread_changes_async
+
+        try:
+            changes, history_id = run_async(get_unread_changes_async(creds, str(self._history_id)))
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code != 404:
+                raise
+            # Too far behind for history.list; clients reload the list instead
+            mailbox_version.invalidate()
+            history_id = run_async(mailbox_version.current(creds))
+            with self._lock:
+                self._history_id, self._pending = int(history_id), False
+                self._oldest = self._history_id
+                self._events.clear()
+                self._broadcast(self._event("resync"))
+            return
+        mailbox_version.observe(history_id)
+        with self._lock:
+            self._history_id, self._pending = int(history_id), False
+            if changes:
+                event = self._event("change", changes=changes)
+                if len(self._events) == self._events.maxlen:
+                    self._oldest = self._events[0][0]
+                self._events.append((self._history_id, event))
+                self._broadcast(event)
+        if changes:
+            logger.info("Unread list changed", extra={"fields": {
+                "history_id": history_id, "changes": len(changes), "streams": len(self._streams),
+            }})
+
+    def _event(self, name: str, **data) -> Dict:
+        return {"event": name, "id": str(self._history_id), "data": dict(data, historyId=str(self._history_id))}
+
+    def _broadcast(self, event: Dict) -> None:
+        for stream in self._streams:
+            try:
+                stream.put_nowait(event)
+            except queue.Full:
+                # A stalled client; it reloads the list once it catches up
+                try:
+                    while True:
+                        stream.get_nowait()
+                except queue.Empty:
+                    pass
+                stream.put_nowait(self._event("resync"))
+
+history_marker = HistoryMarker()
+change_feed = ChangeFeed(make_source())
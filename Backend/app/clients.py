@@ -0,0 +1,69 @@
+import os
+import threading
+
+from .config import GEMINI_BACKEND, GMAIL_BACKEND
+from .resilience import GMAIL_TIMEOUT_SECONDS, guarded_request_class, timeout_for
+
+# Heavy client libraries (google.generativeai, googleapiclient.discovery) are
+# imported on first use instead of at app import, so workers boot quickly and
+# a missing key only fails the requests that need it.
+_genai = None
+_genai_lock = threading.Lock()
+
+def get_genai():
+    """Return the google.generativeai module, configured with GEMINI_API_KEY."""
+    global _genai
+    if _genai is None:
+        with _genai_lock:
+            if _genai is None and GEMINI_BACKEND == "fake":
+                from .fakes import fake_genai
+                _genai = fake_genai()
+            if _genai is None:
+                api_key = os.getenv("GEMINI_API_KEY")
+                if not api_key:
+                    raise ValueError("GEMINI_API_KEY environment variable is not set")
+                import google.generativeai as genai
+                genai.configure(api_key=api_key)
+                _genai = genai
+    return _genai
+
+# googleapiclient services are not thread-safe (httplib2 is not), so each
+# thread keeps its own service for the credentials it last used
+_gmail_services = threading.local()
+
+def _set_http_timeout(http, timeout) -> None:
+    """Apply `timeout` to an httplib2.Http and to its open keep-alive connections."""
+    http.timeout = timeout
+    for conn in getattr(http, "connections", {}).values():
+        conn.timeout = timeout
+        if getattr(conn, "sock", None) is not None:
+            conn.sock.settimeout(timeout)
+
+def build_gmail_service(creds):
+    """
+    Return a googleapiclient Gmail service for the given credentials, reused
+    by the calling thread for as long as it keeps using the same credentials.
+    Its socket timeout is capped by the current request deadline, and every
+    call goes through the Gmail circuit breaker.
+    """
+    timeout = timeout_for(GMAIL_TIMEOUT_SECONDS)
+    cached = getattr(_gmail_services, "entry", None)
+    if cached is not None and cached[0] is creds:
+        _, service, http = cached
+        _set_http_timeout(http, timeout)
+        return service
+
+    from googleapiclient.discovery import build
+
+    if GMAIL_BACKEND == "fake":
+        from .fakes import FakeGmailHttp
+        http = FakeGmailHttp(timeout=timeout)
+        authorized = http
+    else:
+        import google_auth_httplib2
+        import httplib2
+        http = httplib2.Http(timeout=timeout)
+        authorized = google_auth_httplib2.AuthorizedHttp(creds, http=http)
+    service = build("gmail", "v1", http=authorized, requestBuilder=guarded_request_class(), cache_discovery=False)
+    _gmail_services.entry = (creds, service, http)
+    return service
@@ -1,6 +1,5 @@
 import os
 from dotenv import load_dotenv
-from supabase import create_client, Client
 
 load_dotenv()
 
@@ -19,8 +18,9 @@ GMAIL_SCOPES = [
 # Gemini API configuration
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
-# Initialize Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# "google" for the real APIs, "fake" for the offline stand-ins in fakes.py
+GMAIL_BACKEND = os.getenv("GMAIL_BACKEND", "google").lower()
+GEMINI_BACKEND = os.getenv("GEMINI_BACKEND", "google").lower()
 
 # Database table names
 TABLES = {
@@ -0,0 +1,232 @@
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional
+
+from .config import GMAIL_BACKEND
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATH = os.getenv("GMAIL_TOKEN_PATH", os.path.join(os.path.dirname(__file__), "token.json"))
+# Refresh the access token this long before it expires
+TOKEN_REFRESH_AHEAD_SECONDS = float(os.getenv("TOKEN_REFRESH_AHEAD_SECONDS", "300"))
+# How often the background thread looks at token.json and the expiry
+TOKEN_CHECK_SECONDS = float(os.getenv("TOKEN_CHECK_SECONDS", "5"))
+TOKEN_RETRY_SECONDS = float(os.getenv("TOKEN_RETRY_SECONDS", "30"))
+
+AUTHENTICATED = "authenticated"
+REFRESHING = "refreshing"          # expired or about to, with a refresh token; refresh pending
+NO_TOKEN = "no_token"
+INVALID = "invalid"                # expired and cannot be refreshed
+REFRESH_FAILED = "refresh_failed"
+
+class AuthState:
+    __slots__ = ("status", "expires_at", "error")
+
+    def __init__(self, status: str, expires_at: Optional[float] = None, error: Optional[str] = None):
+        self.status = status
+        self.expires_at = expires_at    # epoch seconds, None when unknown
+        self.error = error
+
+    @property
+    def authenticated(self) -> bool:
+        return self.status in (AUTHENTICATED, REFRESHING)
+
+    def seconds_left(self) -> Optional[float]:
+        return None if self.expires_at is None else self.expires_at - time.time()
+
+def _expiry_epoch(creds) -> Optional[float]:
+    expiry = getattr(creds, "expiry", None)
+    if expiry is None:
+        return None
+    # google-auth keeps expiry as a naive UTC datetime
+    return (expiry - datetime(1970, 1, 1)).total_seconds()
+
+class CredentialStore:
+    """
+    Gmail OAuth credentials held in memory, with their state precomputed.
+    A background thread reloads token.json when it changes and refreshes the
+    access token ahead of expiry, so readers never touch the file or block on
+    Google's token endpoint. Across worker processes only the one holding the
+    flock on token.json.lock refreshes; the others pick up the token it
+    writes when token.json's mtime changes.
+    """
+    def __init__(self, path: str = TOKEN_PATH, refresh_ahead: float = TOKEN_REFRESH_AHEAD_SECONDS,
+                 check_interval: float = TOKEN_CHECK_SECONDS):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.refresh_ahead = refresh_ahead
+        self.check_interval = check_interval
+        self.refreshes = 0
+        self._creds = None
+        self._state = AuthState(NO_TOKEN)
+        self._mtime: Optional[int] = None
+        self._retry_at = 0.0
+        self._pid: Optional[int] = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+
+    # -- readers (no I/O) --
+    def state(self) -> AuthState:
+        self._ensure_started()
+        state = self._state
+        if state.status == AUTHENTICATED and state.expires_at is not None and state.expires_at <= time.time():
+            # Expired since the refresher last looked
+            creds = self._creds
+            return AuthState(REFRESHING if creds is not None and creds.refresh_token else INVALID,
+                             state.expires_at)
+        return state
+
+    def credentials(self):
+        """Current credentials, or None. Valid unless a refresh is pending or failed."""
+        self._ensure_started()
+        return self._creds
+
+    # -- writers --
+    def save(self, creds) -> None:
+        """Store new credentials (e.g. after the OAuth callback) and write token.json."""
+        self._ensure_started()
+        with self._lock:
+            self._write(creds)
+            self._set(creds)
+
+    def _ensure_started(self) -> None:
+        # Loaded on first use, and again in each forked worker
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if GMAIL_BACKEND == "fake":
+                from .fakes import FakeCredentials
+                self._creds, self._state = FakeCredentials(), AuthState(AUTHENTICATED)
+            else:
+                self._load()
+                self._wake.set()
+                threading.Thread(target=self._run, name="token-refresher", daemon=True).start()
+            self._pid = os.getpid()
+
+    def _load(self) -> None:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            self._mtime, self._creds, self._state = None, None, AuthState(NO_TOKEN)
+            return
+        if mtime == self._mtime:
+            return
+        from google.oauth2.credentials import Credentials
+        try:
+            creds = Credentials.from_authorized_user_file(self.path)
+        except (ValueError, OSError) as e:
+            logger.warning("Unreadable token file %s: %s", self.path, e)
+            self._mtime, self._creds, self._state = mtime, None, AuthState(INVALID, error=str(e))
+            return
+        self._mtime = mtime
+        self._set(creds)
+
+    def _set(self, creds, error: Optional[str] = None) -> None:
+        expires_at = _expiry_epoch(creds)
+        if creds.valid and (error or not creds.refresh_token or not self._due(expires_at, creds)):
+            # A failed refresh leaves the old token usable until it expires
+            state = AuthState(AUTHENTICATED, expires_at, error)
+        elif not creds.refresh_token:
+            state = AuthState(INVALID, expires_at)
+        elif error:
+            state = AuthState(REFRESH_FAILED, expires_at, error)
+        else:
+            state = AuthState(REFRESHING, expires_at)
+        self._creds, self._state = creds, state
+
+    def _due(self, expires_at: Optional[float], creds) -> bool:
+        if expires_at is None:
+            # Tokens saved without an expiry: refresh once to learn it
+            return bool(creds.refresh_token) and self.refreshes == 0 and self._retry_at == 0.0
+        return expires_at - time.time() <= self.refresh_ahead
+
+    def _write(self, creds) -> None:
+        directory = os.path.dirname(self.path) or "."
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".token-")
+        with os.fdopen(fd, "w") as f:
+            f.write(creds.to_json())
+        os.replace(tmp_path, self.path)
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+    def _needs_refresh(self, creds) -> bool:
+        return creds is not None and bool(creds.refresh_token) and (
+            not creds.valid or self._due(_expiry_epoch(creds), creds))
+
+    @contextmanager
+    def _refresh_lease(self):
+        """Yield True while this process holds the cross-worker refresh lock, False if another does."""
+        with open(self.lock_path, "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _refresh(self) -> None:
+        with self._refresh_lease() as leader:
+            if not leader:
+                # Another worker is refreshing; _load picks up the token it writes
+                return
+            with self._lock:
+                # It may have finished just before we took the lease
+                self._load()
+            if self._needs_refresh(self._creds):
+                self._refresh_locked()
+
+    def _refresh_locked(self) -> None:
+        from google.auth.transport.requests import Request
+        from google.oauth2.credentials import Credentials
+
+        current = self._creds
+        # Refresh a copy so readers never see a half-updated token
+        fresh = Credentials.from_authorized_user_info(json.loads(current.to_json()))
+        try:
+            fresh.refresh(Request())
+        except Exception as e:
+            logger.warning("Background token refresh failed: %s", e)
+            self._retry_at = time.monotonic() + TOKEN_RETRY_SECONDS
+            with self._lock:
+                if self._creds is current:
+                    self._set(current, error=str(e))
+            return
+        self.refreshes += 1
+        self._retry_at = 0.0
+        with self._lock:
+            self._write(fresh)
+            self._set(fresh)
+        logger.info("Refreshed Gmail access token",
+                    extra={"fields": {"expires_in": round(self._state.seconds_left() or 0)}})
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.check_interval)
+            self._wake.clear()
+            try:
+                with self._lock:
+                    self._load()
+                    if self._creds is not None and self._state.status != REFRESH_FAILED:
+                        # Re-evaluate against the clock
+                        self._set(self._creds)
+                if time.monotonic() >= self._retry_at and self._needs_refresh(self._creds):
+                    self._refresh()
+            except Exception:
+                logger.exception("Token refresher error")
+
+    def wake(self) -> None:
+        """Ask the refresher to check now instead of at its next interval."""
+        self._wake.set()
+
+credential_store = CredentialStore()
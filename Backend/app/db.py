@@ -1,7 +1,24 @@
 from typing import List, Optional
 from datetime import datetime
-from .config import supabase, TABLES
+from .config import TABLES
 from .models import User, EmailTemplate, EmailHistory, UserSettings
+from .aio import get_async_supabase, run_on_io_loop
+from .resilience import check_deadline, supabase_breaker
+from . import tracing
+
+async def _execute(build_query):
+    """Build a query against the async Supabase client and run it on the I/O loop."""
+    async def execute():
+        client = await get_async_supabase()
+        query = build_query(client)
+        request = getattr(query, 'request', None)
+        if request is not None:
+            tracing.set_attribute('db.method', request.http_method)
+            tracing.set_attribute('db.table', str(request.path).rsplit('/', 1)[-1])
+        return await query.execute()
+    check_deadline("Supabase query")
+    with tracing.span("supabase"):
+        return await supabase_breaker.call_async(lambda: run_on_io_loop(execute()))
 
 class DatabaseService:
     @staticmethod
@@ -11,12 +28,12 @@ class DatabaseService:
             'name': name,
             'created_at': datetime.utcnow().isoformat()
         }
-        result = supabase.table(TABLES['users']).insert(data).execute()
+        result = await _execute(lambda db: db.table(TABLES['users']).insert(data))
         return User.from_dict(result.data[0])
 
     @staticmethod
     async def get_user(user_id: str) -> Optional[User]:
-        result = supabase.table(TABLES['users']).select('*').eq('id', user_id).execute()
+        result = await _execute(lambda db: db.table(TABLES['users']).select('*').eq('id', user_id))
         if result.data:
             return User.from_dict(result.data[0])
         return None
@@ -29,12 +46,12 @@ class DatabaseService:
             'content': content,
             'created_at': datetime.utcnow().isoformat()
         }
-        result = supabase.table(TABLES['email_templates']).insert(data).execute()
+        result = await _execute(lambda db: db.table(TABLES['email_templates']).insert(data))
         return EmailTemplate.from_dict(result.data[0])
 
     @staticmethod
     async def get_user_templates(user_id: str) -> List[EmailTemplate]:
-        result = supabase.table(TABLES['email_templates']).select('*').eq('user_id', user_id).execute()
+        result = await _execute(lambda db: db.table(TABLES['email_templates']).select('*').eq('user_id', user_id))
         return [EmailTemplate.from_dict(template) for template in result.data]
 
     @staticmethod
@@ -48,17 +65,17 @@ class DatabaseService:
             'recipient': recipient,
             'sent_at': datetime.utcnow().isoformat()
         }
-        result = supabase.table(TABLES['email_history']).insert(data).execute()
+        result = await _execute(lambda db: db.table(TABLES['email_history']).insert(data))
         return EmailHistory.from_dict(result.data[0])
 
     @staticmethod
     async def get_user_email_history(user_id: str) -> List[EmailHistory]:
-        result = supabase.table(TABLES['email_history']).select('*').eq('user_id', user_id).execute()
+        result = await _execute(lambda db: db.table(TABLES['email_history']).select('*').eq('user_id', user_id))
         return [EmailHistory.from_dict(history) for history in result.data]
 
     @staticmethod
     async def get_user_settings(user_id: str) -> Optional[UserSettings]:
-        result = supabase.table(TABLES['user_settings']).select('*').eq('user_id', user_id).execute()
+        result = await _execute(lambda db: db.table(TABLES['user_settings']).select('*').eq('user_id', user_id))
         if result.data:
             return UserSettings.from_dict(result.data[0])
         return None
@@ -69,7 +86,7 @@ class DatabaseService:
             'user_id': user_id,
             **settings
         }
-        result = supabase.table(TABLES['user_settings']).upsert(data).execute()
+        result = await _execute(lambda db: db.table(TABLES['user_settings']).upsert(data))
         return UserSettings.from_dict(result.data[0])
 
     @staticmethod
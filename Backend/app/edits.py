@@ -0,0 +1,223 @@
+import json
+import logging
+import re
+from typing import Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+GREETING = re.compile(r'^(Dear|Hello|Hi|Hey)\s+[^,\n]+,', re.IGNORECASE | re.MULTILINE)
+CLOSING = re.compile(
+    r'^(Best regards|Kind regards|Warm regards|Regards|Sincerely|Best wishes|Best|Thanks|'
+    r'Thank you|Many thanks|Cheers|All the best),?[ \t]*$',
+    re.IGNORECASE | re.MULTILINE
+)
+
+# Word swaps used for tone changes, in the informal -> formal direction
+FORMAL_SWAPS = [
+    (r"\bThanks\b", "Thank you"),
+    (r"\bcan't\b", "cannot"),
+    (r"\bwon't\b", "will not"),
+    (r"\bdon't\b", "do not"),
+    (r"\bdoesn't\b", "does not"),
+    (r"\bisn't\b", "is not"),
+    (r"\bI'm\b", "I am"),
+    (r"\bI'll\b", "I will"),
+    (r"\bI've\b", "I have"),
+    (r"\bI'd\b", "I would"),
+    (r"\bit's\b", "it is"),
+    (r"\blet's\b", "let us"),
+    (r"\bget back to you\b", "respond to you"),
+    (r"\basap\b", "as soon as possible"),
+]
+INFORMAL_SWAPS = [
+    (r"\bThank you\b", "Thanks"),
+    (r"\bcannot\b", "can't"),
+    (r"\bwill not\b", "won't"),
+    (r"\bdo not\b", "don't"),
+    (r"\bI am\b", "I'm"),
+    (r"\bI will\b", "I'll"),
+]
+# Salutation and sign-off swaps, applied to the greeting and closing lines only
+# ("Hi again" in the body stays as it is)
+FORMAL_LINE_SWAPS = [(GREETING, r"^(?:Hi|Hey)\b", "Dear"), (CLOSING, r"^Cheers\b", "Kind regards")]
+INFORMAL_LINE_SWAPS = [
+    (GREETING, r"^Dear\b", "Hi"),
+    (CLOSING, r"^(?:Kind|Best) regards\b", "Best"),
+    (CLOSING, r"^Sincerely\b", "Cheers"),
+]
+
+# Phrases that add length without content
+FILLER = [
+    r"\bI hope this email finds you well\.?\s*",
+    r"\bI hope you are doing well\.?\s*",
+    r"\bPlease do not hesitate to (contact|reach out to) me if you have any (further )?questions\.?\s*",
+    r"\bPlease let me know if you have any (further )?questions\.?\s*",
+    r"\bThank you for your (patience|understanding)\.?\s*",
+]
+
+# Names must be capitalized, so the patterns using NAME are case-sensitive and
+# wrap their command words in (?i:...) instead
+NAME = r"([A-Z][\w'-]*(?:[ \t]+[A-Z][\w'-]*)?)"
+
+def _set_greeting_name(draft: str, name: str) -> str:
+    if GREETING.search(draft):
+        return GREETING.sub(lambda m: f"{m.group(1)} {name},", draft, count=1)
+    return f"Dear {name},\n\n{draft}"
+
+def _edit_name(draft: str, clause: str) -> Optional[str]:
+    patterns = [
+        r"(?i:\bdear\s+)" + NAME + r"\b.*(?i:\bnot\b)",              # "Dear Sarah, not Sara"
+        r"(?i:\b(?:address|call)\s+(?:it|him|her|them|the email)\s+(?:to\s+|as\s+)?)" + NAME,
+        r"(?i:\bchange\s+(?:the\s+)?(?:recipient(?:'s)?\s+)?name\s+to\s+)" + NAME,
+        r"(?i:\bgreet\s+)" + NAME,
+        r"(?i:\buse\s+)" + NAME + r"(?i:\s+instead\s+of\b)",
+    ]
+    for pattern in patterns:
+        match = re.search(pattern, clause)
+        if match:
+            return _set_greeting_name(draft, match.group(1).strip())
+    return None
+
+def _edit_closing(draft: str, clause: str) -> Optional[str]:
+    match = re.search(
+        r"\b(?:sign\s*off|end|close)\s+with\s+[\"']?([A-Za-z ]+?)[\"']?\s*$"
+        r"|\b(?:change|replace)\s+the\s+(?:sign[- ]?off|closing)\s+(?:to|with)\s+[\"']?([A-Za-z ]+?)[\"']?\s*$",
+        clause.strip(), re.IGNORECASE
+    )
+    if not match:
+        return None
+    closing = (match.group(1) or match.group(2)).strip().rstrip(',')
+    closing = closing[0].upper() + closing[1:]
+    if CLOSING.search(draft):
+        return CLOSING.sub(f"{closing},", draft, count=1)
+    return None
+
+def _edit_tone(draft: str, clause: str) -> Optional[str]:
+    lowered = clause.lower()
+    if re.search(r"\b(more formal|more professional|less casual)\b", lowered):
+        swaps, line_swaps = FORMAL_SWAPS, FORMAL_LINE_SWAPS
+    elif re.search(r"\b(less formal|more casual|more friendly|friendlier|warmer|more relaxed)\b", lowered):
+        swaps, line_swaps = INFORMAL_SWAPS, INFORMAL_LINE_SWAPS
+    else:
+        return None
+    for line, pattern, replacement in line_swaps:
+        match = line.search(draft)
+        if match:
+            swapped = re.sub(pattern, replacement, match.group(0), flags=re.IGNORECASE)
+            draft = draft[:match.start()] + swapped + draft[match.end():]
+    for pattern, replacement in swaps:
+        draft = re.sub(pattern, replacement, draft)
+    return draft
+
+def _sentences(paragraph: str) -> List[str]:
+    return [s for s in re.split(r'(?<=[.!?])\s+', paragraph.strip()) if s]
+
+def _word_count(text: str) -> int:
+    return len(text.split())
+
+def _edit_length(draft: str, clause: str) -> Optional[str]:
+    lowered = clause.lower()
+    limit_match = re.search(r"\b(?:under|below|less than|at most|max(?:imum)?|within)\s+(\d+)\s+words\b", lowered)
+    if not limit_match and not re.search(r"\b(shorter|more concise|concise|brief|briefer|trim|cut it down)\b", lowered):
+        return None
+
+    paragraphs = [p for p in draft.split('\n\n') if p.strip()]
+    # Greeting and sign-off are kept as they are; only body paragraphs shrink
+    head = paragraphs[:1] if paragraphs and GREETING.match(paragraphs[0].strip()) else []
+    tail = paragraphs[-1:] if len(paragraphs) > len(head) and CLOSING.search(paragraphs[-1]) else []
+    body = paragraphs[len(head):len(paragraphs) - len(tail)]
+
+    original = "\n\n".join(body)
+    body_text = original
+    for pattern in FILLER:
+        body_text = re.sub(pattern, "", body_text, flags=re.IGNORECASE)
+    body = [p.strip() for p in body_text.split('\n\n') if p.strip()]
+
+    if not limit_match:
+        # Without a word limit only filler can go safely; a real rewrite is the LLM's job
+        if body_text == original:
+            return None
+        return "\n\n".join(head + body + tail)
+
+    # Drop sentences from the end of the longest paragraphs until it fits the limit
+    budget = int(limit_match.group(1)) - _word_count("\n\n".join(head + tail))
+    body = [_sentences(p) for p in body]
+    while sum(_word_count(" ".join(p)) for p in body) > max(budget, 0):
+        longest = max(body, key=len)
+        if len(longest) <= 1:
+            # Cutting further means rewriting sentences, which is the LLM's job
+            return None
+        longest.pop()
+    body = [" ".join(p) for p in body if p]
+    return "\n\n".join(head + body + tail)
+
+LOCAL_EDITS: List[Callable[[str, str], Optional[str]]] = [_edit_name, _edit_closing, _edit_tone, _edit_length]
+
+def split_instruction(instruction: str) -> List[str]:
+    """Split "make it shorter and sign off with Cheers" into separate edits."""
+    clauses = re.split(
+        r"[;\n]|\.\s+|,?\s+and\s+(?=(?:make|change|sign|end|close|use|call|address|greet|trim|shorten)\b)",
+        instruction.strip().rstrip('.'),
+        flags=re.IGNORECASE
+    )
+    return [c.strip() for c in clauses if c and c.strip()]
+
+def apply_local_edits(draft: str, instruction: str) -> Optional[str]:
+    """
+    Apply an edit instruction without the LLM when every part of it is a
+    name change, sign-off change, tone shift or length trim.
+    Returns the edited draft, or None when any part needs the LLM.
+    """
+    clauses = split_instruction(instruction)
+    if not clauses:
+        return None
+    edited = draft
+    for clause in clauses:
+        for edit in LOCAL_EDITS:
+            result = edit(edited, clause)
+            if result is not None:
+                edited = result
+                break
+        else:
+            return None
+    return edited
+
+class RevisionError(ValueError):
+    """An LLM revision that cannot be read or applied to the draft."""
+
+def parse_revision(text: str) -> List[Tuple[str, str]]:
+    """Find/replace pairs from the LLM's JSON answer. Raises RevisionError for any other shape."""
+    # Models sometimes wrap JSON in a code fence
+    text = re.sub(r'^```(?:json)?\s*|\s*```$', '', text.strip())
+    try:
+        return [(str(e['find']), str(e['replace'])) for e in json.loads(text)]
+    except (ValueError, TypeError, KeyError) as e:
+        raise RevisionError("The model's revision could not be read; try again") from e
+
+def _find_span(draft: str, find: str) -> Optional[Tuple[int, int]]:
+    start = draft.find(find)
+    if start >= 0:
+        return start, start + len(find)
+    # Models often reflow the whitespace of the text they quote back
+    words = find.split()
+    if not words:
+        return None
+    match = re.search(r"\s+".join(re.escape(w) for w in words), draft)
+    return match.span() if match else None
+
+def apply_replacements(draft: str, replacements: List[Tuple[str, str]]) -> str:
+    """
+    Apply find/replace pairs returned by the LLM. Pairs whose `find` is not in
+    the draft are skipped; raises RevisionError when none of them applies.
+    """
+    applied = 0
+    for find, replace in replacements:
+        span = _find_span(draft, find)
+        if span is None:
+            logger.warning("Skipping edit whose target is not in the draft: %r", find[:60])
+            continue
+        draft = draft[:span[0]] + replace + draft[span[1]:]
+        applied += 1
+    if replacements and not applied:
+        raise RevisionError("The model's revision did not match the draft; try rephrasing the instruction")
+    return draft
@@ -1,20 +1,32 @@
 import os
 import sys
+import asyncio
 import base64
+import logging
 import traceback
 import re
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from email.utils import parsedate_to_datetime
 from flask import Blueprint, request, jsonify
 from dotenv import load_dotenv
 
-import google.generativeai as genai
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+from .triage import TRIAGE_HEADERS, classify_message
+from .search import search_index
+from .edits import apply_local_edits, apply_replacements, parse_revision
+from .aio import get_gmail_client
+from .clients import build_gmail_service
+from .credentials import credential_store
+from .router import model_router, DEFAULT_TIER
+from .resilience import REQUEST_DEADLINE_SECONDS, UpstreamUnavailableError, start_deadline
+from . import tracing
+from .metrics import stage
+from .lifecycle import inflight
+
+logger = logging.getLogger(__name__)
+
 # Load environment variables
 load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env'))
 
@@ -33,18 +45,23 @@ SCOPES = [
 ]
 
 # ---------------- Gemini API Setup ----------------
-# Configure Gemini API with your API key
-api_key = os.getenv("GEMINI_API_KEY")
-if not api_key:
-    raise ValueError("GEMINI_API_KEY environment variable is not set")
-genai.configure(api_key=api_key)
+# Gemini is configured on first use; see clients.get_genai
 
 def setup_authentication():
     """
     Set up Gmail API authentication and return credentials.
     """
+    # Normally answered from memory; the background refresher keeps these current
+    creds = credential_store.credentials()
+    if creds is not None and creds.valid:
+        return creds
+
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
     creds = None
-    token_path = os.path.join(os.path.dirname(__file__), "token.json")
+    token_path = credential_store.path
     credentials_path = os.path.join(os.path.dirname(__file__), "credentials.json")
     
     # Check if token exists
@@ -57,7 +74,7 @@ def setup_authentication():
             try:
                 creds.refresh(Request())
             except Exception as e:
-                print(f"Error refreshing credentials: {e}")
+                logger.warning("Error refreshing credentials: %s", e)
                 # If refresh fails, force re-authentication
                 if os.path.exists(token_path):
                     os.remove(token_path)
@@ -68,15 +85,16 @@ def setup_authentication():
             creds = flow.run_local_server(port=8080)
         
         # Save the credentials for the next run
-        with open(token_path, "w") as token:
-            token.write(creds.to_json())
+        credential_store.save(creds)
     
     return creds
 
 def get_recent_unread_messages(service, user_id="me", limit=30):
     """
-    Retrieve at most `limit` unread emails.
-    Returns a list of dictionaries containing email id, subject, snippet, and date.
+    Retrieve at most `limit` unread emails, collapsed into one entry per thread.
+    Returns a list of dictionaries containing email id, thread id, subject, snippet,
+    date, triage label and the number of unread messages in the thread. The email id is the
+    latest unread message of the thread, which is the one to reply to.
     """
     unread_messages = []
     page_token = None
@@ -97,47 +115,305 @@ def get_recent_unread_messages(service, user_id="me", limit=30):
             if not page_token:
                 break
         except HttpError as error:
-            print(f"An error occurred retrieving messages: {error}")
+            logger.warning("Error retrieving messages: %s", error)
             break
 
     detailed_messages = []
-    for msg in unread_messages:
+    search_records = []
+    for thread in group_messages_by_thread(unread_messages):
         try:
-            msg_id = msg['id']
             message_detail = service.users().messages().get(
-                userId=user_id, id=msg_id, format='full'
+                userId=user_id, id=thread['id'], format='full'
             ).execute()
-            headers = message_detail.get('payload', {}).get('headers', [])
-            subject = next((h['value'] for h in headers if h['name'].lower() == 'subject'), "No Subject")
-            from_header = next((h['value'] for h in headers if h['name'].lower() == 'from'), "Unknown Sender")
-            to_header = next((h['value'] for h in headers if h['name'].lower() == 'to'), "")
-            date = next((h['value'] for h in headers if h['name'].lower() == 'date'), None)
-            snippet = message_detail.get('snippet', "No snippet available")
-            
-            # Convert email date to timestamp
-            if date:
-                from email.utils import parsedate_to_datetime
-                try:
-                    date_obj = parsedate_to_datetime(date)
-                    date = int(date_obj.timestamp() * 1000)  # Convert to milliseconds
-                except Exception as e:
-                    print(f"Error parsing date: {e}")
-                    date = None
-            
-            detailed_messages.append({
-                'id': msg_id,
-                'subject': subject,
-                'from': from_header,
-                'to': to_header,
-                'date': date,
-                'snippet': snippet
-            })
         except HttpError as error:
-            print(f"An error occurred retrieving message details: {error}")
+            logger.warning("Error retrieving message details: %s", error)
             continue
+        detailed_messages.append(summarize_message(message_detail, thread))
+        search_records.append(dict(detailed_messages[-1], body=get_message_body(message_detail)))
+    
+    # Keep the local search index in step with what was fetched
+    update_search_index(search_records)
     
     return detailed_messages
 
+async def get_recent_unread_messages_async(creds, user_id="me", limit=30):
+    """
+    Async version of get_recent_unread_messages for the shared I/O loop.
+    Message details are fetched concurrently over the pooled Gmail client.
+    """
+    import httpx
+
+    client = get_gmail_client()
+    unread_messages = []
+    page_token = None
+
+    while len(unread_messages) < limit:
+        try:
+            response = await client.list_messages(
+                creds, user_id,
+                q='is:unread category:primary',
+                page_token=page_token,
+                max_results=limit - len(unread_messages)
+            )
+        except httpx.HTTPError as error:
+            logger.warning("Error retrieving messages: %s", error)
+            break
+        messages = response.get('messages', [])
+        if not messages:
+            break
+        unread_messages.extend(messages)
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            break
+
+    threads = group_messages_by_thread(unread_messages)
+    details = await client.get_messages(creds, [thread['id'] for thread in threads], user_id=user_id)
+
+    detailed_messages = []
+    search_records = []
+    for thread, message_detail in zip(threads, details):
+        if isinstance(message_detail, Exception):
+            logger.warning("Error retrieving message details: %s", message_detail)
+            continue
+        detailed_messages.append(summarize_message(message_detail, thread))
+        search_records.append(dict(detailed_messages[-1], body=get_message_body(message_detail)))
+
+    # SQLite writes block, so keep them off the event loop
+    await asyncio.get_running_loop().run_in_executor(
+        None, tracing.wrap(update_search_index, "search_index.update"), search_records
+    )
+    return detailed_messages
+
+# Headers the unread list entries and their triage labels are built from
+UNREAD_LIST_HEADERS = ['To', 'Date'] + TRIAGE_HEADERS
+# Body fetches scheduled by index_unread_async; held so they are not garbage collected
+_body_fetches = set()
+
+async def get_unread_page_async(creds, page_size=30, page_token=None, user_id="me"):
+    """
+    One page of unread threads for cursor pagination, newest first.
+    Pages by thread (threads.list) so a thread never shows up on two pages; each
+    thread is loaded in metadata format to find its unread messages, the latest
+    of which is the reply target. Returns (messages, next Gmail page token or None).
+    """
+    client = get_gmail_client()
+    listed = await client.list_threads(
+        creds, user_id, q='is:unread category:primary', page_token=page_token, max_results=page_size
+    )
+    thread_ids = [thread['id'] for thread in listed.get('threads', [])]
+    details = await client.get_threads(creds, thread_ids, user_id=user_id, metadata_headers=UNREAD_LIST_HEADERS)
+
+    detailed_messages = []
+    for thread_detail in details:
+        if isinstance(thread_detail, Exception):
+            logger.warning("Error retrieving thread details: %s", thread_detail)
+            continue
+        summary = summarize_unread_thread(thread_detail)
+        if summary is None:
+            # Read since it was listed
+            continue
+        detailed_messages.append(summary[0])
+
+    await index_unread_async(creds, detailed_messages, user_id=user_id)
+    return detailed_messages, listed.get('nextPageToken')
+
+async def index_unread_async(creds, entries, read_thread_ids=(), removed_thread_ids=(), user_id="me"):
+    """
+    Index unread list entries for search. Entries come from metadata, so the
+    bodies of messages the index does not have yet are loaded in full after
+    the response, in the background.
+    """
+    loop = asyncio.get_running_loop()
+    if entries or read_thread_ids or removed_thread_ids:
+        await loop.run_in_executor(
+            None, tracing.wrap(update_search_index, "search_index.update"),
+            entries, read_thread_ids, removed_thread_ids
+        )
+    if not entries:
+        return
+    try:
+        missing = await loop.run_in_executor(None, search_index.without_body, [e['id'] for e in entries])
+    except Exception as e:
+        logger.warning("Error reading search index: %s", e)
+        return
+    if missing:
+        task = loop.create_task(_index_bodies_async(creds, missing, user_id))
+        _body_fetches.add(task)
+        task.add_done_callback(_body_fetches.discard)
+
+async def _index_bodies_async(creds, message_ids, user_id):
+    # Outlives the request, so it gets a deadline of its own
+    start_deadline(REQUEST_DEADLINE_SECONDS)
+    try:
+        details = await get_gmail_client().get_messages(creds, message_ids, user_id=user_id)
+        bodies = {d['id']: get_message_body(d) for d in details if not isinstance(d, Exception)}
+        await asyncio.get_running_loop().run_in_executor(None, search_index.set_bodies, bodies)
+    except Exception as e:
+        logger.warning("Error indexing message bodies: %s", e)
+
+def summarize_unread_thread(thread_detail, primary_only=False):
+    """
+    Unread list entry for a thread loaded with threads.get, as
+    (summary, latest unread message), or None when nothing in it is unread.
+    """
+    # threads.get lists messages oldest first, trashed and spam ones included
+    unread = [m for m in thread_detail.get('messages', [])
+              if 'UNREAD' in m.get('labelIds', []) and not {'TRASH', 'SPAM'}.intersection(m.get('labelIds', []))][::-1]
+    if primary_only and not any('CATEGORY_PERSONAL' in m.get('labelIds', []) for m in unread):
+        return None
+    if not unread:
+        return None
+    thread = {'id': unread[0]['id'], 'threadId': thread_detail['id'], 'messageIds': [m['id'] for m in unread]}
+    return summarize_message(unread[0], thread), unread[0]
+
+# Label changes that can move a thread into or out of the unread primary list
+UNREAD_LIST_LABELS = {'UNREAD', 'INBOX', 'CATEGORY_PERSONAL', 'TRASH', 'SPAM'}
+
+async def get_unread_changes_async(creds, start_history_id, user_id="me"):
+    """
+    Changes to the unread list since `start_history_id`, from users.history.list.
+    Returns (events, latest historyId). Every thread whose unread state may have
+    changed is reloaded once and reported as {"type": "added", "message": <entry>}
+    while it has unread primary mail, or as "read" / "removed" by threadId.
+    Sent messages and unrelated label changes cost no extra calls.
+    Raises httpx.HTTPStatusError (404) when start_history_id is too old.
+    """
+    client = get_gmail_client()
+    # thread id -> "read" when UNREAD was removed, else "removed"
+    touched = {}
+    history_id = start_history_id
+    page_token = None
+    while True:
+        response = await client.list_history(creds, start_history_id, user_id, page_token=page_token)
+        for record in response.get('history', []):
+            for item in record.get('messagesAdded', []):
+                if 'UNREAD' in item['message'].get('labelIds', []):
+                    touched.setdefault(item['message']['threadId'], "removed")
+            for item in record.get('messagesDeleted', []):
+                touched.setdefault(item['message']['threadId'], "removed")
+            for key in ('labelsAdded', 'labelsRemoved'):
+                for item in record.get(key, []):
+                    if UNREAD_LIST_LABELS.intersection(item.get('labelIds', [])):
+                        touched.setdefault(item['message']['threadId'], "removed")
+                        if key == 'labelsRemoved' and 'UNREAD' in item['labelIds']:
+                            touched[item['message']['threadId']] = "read"
+        history_id = response.get('historyId', history_id)
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            break
+
+    thread_ids = list(touched)
+    details = await client.get_threads(creds, thread_ids, user_id=user_id, metadata_headers=UNREAD_LIST_HEADERS)
+
+    events = []
+    entries = []
+    # Read threads stay searchable; only threads gone from the mailbox leave the index
+    read_thread_ids = []
+    gone_thread_ids = []
+    for thread_id, thread_detail in zip(thread_ids, details):
+        if isinstance(thread_detail, Exception):
+            response = getattr(thread_detail, 'response', None)
+            if response is None or response.status_code != 404:
+                # Let the caller retry from the same historyId rather than lose the change
+                raise thread_detail
+            events.append({'type': 'removed', 'threadId': thread_id})
+            gone_thread_ids.append(thread_id)
+            continue
+        summary = summarize_unread_thread(thread_detail, primary_only=True)
+        if summary is None:
+            events.append({'type': touched[thread_id], 'threadId': thread_id})
+            messages = thread_detail.get('messages', [])
+            if all({'TRASH', 'SPAM'}.intersection(m.get('labelIds', [])) for m in messages):
+                gone_thread_ids.append(thread_id)
+            elif not any('UNREAD' in m.get('labelIds', []) for m in messages):
+                read_thread_ids.append(thread_id)
+            continue
+        events.append({'type': 'added', 'message': summary[0]})
+        entries.append(summary[0])
+
+    await index_unread_async(creds, entries, read_thread_ids, gone_thread_ids, user_id=user_id)
+    return events, str(history_id)
+
+def summarize_message(message_detail, thread):
+    """
+    Build the unread list entry for the latest message of a thread.
+    `thread` is one item from group_messages_by_thread.
+    """
+    headers = message_detail.get('payload', {}).get('headers', [])
+    subject = next((h['value'] for h in headers if h['name'].lower() == 'subject'), "No Subject")
+    from_header = next((h['value'] for h in headers if h['name'].lower() == 'from'), "Unknown Sender")
+    to_header = next((h['value'] for h in headers if h['name'].lower() == 'to'), "")
+    date = next((h['value'] for h in headers if h['name'].lower() == 'date'), None)
+    snippet = message_detail.get('snippet', "No snippet available")
+    
+    # Convert email date to timestamp
+    if date:
+        try:
+            date_obj = parsedate_to_datetime(date)
+            date = int(date_obj.timestamp() * 1000)  # Convert to milliseconds
+        except Exception as e:
+            logger.debug("Error parsing date: %s", e)
+            date = None
+    
+    return {
+        'id': thread['id'],
+        'threadId': thread['threadId'],
+        'messageCount': len(thread['messageIds']),
+        'messageIds': thread['messageIds'],
+        'subject': subject,
+        'from': from_header,
+        'to': to_header,
+        'date': date,
+        'snippet': snippet,
+        'triage': classify_message(message_detail)['label']
+    }
+
+def update_search_index(search_records, read_thread_ids=(), removed_thread_ids=()):
+    try:
+        if removed_thread_ids:
+            search_index.delete_threads(removed_thread_ids)
+        if read_thread_ids:
+            search_index.mark_threads_read(read_thread_ids)
+        search_index.upsert_many(search_records)
+    except Exception as e:
+        logger.warning("Error updating search index: %s", e)
+
+def group_messages_by_thread(messages):
+    """
+    Collapse a messages.list result by threadId, keeping list order.
+    Gmail lists messages newest first, so the first message seen for a thread is
+    its latest one and becomes the reply target.
+    """
+    threads = {}
+    for msg in messages:
+        thread_id = msg.get('threadId', msg['id'])
+        if thread_id not in threads:
+            threads[thread_id] = {'id': msg['id'], 'threadId': thread_id, 'messageIds': []}
+        threads[thread_id]['messageIds'].append(msg['id'])
+    return list(threads.values())
+
+def get_message_body(message):
+    """
+    Return the decoded text/plain body of a Gmail message in 'full' format.
+    Walks nested multipart payloads and falls back to the snippet when no
+    plain text part is found.
+    """
+    payload = message.get('payload', {})
+    parts = [payload]
+    while parts:
+        part = parts.pop(0)
+        if part.get('parts'):
+            parts[:0] = part['parts']
+            continue
+        data = part.get('body', {}).get('data')
+        if data and part.get('mimeType', 'text/plain') == 'text/plain':
+            try:
+                return base64.urlsafe_b64decode(data.encode('ASCII')).decode('utf-8')
+            except Exception as e:
+                logger.warning("Error decoding email body: %s", e)
+                break
+    return message.get('snippet', '')
+
 def select_reply_recipients(headers):
     """
     Given a list of headers from the original email, display the recipients and ask the user how to reply.
@@ -406,12 +682,15 @@ def format_email_content(content):
     # Join paragraphs with double newlines for proper spacing
     return "\n\n".join(clean_paragraphs)
 
-def create_reply_message(service, user_id, original_msg_id, reply_text, to_override=None, cc_override=None):
+def create_reply_message(service, user_id, original_msg_id, reply_text, to_override=None, cc_override=None,
+                         original_msg=None):
     """
     Create a MIME message for replying to an email that works well on mobile devices.
+    Pass `original_msg` when the caller already fetched the original message.
     """
     # Get full message details
-    original_msg = service.users().messages().get(userId=user_id, id=original_msg_id, format='full').execute()
+    if original_msg is None:
+        original_msg = service.users().messages().get(userId=user_id, id=original_msg_id, format='full').execute()
     thread_id = original_msg['threadId']
     headers = original_msg.get('payload', {}).get('headers', [])
     subject = next((h['value'] for h in headers if h['name'].lower() == 'subject'), "No Subject")
@@ -466,54 +745,27 @@ def extract_sender_info(service, email_id, user_id="me"):
         }
             
     except Exception as e:
-        print(f"Error extracting sender info: {e}")
+        logger.warning("Error extracting sender info: %s", e)
         return {"name": "there", "email": from_header, "found_method": "default"}
 
-def generate_reply(service, email_detail, gemini_context, user_context, user_name):
-    """
-    Generate a reply suggestion for a given email using the Gemini generative AI model.
-    """
-    try:
-        print("Starting generate_reply function...")
-        print(f"Email detail keys: {email_detail.keys()}")
-        
-        # Get sender information
-        print("Extracting sender information...")
-        sender_info = extract_sender_info(service, email_detail['id'])
-        print(f"Sender info: {sender_info}")
-        
-        # Create appropriate greeting
-        greeting = f"Dear {sender_info['name']},"
-        print(f"Created greeting: {greeting}")
-        
-        # Get email body from the email_detail
-        body_text = email_detail.get('body', email_detail.get('snippet', ''))
-        print(f"Email body length: {len(body_text)}")
-        
-        print("Creating prompt for Gemini...")
-        prompt = f"{gemini_context}\n\n"
-        prompt += f"Email received from: {sender_info['name']}\n"
-        prompt += f"Subject: {email_detail['subject']}\n\n"
-        prompt += f"Full email content:\n{body_text}\n\n"
-        
-        if user_context.strip():
-            prompt += f"Additional instructions: {user_context}\n\n"
-        
-        prompt += f"""
+# Static instructions are sent as system instructions, so pooled models (and
+# provider-side context caches) share them across every request
+REPLY_SYSTEM_INSTRUCTION = """You write email replies on behalf of the user.
+
 IMPORTANT FORMATTING AND CONTENT INSTRUCTIONS:
-1. Begin with: "{greeting}"
+1. Begin with the greeting line given in the request, exactly as written.
 2. Write a substantive and professional email that addresses all points from the original message.
 3. Use clear, specific language and avoid vague placeholders or instructions.
 4. DO NOT include bracketed text like [briefly mention illness] or [suggest timeframe] in your response.
 5. Write naturally as if you're a real person composing an email. Be specific and direct.
 6. If mentioning an illness, use a specific but generic description like "a severe flu" or "a medical issue".
 7. When suggesting timeframes, use concrete examples like "48 hours" or "by the end of the week".
-8. End with: "Best regards,\\n{user_name}"
+8. End with "Best regards," on its own line, followed by the sign-off name given in the request.
 9. Make sure all paragraphs are fully developed with complete information.
 10. REMOVE ANY AND ALL PLACEHOLDER TEXT in the final response.
 
 YOUR RESPONSE MUST FOLLOW THIS STRUCTURE:
-{greeting}
+<greeting line>
 
 [First paragraph: Acknowledge the original email and apologize if needed]
 
@@ -524,43 +776,119 @@ YOUR RESPONSE MUST FOLLOW THIS STRUCTURE:
 [Final paragraph: Next steps or appreciation]
 
 Best regards,
-{user_name}
+<sign-off name>
 """
+
+REVISION_SYSTEM_INSTRUCTION = """Revise the email draft in the request according to its instruction.
+Answer ONLY with a JSON array of edits, each {"find": "<exact text from the draft>", "replace": "<new text>"}.
+Keep edits as small as possible and do not repeat unchanged text.
+"""
+
+def generate_reply(service, email_detail, gemini_context, user_context, user_name, thread_summary=None,
+                   examples=None, thread_depth=1, user_tier=DEFAULT_TIER):
+    """
+    Generate a reply suggestion for a given email using the Gemini generative AI model.
+    `thread_summary` is an optional compact digest of the earlier messages in the thread.
+    `examples` are optional past replies by the user, used as few-shot style examples.
+    `thread_depth` and `user_tier` feed the model router.
+    """
+    try:
+        # Get sender information
+        with stage("sender_info"):
+            sender_info = extract_sender_info(service, email_detail['id'])
+        
+        # Create appropriate greeting
+        greeting = f"Dear {sender_info['name']},"
+        
+        # Get email body from the email_detail
+        body_text = email_detail.get('body', email_detail.get('snippet', ''))
         
-        print("Generating content with Gemini...")
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        response = model.generate_content(prompt)
+        with stage("prompt_build"):
+            prompt = f"{gemini_context}\n\n"
+            prompt += f"Email received from: {sender_info['name']}\n"
+            prompt += f"Subject: {email_detail['subject']}\n\n"
+            if thread_summary:
+                prompt += f"Earlier in this thread:\n{thread_summary}\n\n"
+            prompt += f"Full email content:\n{body_text}\n\n"
         
-        if not response or not response.text:
-            print("Error: Empty response from Gemini")
+            if user_context.strip():
+                prompt += f"Additional instructions: {user_context}\n\n"
+        
+            if examples:
+                prompt += f"Past replies written by {user_name} to similar emails. Match their tone and style:\n"
+                for example in examples:
+                    prompt += f"---\n{example}\n"
+                prompt += "---\n\n"
+        
+            prompt += f'Greeting line: "{greeting}"\n'
+            prompt += f"Sign-off name: {user_name}\n"
+        
+        with inflight.track(), stage("gemini"):
+            response_text, model_name = model_router.generate(
+                prompt, REPLY_SYSTEM_INSTRUCTION, thread_depth=thread_depth, user_tier=user_tier
+            )
+        
+        if not response_text:
+            logger.error("Empty response from Gemini")
             return "Error: Unable to generate a reply. Please try again."
             
-        generated_text = response.text.strip()
-        print(f"Generated text length: {len(generated_text)}")
+        generated_text = response_text.strip()
+        logger.debug("Generated reply", extra={"fields": {
+            "prompt_chars": len(prompt), "reply_chars": len(generated_text), "model": model_name,
+            "sender_found_method": sender_info['found_method']
+        }})
         
         # Post-processing to remove any remaining placeholders
-        print("Post-processing generated text...")
-        placeholder_patterns = [
-            r'\[.*?\]',                  # Anything in square brackets
-            r'\(e\.g\.,.*?\)',          # Anything with e.g.
-            r'\[suggest .*?\]',         # Instructions to suggest something
-            r'\[briefly .*?\]',         # Instructions to briefly mention something
-        ]
+        with stage("postprocess"):
+            placeholder_patterns = [
+                r'\[.*?\]',                  # Anything in square brackets
+                r'\(e\.g\.,.*?\)',          # Anything with e.g.
+                r'\[suggest .*?\]',         # Instructions to suggest something
+                r'\[briefly .*?\]',         # Instructions to briefly mention something
+            ]
         
-        for pattern in placeholder_patterns:
-            generated_text = re.sub(pattern, '', generated_text)
+            for pattern in placeholder_patterns:
+                generated_text = re.sub(pattern, '', generated_text)
         
-        # Clean up any double spaces created by removing placeholders
-        generated_text = re.sub(r' +', ' ', generated_text)
-        print("Post-processing complete")
+            # Clean up any double spaces created by removing placeholders
+            generated_text = re.sub(r' +', ' ', generated_text)
         
         return generated_text
+    except UpstreamUnavailableError:
+        # Open breakers and expired deadlines become fast 503/504 responses
+        raise
     except Exception as e:
-        print(f"Error in generate_reply: {str(e)}")
-        print(f"Error type: {type(e)}")
-        print(f"Error traceback: {traceback.format_exc()}")
+        logger.exception("Error in generate_reply")
         return f"Error generating reply: {str(e)}"
 
+def revise_reply(draft, instruction):
+    """
+    Ask Gemini for a small, diff-style revision of an existing draft.
+    Only the draft and the instruction are sent; the model answers with
+    find/replace pairs that are applied locally.
+    """
+    prompt = f"""Instruction: {instruction}
+
+Draft:
+{draft}
+"""
+    # Same path as reply generation: Gemini breaker, request deadline, async client
+    with inflight.track(), stage("gemini"):
+        response_text, _ = model_router.generate(prompt, REVISION_SYSTEM_INSTRUCTION)
+    return apply_replacements(draft, parse_revision(response_text))
+
+def edit_draft(draft, instruction):
+    """
+    Apply an edit instruction to a draft reply.
+    Deterministic edits (names, sign-off, tone, length) run locally; anything
+    else goes to Gemini as a small revision prompt.
+    Returns a tuple: (edited draft, "local" or "llm")
+    """
+    edited = apply_local_edits(draft, instruction)
+    if edited is not None:
+        return edited, "local"
+    return revise_reply(draft, instruction), "llm"
+
 def simplified_edit_suggestion(reply_text):
     """
     Simplified version of edit_suggestion that doesn't require user interaction.
@@ -573,7 +901,7 @@ def simplified_edit_suggestion(reply_text):
 def edit_suggestion(reply_text, service=None, email_detail=None, gemini_context=None, user_name=None):
     """
     Allow the user to iteratively edit the suggested reply until they're satisfied.
-    Can regenerate responses using Gemini if needed.
+    Instructions are applied to the current draft, locally when possible.
     """
     # First, clean up any remaining placeholders
     current_reply = process_generated_email(reply_text)
@@ -591,7 +919,7 @@ def edit_suggestion(reply_text, service=None, email_detail=None, gemini_context=
         
         print("\nHow would you like to improve it?")
         print("1. Edit the text myself")
-        print("2. Regenerate with new instructions")
+        print("2. Improve it with new instructions")
         print("3. Keep as is and proceed anyway")
         
         choice = input("Enter your choice (1, 2, or 3): ").strip()
@@ -629,59 +957,19 @@ def edit_suggestion(reply_text, service=None, email_detail=None, gemini_context=
                 print("No changes made, keeping original suggestion.")
                 
         elif choice == '2':
-            # Regenerate with new instructions
-            if service and email_detail and gemini_context and user_name:
-                new_instructions = input("\nWhat specific improvements would you like to see in the regenerated email? ").strip()
-                print("Regenerating suggestion...")
-                
-                try:
-                    # Make direct modification for recipient name change requests
-                    if "dear" in new_instructions.lower() and "not" in new_instructions.lower():
-                        current_name = None
-                        new_name = None
-                        
-                        # Try to extract the current and new names from the instructions
-                        name_parts = new_instructions.lower().split("dear ")
-                        if len(name_parts) > 1:
-                            current_part = name_parts[1].split(",")[0].strip()
-                            current_name = current_part
-                            
-                            # Look for replacement instructions like "use X instead" or "change to Y"
-                            change_indicators = ["not", "instead", "change to", "replace with", "use"]
-                            for indicator in change_indicators:
-                                if indicator in new_instructions.lower():
-                                    parts = new_instructions.lower().split(indicator)
-                                    if len(parts) > 1:
-                                        potential_name = parts[1].strip()
-                                        if potential_name and potential_name != current_name:
-                                            # Extract the name, handling potential punctuation
-                                            for punct in [',', '.', ':', ';']:
-                                                if punct in potential_name:
-                                                    potential_name = potential_name.split(punct)[0].strip()
-                                            new_name = potential_name
-                        
-                        # If we found both names, do a direct replacement
-                        if current_name and new_name:
-                            # Do case-insensitive replacement of "Dear [old name]" with "Dear [new name]"
-                            pattern = re.compile(re.escape(f"Dear {current_name}"), re.IGNORECASE)
-                            current_reply = pattern.sub(f"Dear {new_name}", current_reply)
-                            print(f"Changed recipient from '{current_name}' to '{new_name}'")
-                            continue
-                    
-                    # If the direct name change didn't work, regenerate the full email
-                    new_reply = generate_reply(
-                        service, 
-                        email_detail, 
-                        gemini_context, 
-                        new_instructions, 
-                        user_name
-                    )
-                    current_reply = process_generated_email(new_reply)
-                except Exception as e:
-                    print(f"Error regenerating suggestion: {e}")
-                    print("Keeping the current version.")
-            else:
-                print("Sorry, regeneration is not available in this context. Please edit manually.")
+            # Apply new instructions to the current draft
+            new_instructions = input("\nWhat specific improvements would you like to see in the email? ").strip()
+            if not new_instructions:
+                continue
+            print("Updating suggestion...")
+            
+            try:
+                edited_reply, method = edit_draft(current_reply, new_instructions)
+                current_reply = process_generated_email(edited_reply)
+                print("Applied the change locally." if method == "local" else "Applied the change with Gemini.")
+            except Exception as e:
+                print(f"Error updating suggestion: {e}")
+                print("Keeping the current version.")
                 
         elif choice == '3':
             # Keep as is
@@ -696,8 +984,15 @@ def api_setup_authentication():
     Modified setup_authentication function for API context.
     Checks for token in a specific location and handles authentication more gracefully.
     """
+    creds = credential_store.credentials()
+    if creds is not None and creds.valid:
+        return creds
+
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+
     creds = None
-    token_path = os.path.join(os.path.dirname(__file__), "token.json")
+    token_path = credential_store.path
     credentials_path = os.path.join(os.path.dirname(__file__), "credentials.json")
     
     # Check if token exists
@@ -716,8 +1011,7 @@ def api_setup_authentication():
             raise Exception("No valid credentials found. Please authenticate using the CLI tool first.")
         
         # Save the refreshed credentials
-        with open(token_path, "w") as token:
-            token.write(creds.to_json())
+        credential_store.save(creds)
     
     return creds
 
@@ -770,6 +1064,26 @@ def send_reply(service, user_id, original_msg_id, reply_text, email_detail=None,
         print(f"An error occurred sending the reply: {error}")
         return False
 
+def send_api_reply(service, user_id, original_msg_id, reply_text, original_msg=None):
+    """
+    Non-interactive version of send_reply for the API.
+    Replies to the original sender within the thread.
+    Returns a tuple: (success, sent message id or error message)
+    """
+    try:
+        formatted_reply = format_email_content(reply_text)
+        message_body = create_reply_message(
+            service, user_id, original_msg_id, formatted_reply, original_msg=original_msg
+        )
+        sent_message = service.users().messages().send(
+            userId=user_id,
+            body=message_body
+        ).execute()
+        return True, sent_message['id']
+    except HttpError as error:
+        logger.exception("Error sending reply to %s", original_msg_id)
+        return False, str(error)
+
 def manual_format_fix(email_text):
     """
     Allows manual fixing of email formatting when automatic detection fails.
@@ -874,14 +1188,14 @@ def send_email(service, user_id, to, subject, body, cc=None):
             body={'raw': raw_message}
         ).execute()
         
-        print(f"Message sent successfully! Message ID: {sent_message['id']}")
+        logger.info("Sent message %s", sent_message['id'])
         return True
         
-    except HttpError as error:
-        print(f"An error occurred while sending the email: {error}")
+    except HttpError:
+        logger.exception("Error sending email")
         return False
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+    except Exception:
+        logger.exception("Unexpected error sending email")
         return False
 
 @email_bp.route("/generate", methods=["POST"])
@@ -896,14 +1210,13 @@ def generate():
             return jsonify({"error": "message_id is required"}), 400
 
         creds = setup_authentication()
-        service = build("gmail", "v1", credentials=creds)
+        service = build_gmail_service(creds)
         
         reply_text = generate_reply(message_id, {"name": user_name, "profession": user_context})
         return jsonify({"reply": reply_text})
 
     except Exception as e:
-        print(f"Error in generate endpoint: {str(e)}")
-        print(traceback.format_exc())
+        logger.exception("Error in generate endpoint")
         return jsonify({"error": str(e)}), 500
 
 @email_bp.route("/edit", methods=["POST"])
@@ -919,14 +1232,13 @@ def edit():
             return jsonify({"error": "message_id and edit_instructions are required"}), 400
 
         creds = setup_authentication()
-        service = build("gmail", "v1", credentials=creds)
+        service = build_gmail_service(creds)
         
         edited_reply = edit_reply(service, message_id, user_name, user_context, edit_instructions)
         return jsonify({"reply": edited_reply})
 
     except Exception as e:
-        print(f"Error in edit endpoint: {str(e)}")
-        print(traceback.format_exc())
+        logger.exception("Error in edit endpoint")
         return jsonify({"error": str(e)}), 500
 
 @email_bp.route("/send", methods=["POST"])
@@ -942,14 +1254,13 @@ def send():
             return jsonify({"error": "to, subject, and body_text are required"}), 400
 
         creds = setup_authentication()
-        service = build("gmail", "v1", credentials=creds)
+        service = build_gmail_service(creds)
         
         message_id = send_email(service, to, subject, body_text, cc)
         return jsonify({"message_id": message_id})
 
     except Exception as e:
-        print(f"Error in send endpoint: {str(e)}")
-        print(traceback.format_exc())
+        logger.exception("Error in send endpoint")
         return jsonify({"error": str(e)}), 500
 
 def main():
@@ -975,7 +1286,7 @@ def main():
     # Get Gmail API service
     try:
         creds = setup_authentication()
-        service = build("gmail", "v1", credentials=creds)
+        service = build_gmail_service(creds)
         
         # Get the user's email address
         profile = service.users().getProfile(userId='me').execute()
@@ -0,0 +1,656 @@
+"""
+Offline stand-ins for Gmail and Gemini, for benchmarks and load tests.
+
+GMAIL_BACKEND=fake and GEMINI_BACKEND=fake (see config.py) swap the real
+backends for these. The Gmail fake sits at the HTTP layer, under both
+googleapiclient and the async httpx client, so the circuit breakers,
+deadlines, metrics and tracing stay in the measured path. The Gemini fake
+replaces the google.generativeai module returned by clients.get_genai().
+
+Responses are replayed from FAKE_FIXTURES, a JSON file of the form
+{"gmail": {"profile": {...}, "messages": [<full Gmail messages>]},
+ "gemini": {"responses": {prompt_key(prompt): text}, "default": [text, ...]}}
+(see benchmarks/record_fixtures.py). Without one, the mailbox is synthetic
+and generated from FAKE_SEED. Latency and error rates are set per backend.
+"""
+import asyncio
+import base64
+import email
+import enum
+import hashlib
+import json
+import os
+import random
+import socket
+import threading
+import time
+from collections import OrderedDict
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+FAKE_FIXTURES = os.getenv("FAKE_FIXTURES", "")
+FAKE_SEED = int(os.getenv("FAKE_SEED", "42"))
+FAKE_GMAIL_MESSAGES = int(os.getenv("FAKE_GMAIL_MESSAGES", "60"))
+# Median latency per call; each call varies by +/- FAKE_LATENCY_JITTER of it
+FAKE_GMAIL_LATENCY_MS = float(os.getenv("FAKE_GMAIL_LATENCY_MS", "40"))
+FAKE_GEMINI_LATENCY_MS = float(os.getenv("FAKE_GEMINI_LATENCY_MS", "300"))
+FAKE_GEMINI_MS_PER_TOKEN = float(os.getenv("FAKE_GEMINI_MS_PER_TOKEN", "4"))
+FAKE_LATENCY_JITTER = float(os.getenv("FAKE_LATENCY_JITTER", "0.25"))
+# Fraction of calls that fail with a 429 or 5xx
+FAKE_GMAIL_ERROR_RATE = float(os.getenv("FAKE_GMAIL_ERROR_RATE", "0"))
+FAKE_GEMINI_ERROR_RATE = float(os.getenv("FAKE_GEMINI_ERROR_RATE", "0"))
+
+FAKE_ACCOUNT = "me@example.com"
+
+class FaultInjector:
+    """Seeded latency and error decisions, shared by all calls to one backend."""
+    def __init__(self, latency_ms: float, error_rate: float, jitter: float = FAKE_LATENCY_JITTER,
+                 seed: int = FAKE_SEED):
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def latency(self, extra_ms: float = 0) -> float:
+        """Seconds to wait for one call."""
+        with self._lock:
+            factor = 1 + self.jitter * (2 * self._random.random() - 1)
+        return max(0.0, (self.latency_ms + extra_ms) * factor / 1000)
+
+    def error_status(self) -> Optional[int]:
+        """An HTTP status to fail with, or None."""
+        with self._lock:
+            if self.error_rate <= 0 or self._random.random() >= self.error_rate:
+                return None
+            return self._random.choice((429, 500, 503))
+
+def _load_fixtures(path: str = FAKE_FIXTURES) -> Dict[str, Any]:
+    if not path:
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+# ---------------- Gmail ----------------
+def _b64(text: str) -> str:
+    return base64.urlsafe_b64encode(text.encode()).decode()
+
+_SENDERS = [
+    ("Alice Johnson", "alice@acme.example"), ("Bob Smith", "bob@contoso.example"),
+    ("Carol Diaz", "carol@globex.example"), ("Dan Wu", "dan@initech.example"),
+    ("Erin Park", "erin@umbrella.example"), ("Newsletter", "noreply@news.example"),
+]
+_SUBJECTS = [
+    "Meeting next week", "Invoice #{n}", "Question about the proposal", "Project update",
+    "Can we reschedule?", "Your weekly digest", "Follow-up on our call", "Contract review",
+]
+_BODIES = [
+    "Hi,\n\nCould we meet on Tuesday at 10am to go over the numbers? Let me know if that works.\n\nThanks,\n{name}",
+    "Hello,\n\nPlease find the invoice attached. Payment is due within 30 days.\n\nBest regards,\n{name}",
+    "Hi there,\n\nI had a few questions about the proposal you sent. Do you have time for a quick call "
+    "this week? I'd especially like to understand the timeline and the budget breakdown.\n\n{name}",
+    "Hi team,\n\nQuick update: the first milestone is done and we're on track for the second. "
+    "I'll share a detailed report on Friday.\n\nCheers,\n{name}",
+    "Hi,\n\nSomething came up and I can't make Thursday. Would Monday afternoon work instead?\n\n{name}",
+]
+
+def synthetic_messages(count: int = FAKE_GMAIL_MESSAGES, seed: int = FAKE_SEED) -> List[Dict]:
+    """A deterministic mailbox of `count` full-format messages in threads of 1-4."""
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1, 9, 0, tzinfo=timezone.utc)
+    messages, n = [], 0
+    while n < count:
+        thread_id = f"t{n:05d}"
+        subject = rng.choice(_SUBJECTS).format(n=1000 + n)
+        name, address = rng.choice(_SENDERS)
+        message_id_header = None
+        for depth in range(min(rng.randint(1, 4), count - n)):
+            sent_at = start + timedelta(minutes=37 * n)
+            from_me = depth % 2 == 1
+            sender = f"Me <{FAKE_ACCOUNT}>" if from_me else f"{name} <{address}>"
+            body = rng.choice(_BODIES).format(name="Me" if from_me else name.split()[0])
+            headers = [
+                {"name": "From", "value": sender},
+                {"name": "To", "value": f"{name} <{address}>" if from_me else f"Me <{FAKE_ACCOUNT}>"},
+                {"name": "Subject", "value": subject if depth == 0 else f"Re: {subject}"},
+                {"name": "Date", "value": format_datetime(sent_at)},
+                {"name": "Message-ID", "value": f"<m{n:05d}@mail.example>"},
+            ]
+            if message_id_header:
+                headers += [{"name": "In-Reply-To", "value": message_id_header},
+                            {"name": "References", "value": message_id_header}]
+            message_id_header = f"<m{n:05d}@mail.example>"
+            labels = ["SENT"] if from_me else ["INBOX", "CATEGORY_PERSONAL"]
+            if not from_me and rng.random() < 0.6:
+                labels.append("UNREAD")
+            messages.append({
+                "id": f"m{n:05d}",
+                "threadId": thread_id,
+                "labelIds": labels,
+                "snippet": body.split("\n\n")[1][:100],
+                "internalDate": str(int(sent_at.timestamp() * 1000)),
+                "sizeEstimate": len(body) + 400,
+                "payload": {"mimeType": "text/plain", "headers": headers,
+                            "body": {"size": len(body), "data": _b64(body)}},
+            })
+            n += 1
+    return messages
+
+def _error_body(status: int, message: str) -> Dict:
+    reason = {400: "INVALID_ARGUMENT", 404: "NOT_FOUND", 429: "RESOURCE_EXHAUSTED"}.get(status, "UNAVAILABLE")
+    return {"error": {"code": status, "message": message, "status": reason}}
+
+class FakeMailbox:
+    """
+    In-memory Gmail mailbox that answers the REST calls the app makes:
+    messages.list/get/send/modify, threads.list/get, history.list, watch and
+    getProfile. Callables in `listeners` are called after every change, like
+    a Gmail watch notification.
+    """
+    def __init__(self, messages: List[Dict], email_address: str = FAKE_ACCOUNT, history_id: int = 1000):
+        self.email_address = email_address
+        self.history_id = history_id
+        self._messages: "OrderedDict[str, Dict]" = OrderedDict()
+        self._history: List[Dict] = []
+        self._next_id = 0
+        self.listeners: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        for message in messages:
+            self._store(dict(message))
+
+    @classmethod
+    def from_config(cls) -> "FakeMailbox":
+        gmail = _load_fixtures().get("gmail")
+        if gmail:
+            profile = gmail.get("profile", {})
+            return cls(gmail["messages"], profile.get("emailAddress", FAKE_ACCOUNT),
+                       int(profile.get("historyId", 1000)))
+        return cls(synthetic_messages())
+
+    def _store(self, message: Dict) -> None:
+        self.history_id += 1
+        message["historyId"] = str(self.history_id)
+        self._messages[message["id"]] = message
+
+    def _record(self, entry: Dict) -> None:
+        entry["id"] = str(self.history_id)
+        self._history.append(entry)
+        for listener in self.listeners:
+            listener()
+
+    # -- request dispatch --
+    def handle(self, method: str, url: str, body: Optional[bytes]) -> Tuple[int, Dict]:
+        parts = urlsplit(url)
+        path = parts.path.split("/users/", 1)[-1].strip("/").split("/")
+        query = {k: v if len(v) > 1 else v[0] for k, v in parse_qs(parts.query).items()}
+        data = json.loads(body) if body else {}
+        if len(path) < 2:
+            return 404, _error_body(404, "Not Found")
+        resource, rest = path[1], path[2:]
+        with self._lock:
+            if resource == "profile" and method == "GET":
+                return 200, self.profile()
+            if resource == "messages":
+                if rest == ["send"] and method == "POST":
+                    return self.send(data)
+                if not rest and method == "GET":
+                    return 200, self.list_messages(query)
+                if len(rest) == 1 and method == "GET":
+                    return self.get_message(rest[0], query)
+                if len(rest) == 2 and rest[1] == "modify" and method == "POST":
+                    return self.modify(rest[0], data)
+            if resource == "threads":
+                if not rest and method == "GET":
+                    return 200, self.list_threads(query)
+                if len(rest) == 1 and method == "GET":
+                    return self.get_thread(rest[0], query)
+            if resource == "history" and method == "GET":
+                return self.list_history(query)
+            if resource == "watch" and method == "POST":
+                expiration = int((time.time() + 7 * 86400) * 1000)
+                return 200, {"historyId": str(self.history_id), "expiration": str(expiration)}
+        return 404, _error_body(404, f"Unsupported fake Gmail call: {method} {parts.path}")
+
+    # -- resources --
+    def profile(self) -> Dict:
+        return {
+            "emailAddress": self.email_address,
+            "messagesTotal": len(self._messages),
+            "threadsTotal": len({m["threadId"] for m in self._messages.values()}),
+            "historyId": str(self.history_id),
+        }
+
+    def _matches(self, message: Dict, query: Dict) -> bool:
+        labels = set(message.get("labelIds", []))
+        wanted = query.get("labelIds", [])
+        if isinstance(wanted, str):
+            wanted = [wanted]
+        if not labels.issuperset(wanted):
+            return False
+        for term in query.get("q", "").split():
+            key, _, value = term.partition(":")
+            if key == "is" and value.upper() not in labels:
+                return False
+            if key == "in" and value.upper() not in labels:
+                return False
+            if key == "category" and value == "primary" and "CATEGORY_PERSONAL" not in labels:
+                return False
+        return True
+
+    def _newest_first(self, query: Dict) -> List[Dict]:
+        matched = [m for m in self._messages.values() if self._matches(m, query)]
+        return sorted(matched, key=lambda m: int(m.get("internalDate", 0)), reverse=True)
+
+    @staticmethod
+    def _page(items: List, query: Dict, default_size: int = 100) -> Tuple[List, Optional[str]]:
+        offset = int(query.get("pageToken") or 0)
+        size = min(int(query.get("maxResults") or default_size), 500)
+        page = items[offset:offset + size]
+        return page, str(offset + size) if offset + size < len(items) else None
+
+    def list_messages(self, query: Dict) -> Dict:
+        matched = self._newest_first(query)
+        page, next_token = self._page(matched, query)
+        result = {"messages": [{"id": m["id"], "threadId": m["threadId"]} for m in page],
+                  "resultSizeEstimate": len(matched)}
+        if next_token:
+            result["nextPageToken"] = next_token
+        if not page:
+            del result["messages"]
+        return result
+
+    @staticmethod
+    def _format(message: Dict, query: Dict) -> Dict:
+        fmt = query.get("format", "full")
+        if fmt == "full":
+            return message
+        result = {k: v for k, v in message.items() if k != "payload"}
+        if fmt == "metadata":
+            wanted = query.get("metadataHeaders", [])
+            wanted = {h.lower() for h in ([wanted] if isinstance(wanted, str) else wanted)}
+            headers = message.get("payload", {}).get("headers", [])
+            result["payload"] = {
+                "mimeType": message.get("payload", {}).get("mimeType"),
+                "headers": [h for h in headers if not wanted or h["name"].lower() in wanted],
+            }
+        return result
+
+    def get_message(self, message_id: str, query: Dict) -> Tuple[int, Dict]:
+        message = self._messages.get(message_id)
+        if message is None:
+            return 404, _error_body(404, "Requested entity was not found.")
+        return 200, self._format(message, query)
+
+    def _thread_messages(self, thread_id: str) -> List[Dict]:
+        return sorted((m for m in self._messages.values() if m["threadId"] == thread_id),
+                      key=lambda m: int(m.get("internalDate", 0)))
+
+    def get_thread(self, thread_id: str, query: Dict) -> Tuple[int, Dict]:
+        messages = self._thread_messages(thread_id)
+        if not messages:
+            return 404, _error_body(404, "Requested entity was not found.")
+        return 200, {
+            "id": thread_id,
+            "historyId": max(m["historyId"] for m in messages),
+            "messages": [self._format(m, query) for m in messages],
+        }
+
+    def list_threads(self, query: Dict) -> Dict:
+        seen, threads = set(), []
+        for message in self._newest_first(query):
+            if message["threadId"] not in seen:
+                seen.add(message["threadId"])
+                threads.append({"id": message["threadId"], "snippet": message.get("snippet", ""),
+                                "historyId": message["historyId"]})
+        page, next_token = self._page(threads, query)
+        result = {"threads": page, "resultSizeEstimate": len(threads)}
+        if next_token:
+            result["nextPageToken"] = next_token
+        return result
+
+    def list_history(self, query: Dict) -> Tuple[int, Dict]:
+        try:
+            start = int(query["startHistoryId"])
+        except (KeyError, ValueError):
+            return 400, _error_body(400, "Invalid startHistoryId")
+        if self._history and start < int(self._history[0]["id"]) - 1:
+            # Gmail keeps a limited window of history; older ids need a full sync
+            return 404, _error_body(404, "Requested entity was not found.")
+        records = [h for h in self._history if int(h["id"]) > start]
+        page, next_token = self._page(records, query, default_size=100)
+        result = {"historyId": str(self.history_id)}
+        if page:
+            result["history"] = page
+        if next_token:
+            result["nextPageToken"] = next_token
+        return 200, result
+
+    def send(self, data: Dict) -> Tuple[int, Dict]:
+        raw = data.get("raw")
+        if not raw:
+            return 400, _error_body(400, "'raw' RFC822 payload message string or uploading message via /upload/* URL required")
+        parsed = email.message_from_bytes(base64.urlsafe_b64decode(raw + "=" * (-len(raw) % 4)))
+        part = next((p for p in parsed.walk() if p.get_content_type() == "text/plain"), None)
+        text = part.get_payload(decode=True).decode(errors="replace") if part is not None else ""
+        self._next_id += 1
+        message_id = f"sent{self._next_id:05d}"
+        thread_id = data.get("threadId") or message_id
+        now = datetime.now(timezone.utc)
+        message = {
+            "id": message_id,
+            "threadId": thread_id,
+            "labelIds": ["SENT"],
+            "snippet": text[:100],
+            "internalDate": str(int(now.timestamp() * 1000)),
+            "sizeEstimate": len(raw),
+            "payload": {
+                "mimeType": "text/plain",
+                "headers": [{"name": k, "value": str(v)} for k, v in parsed.items()],
+                "body": {"size": len(text), "data": _b64(text)},
+            },
+        }
+        self._store(message)
+        self._record({
+            "messages": [{"id": message_id, "threadId": thread_id}],
+            "messagesAdded": [{"message": {"id": message_id, "threadId": thread_id, "labelIds": ["SENT"]}}],
+        })
+        return 200, {"id": message_id, "threadId": thread_id, "labelIds": ["SENT"]}
+
+    def deliver(self, sender: str, subject: str, body: str, thread_id: Optional[str] = None) -> Dict:
+        """Add an incoming unread message, as if it had just arrived."""
+        with self._lock:
+            self._next_id += 1
+            message_id = f"in{self._next_id:05d}"
+            thread_id = thread_id or message_id
+            now = datetime.now(timezone.utc)
+            labels = ["INBOX", "CATEGORY_PERSONAL", "UNREAD"]
+            message = {
+                "id": message_id,
+                "threadId": thread_id,
+                "labelIds": labels,
+                "snippet": body[:100],
+                "internalDate": str(int(now.timestamp() * 1000)),
+                "sizeEstimate": len(body) + 400,
+                "payload": {"mimeType": "text/plain", "headers": [
+                    {"name": "From", "value": sender},
+                    {"name": "To", "value": f"Me <{self.email_address}>"},
+                    {"name": "Subject", "value": subject},
+                    {"name": "Date", "value": format_datetime(now)},
+                    {"name": "Message-ID", "value": f"<{message_id}@mail.example>"},
+                ], "body": {"size": len(body), "data": _b64(body)}},
+            }
+            self._store(message)
+            self._record({
+                "messages": [{"id": message_id, "threadId": thread_id}],
+                "messagesAdded": [{"message": {"id": message_id, "threadId": thread_id, "labelIds": labels}}],
+            })
+            return message
+
+    def modify(self, message_id: str, data: Dict) -> Tuple[int, Dict]:
+        message = self._messages.get(message_id)
+        if message is None:
+            return 404, _error_body(404, "Requested entity was not found.")
+        labels = message.setdefault("labelIds", [])
+        added = [l for l in data.get("addLabelIds", []) if l not in labels]
+        removed = [l for l in data.get("removeLabelIds", []) if l in labels]
+        if added or removed:
+            message["labelIds"] = [l for l in labels if l not in removed] + added
+            self.history_id += 1
+            message["historyId"] = str(self.history_id)
+            ref = {"id": message_id, "threadId": message["threadId"], "labelIds": message["labelIds"]}
+            entry = {"messages": [{"id": message_id, "threadId": message["threadId"]}]}
+            if added:
+                entry["labelsAdded"] = [{"message": ref, "labelIds": added}]
+            if removed:
+                entry["labelsRemoved"] = [{"message": ref, "labelIds": removed}]
+            self._record(entry)
+        return 200, {"id": message_id, "threadId": message["threadId"], "labelIds": message["labelIds"]}
+
+    def mark_read(self, message_id: str) -> None:
+        """Remove UNREAD from a message, as if it had been opened in Gmail."""
+        with self._lock:
+            self.modify(message_id, {"removeLabelIds": ["UNREAD"]})
+
+class FakeGmail:
+    """A mailbox plus the latency/error behaviour of the API in front of it."""
+    def __init__(self, mailbox: FakeMailbox, faults: FaultInjector):
+        self.mailbox = mailbox
+        self.faults = faults
+        self.calls = 0
+
+    def respond(self, method: str, url: str, body: Optional[bytes]) -> Tuple[float, int, Dict]:
+        """(delay seconds, status, JSON body) for one call."""
+        self.calls += 1
+        delay = self.faults.latency()
+        status = self.faults.error_status()
+        if status is not None:
+            return delay, status, _error_body(status, "Backend Error (fake)")
+        status, payload = self.mailbox.handle(method, url, body)
+        return delay, status, payload
+
+_fake_gmail: Optional[FakeGmail] = None
+_fake_gmail_lock = threading.Lock()
+
+def get_fake_gmail() -> FakeGmail:
+    global _fake_gmail
+    if _fake_gmail is None:
+        with _fake_gmail_lock:
+            if _fake_gmail is None:
+                _fake_gmail = FakeGmail(FakeMailbox.from_config(),
+                                        FaultInjector(FAKE_GMAIL_LATENCY_MS, FAKE_GMAIL_ERROR_RATE))
+    return _fake_gmail
+
+class FakeGmailHttp:
+    """httplib2.Http stand-in for googleapiclient, answering from the fake mailbox."""
+    def __init__(self, timeout: Optional[float] = None):
+        self.timeout = timeout
+        self.gmail = get_fake_gmail()
+
+    def request(self, uri, method="GET", body=None, headers=None, redirections=5, connection_type=None):
+        import httplib2
+
+        delay, status, payload = self.gmail.respond(method, uri, body.encode() if isinstance(body, str) else body)
+        if self.timeout is not None and delay > self.timeout:
+            time.sleep(self.timeout)
+            raise socket.timeout("timed out")
+        time.sleep(delay)
+        content = json.dumps(payload).encode()
+        response = httplib2.Response({"status": str(status), "content-type": "application/json; charset=UTF-8"})
+        return response, content
+
+def fake_gmail_transport():
+    """httpx async transport for AsyncGmailClient, answering from the fake mailbox."""
+    import httpx
+
+    gmail = get_fake_gmail()
+
+    class FakeGmailTransport(httpx.AsyncBaseTransport):
+        async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+            body = await request.aread()
+            delay, status, payload = gmail.respond(request.method, str(request.url), body or None)
+            timeout = (request.extensions.get("timeout") or {}).get("read")
+            if timeout is not None and delay > timeout:
+                await asyncio.sleep(timeout)
+                raise httpx.ReadTimeout("timed out", request=request)
+            await asyncio.sleep(delay)
+            return httpx.Response(status, json=payload, request=request)
+
+    return FakeGmailTransport()
+
+class FakeCredentials:
+    """Always-valid stand-in for google.oauth2 Credentials."""
+    token = "fake-token"
+    valid = True
+    expired = False
+    refresh_token = None
+
+    def refresh(self, request) -> None:
+        pass
+
+    def to_json(self) -> str:
+        return json.dumps({"token": self.token})
+
+# ---------------- Gemini ----------------
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+def prompt_key(prompt: str) -> str:
+    """Fixture key for a recorded response."""
+    return hashlib.sha256(prompt.encode()).hexdigest()[:16]
+
+_DEFAULT_REPLIES = [
+    "Thank you for your email. Tuesday at 10am works well for me; I'll send a calendar invite shortly.",
+    "Thanks for reaching out. I've reviewed the details and will get back to you with a full answer by Friday.",
+    "Thank you for the update. That sounds good, and I appreciate you keeping me in the loop.",
+]
+
+class FakeUsage:
+    def __init__(self, prompt_tokens: int, output_tokens: int, cached_tokens: int = 0):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+        self.cached_content_token_count = cached_tokens
+        self.total_token_count = prompt_tokens + output_tokens
+
+class FakeFinishReason(enum.Enum):
+    STOP = 1
+    MAX_TOKENS = 2
+
+class FakeCandidate:
+    def __init__(self, finish_reason: FakeFinishReason):
+        self.finish_reason = finish_reason
+
+class FakeResponse:
+    def __init__(self, text: str, usage: FakeUsage, finish_reason: FakeFinishReason = FakeFinishReason.STOP):
+        self.text = text
+        self.usage_metadata = usage
+        self.candidates = [FakeCandidate(finish_reason)]
+
+class FakeGemini:
+    """Replays recorded responses by prompt hash, or a canned reply, with injected latency and errors."""
+    def __init__(self, fixtures: Dict, faults: FaultInjector, ms_per_token: float = FAKE_GEMINI_MS_PER_TOKEN):
+        self.responses: Dict[str, str] = fixtures.get("responses", {})
+        self.defaults: List[str] = fixtures.get("default") or _DEFAULT_REPLIES
+        self.faults = faults
+        self.ms_per_token = ms_per_token
+        self.calls = 0
+
+    def answer(self, prompt: str, system_instruction: Optional[str]) -> str:
+        recorded = self.responses.get(prompt_key(prompt))
+        if recorded is not None:
+            return recorded
+        if system_instruction and "JSON array of edits" in system_instruction:
+            return "[]"
+        return self.defaults[int(prompt_key(prompt), 16) % len(self.defaults)]
+
+    def plan(self, prompt: str, system_instruction: Optional[str], cached_tokens: int, request_options,
+             generation_config=None):
+        """(delay seconds, timeout or None, error or None, response) for one call."""
+        from google.api_core import exceptions
+
+        self.calls += 1
+        text = self.answer(prompt, system_instruction)
+        finish_reason = FakeFinishReason.STOP
+        max_tokens = (generation_config or {}).get("max_output_tokens")
+        if max_tokens and estimate_tokens(text) > max_tokens:
+            text, finish_reason = text[:max_tokens * 4], FakeFinishReason.MAX_TOKENS
+        system_tokens = estimate_tokens(system_instruction) if system_instruction else 0
+        usage = FakeUsage(estimate_tokens(prompt) + system_tokens, estimate_tokens(text), cached_tokens)
+        delay = self.faults.latency(self.ms_per_token * usage.candidates_token_count)
+        timeout = (request_options or {}).get("timeout")
+        status = self.faults.error_status()
+        error = None
+        if status == 429:
+            error = exceptions.ResourceExhausted("Resource has been exhausted (fake)")
+        elif status is not None:
+            error = exceptions.ServiceUnavailable("The service is currently unavailable (fake)")
+        return delay, timeout, error, FakeResponse(text, usage, finish_reason)
+
+class FakeGenerativeModel:
+    def __init__(self, backend: FakeGemini, model_name: str, system_instruction: Optional[str] = None,
+                 generation_config=None, cached_tokens: int = 0):
+        self.backend = backend
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.generation_config = generation_config
+        self.cached_tokens = cached_tokens
+
+    def generate_content(self, prompt, request_options=None, **kwargs):
+        from google.api_core import exceptions
+
+        delay, timeout, error, response = self.backend.plan(
+            str(prompt), self.system_instruction, self.cached_tokens, request_options, self.generation_config
+        )
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise exceptions.DeadlineExceeded("Deadline Exceeded (fake)")
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        return response
+
+    async def generate_content_async(self, prompt, request_options=None, **kwargs):
+        from google.api_core import exceptions
+
+        delay, timeout, error, response = self.backend.plan(
+            str(prompt), self.system_instruction, self.cached_tokens, request_options, self.generation_config
+        )
+        if timeout is not None and delay > timeout:
+            await asyncio.sleep(timeout)
+            raise exceptions.DeadlineExceeded("Deadline Exceeded (fake)")
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return response
+
+class _FakeCachedContent:
+    def __init__(self, model: str, system_instruction: str):
+        self.model = model.split("/", 1)[-1]
+        self.system_instruction = system_instruction
+
+    @classmethod
+    def create(cls, model: str, system_instruction: str, ttl=None, **kwargs) -> "_FakeCachedContent":
+        return cls(model, system_instruction)
+
+class FakeGenAI:
+    """Quacks like the parts of google.generativeai the app uses."""
+    def __init__(self, backend: FakeGemini):
+        backend_ref = backend
+
+        class GenerativeModel(FakeGenerativeModel):
+            def __init__(self, model_name: str, system_instruction: Optional[str] = None,
+                         generation_config=None, **kwargs):
+                super().__init__(backend_ref, model_name, system_instruction, generation_config)
+
+            @classmethod
+            def from_cached_content(cls, cached_content, generation_config=None, **kwargs):
+                model = cls(cached_content.model, cached_content.system_instruction, generation_config)
+                model.cached_tokens = estimate_tokens(cached_content.system_instruction)
+                return model
+
+        class caching:
+            CachedContent = _FakeCachedContent
+
+        self.backend = backend
+        self.GenerativeModel = GenerativeModel
+        self.caching = caching
+
+    def configure(self, **kwargs) -> None:
+        pass
+
+def fake_genai() -> FakeGenAI:
+    return FakeGenAI(FakeGemini(_load_fixtures().get("gemini", {}),
+                                FaultInjector(FAKE_GEMINI_LATENCY_MS, FAKE_GEMINI_ERROR_RATE)))
+
+# ---------------- Recording ----------------
+def record_gmail_fixtures(service, limit: int = 50, query: str = "") -> Dict:
+    """Capture the newest `limit` messages (and the rest of their threads) from a real Gmail service."""
+    listed = service.users().messages().list(userId="me", q=query, maxResults=limit).execute()
+    thread_ids = list(OrderedDict.fromkeys(m["threadId"] for m in listed.get("messages", [])))
+    messages = []
+    for thread_id in thread_ids:
+        thread = service.users().threads().get(userId="me", id=thread_id, format="full").execute()
+        messages.extend(thread.get("messages", []))
+    profile = service.users().getProfile(userId="me").execute()
+    return {"gmail": {"profile": profile, "messages": messages}}
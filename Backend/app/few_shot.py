@@ -0,0 +1,174 @@
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .aio import run_async
+from .db import DatabaseService
+from .models import EmailHistory
+from .text_vectors import HashingVectorizer
+
+FEW_SHOT_INDEX_DIR = os.getenv(
+    "FEW_SHOT_INDEX_DIR", os.path.join(os.path.dirname(__file__), "few_shot_index")
+)
+
+class UserReplyIndex:
+    """
+    On-disk index of one user's sent replies.
+    vectors.f32 holds the raw float32 rows and is opened with np.memmap;
+    meta.jsonl holds one line per row with its row number, history id, subject
+    and content. Both files are append-only, so new replies never rewrite the
+    index. Appends from any worker process hold an exclusive flock on
+    index.lock; readers pick up other workers' rows from the file sizes.
+    """
+    def __init__(self, directory: str, vectorizer: HashingVectorizer):
+        self.directory = directory
+        self.vectorizer = vectorizer
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.meta_path = os.path.join(directory, "meta.jsonl")
+        self.lock_path = os.path.join(directory, "index.lock")
+        self.row_bytes = vectorizer.n_features * np.dtype(np.float32).itemsize
+        self.meta: Dict[int, Dict] = {}
+        self.ids = set()
+        self._meta_offset = 0
+        self._vectors: Optional[np.ndarray] = None
+        self.refreshed_at = 0.0
+        os.makedirs(self.directory, exist_ok=True)
+        self.reload()
+
+    @contextmanager
+    def _file_lock(self):
+        with open(self.lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def reload(self) -> None:
+        """Pick up rows appended since the last read, by this or any other process."""
+        self._read_new_meta()
+        self._map_vectors()
+
+    def _read_new_meta(self) -> None:
+        try:
+            if os.path.getsize(self.meta_path) <= self._meta_offset:
+                return
+        except FileNotFoundError:
+            return
+        with open(self.meta_path, 'rb') as f:
+            f.seek(self._meta_offset)
+            data = f.read()
+        # A line still being written by another process is read next time
+        complete = data[:data.rfind(b'\n') + 1]
+        for line in complete.splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            # Indexes written before rows were recorded have one line per row
+            entry.setdefault('row', len(self.meta))
+            self.meta[entry['row']] = entry
+            self.ids.add(entry['id'])
+        self._meta_offset += len(complete)
+
+    def _map_vectors(self) -> None:
+        rows = os.path.getsize(self.vectors_path) // self.row_bytes if os.path.exists(self.vectors_path) else 0
+        if self._vectors is not None and len(self._vectors) == rows:
+            return
+        if rows and self.meta:
+            self._vectors = np.memmap(
+                self.vectors_path, dtype=np.float32, mode='r', shape=(rows, self.vectorizer.n_features)
+            )
+        else:
+            self._vectors = None
+
+    def append(self, history: List[EmailHistory]) -> int:
+        """Append replies that are not indexed yet. Returns how many were added."""
+        with self._file_lock():
+            self._read_new_meta()
+            new_rows = [h for h in history if h.id not in self.ids and h.content.strip()]
+            if not new_rows:
+                return 0
+            vectors = self.vectorizer.transform(f"{h.subject}\n{h.content}" for h in new_rows)
+            with open(self.vectors_path, 'ab') as f:
+                # Drop a partial row left by a crashed writer so rows stay aligned
+                first_row = os.fstat(f.fileno()).st_size // self.row_bytes
+                f.truncate(first_row * self.row_bytes)
+                f.write(vectors.astype(np.float32).tobytes())
+            lines = [
+                json.dumps({'row': first_row + i, 'id': h.id, 'subject': h.subject, 'content': h.content})
+                for i, h in enumerate(new_rows)
+            ]
+            with open(self.meta_path, 'a') as f:
+                f.write("\n".join(lines) + "\n")
+            self.reload()
+        return len(new_rows)
+
+    def top_k(self, text: str, k: int) -> List[Dict[str, str]]:
+        if self._vectors is None or k <= 0:
+            return []
+        scores = self._vectors @ self.vectorizer.transform([text])[0]
+        k = min(k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        # A row without metadata is a vector whose meta line was never written
+        return [self.meta[i] for i in best if scores[i] > 0 and i in self.meta]
+
+class FewShotRetriever:
+    """
+    Picks the user's most similar past replies as few-shot examples.
+    Indexes are synced from EmailHistory at most every `refresh_seconds`.
+    """
+    def __init__(self, base_dir: str = FEW_SHOT_INDEX_DIR, n_features: int = 1024,
+                 refresh_seconds: float = 300, max_example_chars: int = 600):
+        self.base_dir = base_dir
+        self.vectorizer = HashingVectorizer(n_features)
+        self.refresh_seconds = refresh_seconds
+        self.max_example_chars = max_example_chars
+        self._indexes: Dict[str, UserReplyIndex] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _user_lock(self, user_id: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(user_id, threading.Lock())
+
+    def get_index(self, user_id: str) -> UserReplyIndex:
+        with self._user_lock(user_id):
+            index = self._indexes.get(user_id)
+            if index is None:
+                # User ids come from Supabase (UUIDs); keep them path-safe anyway
+                safe_id = "".join(c for c in user_id if c.isalnum() or c in "-_")
+                index = UserReplyIndex(os.path.join(self.base_dir, safe_id), self.vectorizer)
+                self._indexes[user_id] = index
+            else:
+                index.reload()
+            if time.monotonic() - index.refreshed_at > self.refresh_seconds:
+                history = run_async(DatabaseService.get_user_email_history(user_id))
+                index.append(history)
+                index.refreshed_at = time.monotonic()
+            return index
+
+    def add(self, user_id: str, history: EmailHistory) -> None:
+        """Index a reply as soon as it is recorded."""
+        index = self.get_index(user_id)
+        with self._user_lock(user_id):
+            index.append([history])
+
+    def examples(self, user_id: str, subject: str, body: str, k: int = 2) -> List[str]:
+        """Return up to `k` compact past replies similar to the incoming email."""
+        index = self.get_index(user_id)
+        examples = []
+        for entry in index.top_k(f"{subject}\n{body}", k):
+            content = entry['content'].strip()
+            if len(content) > self.max_example_chars:
+                content = content[:self.max_example_chars].rsplit(' ', 1)[0] + "..."
+            examples.append(f"Subject: {entry['subject']}\n{content}")
+        return examples
+
+few_shot_retriever = FewShotRetriever()
@@ -0,0 +1,48 @@
+import threading
+import time
+from contextlib import contextmanager
+
+class InFlightTracker:
+    """
+    Counts in-flight upstream calls (Gemini generations) so a worker that is
+    shutting down can report not-ready and wait for them to finish.
+    """
+    def __init__(self):
+        self._count = 0
+        self._draining = False
+        self._condition = threading.Condition()
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def draining(self) -> bool:
+        return self._draining
+
+    @contextmanager
+    def track(self):
+        with self._condition:
+            self._count += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._count -= 1
+                self._condition.notify_all()
+
+    def start_draining(self) -> None:
+        self._draining = True
+
+    def wait_for_drain(self, timeout: float) -> bool:
+        """Block until no calls are in flight. Returns False on timeout."""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self._count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+inflight = InFlightTracker()
@@ -0,0 +1,148 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from .clients import get_genai
+from .metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+
+# Provider-side caching of the shared system instruction: "off", "gemini" or
+# "local" (an in-process stand-in with the same behaviour, for tests).
+# Gemini only caches prefixes above a minimum token count and only for
+# explicitly versioned models (e.g. gemini-1.5-flash-002); when creating the
+# cache fails the pool falls back to a plain system instruction.
+CONTEXT_CACHE_MODE = os.getenv("GEMINI_CONTEXT_CACHE", "off").lower()
+CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+
+def _freeze(config: Optional[Dict[str, Any]]) -> Tuple:
+    return tuple(sorted((config or {}).items()))
+
+class GeminiContextCache:
+    """Creates Gemini CachedContent for a system instruction and models bound to it."""
+    def __init__(self, ttl_seconds: int = CONTEXT_CACHE_TTL):
+        self.ttl_seconds = ttl_seconds
+        self.creates = 0
+        self.hits = 0
+        self._unsupported = set()
+
+    def create_model(self, model_name: str, system_instruction: str,
+                     generation_config: Optional[Dict[str, Any]]) -> Optional[Tuple[Any, float]]:
+        """Return (model, expires_at) or None when the prefix cannot be cached."""
+        key = (model_name, system_instruction)
+        if key in self._unsupported:
+            return None
+        genai = get_genai()
+        try:
+            cached = genai.caching.CachedContent.create(
+                model=f"models/{model_name}",
+                system_instruction=system_instruction,
+                ttl=timedelta(seconds=self.ttl_seconds),
+            )
+        except Exception as e:
+            logger.warning("Context caching unavailable for %s: %s", model_name, e)
+            self._unsupported.add(key)
+            return None
+        self.creates += 1
+        model = genai.GenerativeModel.from_cached_content(cached, generation_config=generation_config)
+        # Renew a little before the provider drops the cache
+        return model, time.monotonic() + self.ttl_seconds * 0.9
+
+class LocalContextCache:
+    """
+    In-process stand-in for GeminiContextCache. Models carry a plain system
+    instruction; `creates` and `hits` count how often the prefix would have
+    been uploaded versus reused.
+    """
+    def __init__(self, ttl_seconds: int = CONTEXT_CACHE_TTL):
+        self.ttl_seconds = ttl_seconds
+        self.creates = 0
+        self.hits = 0
+
+    def create_model(self, model_name: str, system_instruction: str,
+                     generation_config: Optional[Dict[str, Any]]) -> Optional[Tuple[Any, float]]:
+        self.creates += 1
+        model = get_genai().GenerativeModel(
+            model_name, system_instruction=system_instruction, generation_config=generation_config
+        )
+        return model, time.monotonic() + self.ttl_seconds
+
+def make_context_cache(mode: str = CONTEXT_CACHE_MODE):
+    if mode == "gemini":
+        return GeminiContextCache()
+    if mode == "local":
+        return LocalContextCache()
+    return None
+
+class ModelPool:
+    """
+    Reuses GenerativeModel instances per (model, system instruction, config).
+    Models bound to a provider cache are replaced when that cache expires.
+    Models are built outside the pool lock, since creating a provider cache is
+    a network call; concurrent requests for the same key wait for one build.
+    """
+    def __init__(self, context_cache=None, max_size: int = 32):
+        self.context_cache = context_cache
+        self.max_size = max_size
+        self._models: "OrderedDict[Tuple, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self._building: Dict[Tuple, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_name: str = DEFAULT_MODEL, system_instruction: Optional[str] = None,
+            generation_config: Optional[Dict[str, Any]] = None):
+        key = (model_name, system_instruction, _freeze(generation_config))
+        while True:
+            with self._lock:
+                entry = self._models.get(key)
+                if entry and (entry[1] is None or entry[1] > time.monotonic()):
+                    record_cache("model_pool", True)
+                    self._models.move_to_end(key)
+                    if entry[1] is not None:
+                        self.context_cache.hits += 1
+                    return entry[0]
+                event = self._building.get(key)
+                if event is None:
+                    event = threading.Event()
+                    self._building[key] = event
+                    break
+            # Another request is building this model; wait and look again.
+            # If that build failed, the next loop iteration takes over.
+            event.wait()
+
+        record_cache("model_pool", False)
+        try:
+            entry = None
+            if system_instruction and self.context_cache is not None:
+                entry = self.context_cache.create_model(model_name, system_instruction, generation_config)
+            if entry is None:
+                model = get_genai().GenerativeModel(
+                    model_name, system_instruction=system_instruction, generation_config=generation_config
+                )
+                entry = (model, None)
+            with self._lock:
+                self._models[key] = entry
+                self._models.move_to_end(key)
+                while len(self._models) > self.max_size:
+                    self._models.popitem(last=False)
+            return entry[0]
+        finally:
+            with self._lock:
+                self._building.pop(key, None)
+            event.set()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+
+model_pool = ModelPool(make_context_cache())
+
+def get_model(model_name: str = DEFAULT_MODEL, system_instruction: Optional[str] = None,
+              generation_config: Optional[Dict[str, Any]] = None):
+    """Return a pooled GenerativeModel."""
+    return model_pool.get(model_name, system_instruction, generation_config)
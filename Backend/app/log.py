@@ -0,0 +1,157 @@
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" for one JSON object per line, "text" for human-readable lines
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# Fraction of requests whose DEBUG records are kept (all or nothing per request)
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+debug_sampled_var: ContextVar[Optional[bool]] = ContextVar("debug_sampled", default=None)
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+def start_request_context(request_id: Optional[str] = None):
+    """Bind a correlation id (and the debug sampling decision) to the current context."""
+    request_id = request_id or new_request_id()
+    return (
+        request_id_var.set(request_id),
+        debug_sampled_var.set(random.random() < LOG_DEBUG_SAMPLE_RATE),
+    )
+
+def end_request_context(tokens) -> None:
+    request_id_var.reset(tokens[0])
+    debug_sampled_var.reset(tokens[1])
+
+class ContextFilter(logging.Filter):
+    """Adds the request id and drops DEBUG records of unsampled requests."""
+    def __init__(self, base_level: int):
+        super().__init__()
+        self.base_level = base_level
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        if record.levelno >= self.base_level:
+            return True
+        sampled = debug_sampled_var.get()
+        if sampled is None:
+            # Outside a request each record is sampled on its own
+            sampled = random.random() < LOG_DEBUG_SAMPLE_RATE
+        return sampled
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+_traceback_formatter = logging.Formatter()
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the listener thread. When the queue is full the record is
+    dropped and counted instead of blocking the request.
+    """
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only merge args into msg here; the listener thread does the formatting
+        # and writing. Tracebacks are rendered now, while the frames still exist.
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = _traceback_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[DroppingQueueHandler] = None
+_configure_lock = threading.Lock()
+
+def _start_listener(handler: logging.Handler) -> None:
+    global _listener
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, handler, respect_handler_level=True)
+    _listener.start()
+
+def _restart_after_fork(handler: logging.Handler) -> None:
+    # The writer thread does not survive fork (gunicorn preload), and the
+    # parent's queue lock may have been held at fork time; start fresh
+    _queue_handler.queue = queue.Queue(LOG_QUEUE_SIZE)
+    _start_listener(handler)
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT) -> None:
+    """Route the `app` loggers through a bounded queue to one writer thread. Idempotent."""
+    global _queue_handler
+    with _configure_lock:
+        if _queue_handler is not None:
+            return
+        base_level = getattr(logging, level, logging.INFO)
+
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+        _queue_handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+        _queue_handler.addFilter(ContextFilter(base_level))
+
+        logger = logging.getLogger("app")
+        logger.handlers = [_queue_handler]
+        logger.propagate = False
+        # DEBUG calls are only enabled when some of them can be sampled
+        logger.setLevel(min(base_level, logging.DEBUG) if LOG_DEBUG_SAMPLE_RATE > 0 else base_level)
+
+        _start_listener(stream)
+        os.register_at_fork(after_in_child=lambda: _restart_after_fork(stream))
+
+def shutdown_logging() -> None:
+    """Flush queued records; call before the process exits."""
+    if _listener is not None:
+        _listener.stop()
+
+def dropped_records() -> int:
+    return _queue_handler.dropped if _queue_handler else 0
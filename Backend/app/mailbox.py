@@ -0,0 +1,119 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from .aio import get_gmail_client
+from .metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+# How long a mailbox historyId is trusted before Gmail's profile is asked again
+MAILBOX_VERSION_TTL_SECONDS = float(os.getenv("MAILBOX_VERSION_TTL_SECONDS", "10"))
+UNREAD_PAGE_CACHE_SIZE = int(os.getenv("UNREAD_PAGE_CACHE_SIZE", "64"))
+
+class MailboxVersion:
+    """
+    The mailbox's latest Gmail historyId, which changes whenever anything in the
+    mailbox does. Re-read from users.getProfile at most every `ttl_seconds`;
+    concurrent readers share one lookup. Only use current() from the I/O loop.
+    """
+    def __init__(self, ttl_seconds: float = MAILBOX_VERSION_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._history_id: Optional[str] = None
+        self._checked_at = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _fresh(self) -> bool:
+        return self._history_id is not None and time.monotonic() - self._checked_at < self.ttl_seconds
+
+    async def current(self, creds) -> str:
+        if self._fresh():
+            record_cache("mailbox_version", True)
+            return self._history_id
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._fresh():
+                record_cache("mailbox_version", True)
+                return self._history_id
+            record_cache("mailbox_version", False)
+            profile = await get_gmail_client().get_profile(creds)
+            self.observe(profile["historyId"])
+            return self._history_id
+
+    def observe(self, history_id: str) -> None:
+        """Record a historyId seen elsewhere (a profile read or a change notification)."""
+        if self._history_id is not None and int(history_id) < int(self._history_id):
+            # historyIds only grow; this one is from a late notification
+            return
+        self._history_id = str(history_id)
+        self._checked_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        """Force the next read to ask Gmail, e.g. after the app changed the mailbox itself."""
+        self._checked_at = 0.0
+
+class UnreadPageCache:
+    """
+    Recently served /unread pages, keyed by (historyId, page token, page size).
+    Entries for older historyIds are dropped as soon as a newer one is stored.
+    """
+    def __init__(self, max_entries: int = UNREAD_PAGE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._history_id: Optional[str] = None
+        self._pages: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, history_id: str, page_token: Optional[str], page_size: int) -> Optional[Any]:
+        with self._lock:
+            page = self._pages.get((history_id, page_token, page_size))
+            if page is not None:
+                self._pages.move_to_end((history_id, page_token, page_size))
+        record_cache("unread_page", page is not None)
+        return page
+
+    def put(self, history_id: str, page_token: Optional[str], page_size: int, page: Any) -> None:
+        with self._lock:
+            if history_id != self._history_id:
+                self._pages.clear()
+                self._history_id = history_id
+            self._pages[(history_id, page_token, page_size)] = page
+            if len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
+
+# ---------------- Cursors and ETags ----------------
+def encode_cursor(page_token: Optional[str]) -> Optional[str]:
+    """Wrap a Gmail page token in an opaque cursor (None at the end of the list)."""
+    if not page_token:
+        return None
+    raw = json.dumps({"t": page_token}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+def decode_cursor(cursor: Optional[str]) -> Optional[str]:
+    """Return the Gmail page token inside `cursor`. Raises ValueError for malformed cursors."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        page_token = json.loads(raw)["t"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(page_token, str):
+        raise ValueError("Invalid cursor")
+    return page_token
+
+def unread_etag(history_id: str, page_token: Optional[str], page_size: int) -> str:
+    """ETag value for one /unread page: the mailbox version plus the page it names."""
+    page = hashlib.sha1(f"{page_token or ''}|{page_size}".encode()).hexdigest()[:8]
+    return f"{history_id}-{page}"
+
+mailbox_version = MailboxVersion()
+unread_pages = UnreadPageCache()
@@ -0,0 +1,197 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from . import tracing
+
+# Minimal in-process metrics in the Prometheus text format (0.0.4).
+# Values are per worker process; with several gunicorn workers each scrape
+# sees the worker that answered it.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Route template of the current request ("/api/email/generate-reply"), set per request
+current_route: ContextVar[str] = ContextVar("current_route", default="none")
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, *labels: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+class Gauge:
+    """Gauge whose samples are read from a callback at scrape time."""
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str],
+                 read: Callable[[], Iterable[Tuple[Tuple[str, ...], float]]]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.read = read
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for labels, value in self.read():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            try:
+                lines.extend(metric.collect())
+            except Exception as e:
+                lines.append(f"# error collecting {metric.name}: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.register(Histogram(
+    "smartmail_request_seconds", "HTTP request latency by route and status.", ["route", "method", "status"]
+))
+STAGE_SECONDS = registry.register(Histogram(
+    "smartmail_stage_seconds", "Time spent in each stage of a request.", ["route", "stage"]
+))
+GMAIL_CALLS = registry.register(Counter(
+    "smartmail_gmail_calls_total", "Gmail API calls by method and outcome.", ["method", "outcome"]
+))
+GMAIL_SECONDS = registry.register(Histogram(
+    "smartmail_gmail_call_seconds", "Gmail API call latency by method.", ["method"]
+))
+GEMINI_CALLS = registry.register(Counter(
+    "smartmail_gemini_calls_total", "Gemini generations by model and outcome.", ["model", "outcome"]
+))
+GEMINI_SECONDS = registry.register(Histogram(
+    "smartmail_gemini_call_seconds", "Gemini generation latency by model.", ["model"]
+))
+GEMINI_TOKENS = registry.register(Counter(
+    "smartmail_gemini_tokens_total", "Gemini tokens by model and direction (in, out, cached).",
+    ["model", "direction"]
+))
+RESPONSE_BYTES = registry.register(Counter(
+    "smartmail_response_bytes_total", "Bytes of compressed response bodies, before (uncompressed) and after (sent).",
+    ["encoding", "stage"]
+))
+CACHE_LOOKUPS = registry.register(Counter(
+    "smartmail_cache_lookups_total", "Cache and shortcut lookups by cache and result (hit, miss).",
+    ["cache", "result"]
+))
+
+@contextmanager
+def stage(name: str):
+    """Time one stage of the current request into smartmail_stage_seconds (and a trace span)."""
+    started = time.perf_counter()
+    try:
+        with tracing.span(name):
+            yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, current_route.get(), name)
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_LOOKUPS.inc(cache, "hit" if hit else "miss")
+    tracing.set_attribute(f"cache.{cache}", "hit" if hit else "miss")
+
+def record_gemini(model_name: str, seconds: float, outcome: str, response=None) -> None:
+    GEMINI_CALLS.inc(model_name, outcome)
+    GEMINI_SECONDS.observe(seconds, model_name)
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        tokens_in = getattr(usage, "prompt_token_count", 0) or 0
+        tokens_out = getattr(usage, "candidates_token_count", 0) or 0
+        cached = getattr(usage, "cached_content_token_count", 0) or 0
+        GEMINI_TOKENS.inc(model_name, "in", amount=tokens_in)
+        GEMINI_TOKENS.inc(model_name, "out", amount=tokens_out)
+        if cached:
+            GEMINI_TOKENS.inc(model_name, "cached", amount=cached)
+        tracing.set_attribute("gemini.tokens_in", tokens_in)
+        tracing.set_attribute("gemini.tokens_out", tokens_out)
+        tracing.set_attribute("gemini.tokens_cached", cached)
+
+def record_gmail(method: str, seconds: float, outcome: str) -> None:
+    GMAIL_CALLS.inc(method, outcome)
+    GMAIL_SECONDS.observe(seconds, method)
+
+def register_gauge(name: str, documentation: str, labelnames: Sequence[str],
+                   read: Callable[[], Iterable[Tuple[Tuple[str, ...], float]]]) -> Optional[Gauge]:
+    return registry.register(Gauge(name, documentation, labelnames, read))
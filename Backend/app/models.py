@@ -88,11 +88,13 @@ class EmailHistory:
 
 class UserSettings:
     def __init__(self, user_id: str, gmail_token: Optional[str] = None, 
-                 gemini_api_key: Optional[str] = None, default_template: Optional[str] = None):
+                 gemini_api_key: Optional[str] = None, default_template: Optional[str] = None,
+                 tier: Optional[str] = None):
         self.user_id = user_id
         self.gmail_token = gmail_token
         self.gemini_api_key = gemini_api_key
         self.default_template = default_template
+        self.tier = tier
 
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'UserSettings':
@@ -100,7 +102,8 @@ class UserSettings:
             user_id=data['user_id'],
             gmail_token=data.get('gmail_token'),
             gemini_api_key=data.get('gemini_api_key'),
-            default_template=data.get('default_template')
+            default_template=data.get('default_template'),
+            tier=data.get('tier')
         )
 
     def to_dict(self) -> Dict[str, Any]:
@@ -108,5 +111,6 @@ class UserSettings:
             'user_id': self.user_id,
             'gmail_token': self.gmail_token,
             'gemini_api_key': self.gemini_api_key,
-            'default_template': self.default_template
+            'default_template': self.default_template,
+            'tier': self.tier
         } 
\ No newline at end of file
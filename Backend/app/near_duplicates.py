@@ -0,0 +1,144 @@
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Prime just above 2**32 for the universal hash family (a * x + b) mod p
+_PRIME = np.uint64(4294967311)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+
+class AnsweredEmail:
+    def __init__(self, message_id: str, signature: np.ndarray, reply: str,
+                 sender_name: str = "", subject: str = ""):
+        self.message_id = message_id
+        self.signature = signature
+        self.reply = reply
+        self.sender_name = sender_name
+        self.subject = subject
+
+def normalize_body(body: str) -> str:
+    """Lowercase and strip quoted text, links and addresses so that form
+    submissions and templated mail compare equal. Numbers are kept: times,
+    dates and amounts usually decide what the right reply is."""
+    lines = [line for line in body.splitlines() if not line.strip().startswith('>')]
+    text = " ".join(lines).lower()
+    text = re.sub(r'https?://\S+', ' ', text)
+    text = re.sub(r'\S+@\S+', ' ', text)
+    return re.sub(r'[^a-z0-9 ]+', ' ', text)
+
+class NearDuplicateIndex:
+    """
+    MinHash/LSH index over the bodies of emails that already have a reply.
+    Signatures have `num_perm` 32-bit minhashes split into `bands` LSH bands,
+    so a lookup is `bands` dict probes plus a vectorized comparison per candidate.
+    Bodies with fewer than `min_shingles` shingles ("Thanks!", "yes 3pm works")
+    are neither indexed nor matched; short mail says too little to reuse a reply.
+    """
+    def __init__(self, num_perm: int = 128, bands: int = 16, shingle_size: int = 3,
+                 min_shingles: int = 8, max_entries: int = 100000, max_bucket_size: int = 64,
+                 seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.min_shingles = min_shingles
+        self.max_entries = max_entries
+        # Templated mail lands in the same buckets over and over; only the most
+        # recent ids per bucket are kept so lookups stay bounded
+        self.max_bucket_size = max_bucket_size
+
+        rng = np.random.RandomState(seed)
+        # Keep a < 2**31 and x < 2**32 so a * x + b cannot overflow uint64
+        self._a = rng.randint(1, 2 ** 31 - 1, size=num_perm, dtype=np.int64).astype(np.uint64)
+        self._b = rng.randint(0, 2 ** 31 - 1, size=num_perm, dtype=np.int64).astype(np.uint64)
+
+        self._entries: "OrderedDict[str, AnsweredEmail]" = OrderedDict()
+        self._buckets: List[Dict[bytes, List[str]]] = [dict() for _ in range(bands)]
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def signature(self, body: str) -> Optional[np.ndarray]:
+        words = normalize_body(body).split()
+        shingles = {" ".join(words[i:i + self.shingle_size])
+                    for i in range(len(words) - self.shingle_size + 1)}
+        if not shingles or len(shingles) < self.min_shingles:
+            return None
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64, count=len(shingles)
+        )
+        permuted = (np.outer(hashes, self._a) + self._b) % _PRIME
+        return (np.minimum(permuted.min(axis=0), _MAX_HASH)).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def add(self, message_id: str, body: str, reply: str, sender_name: str = "", subject: str = "") -> bool:
+        """Index an answered email. Returns False when the body is too short to index."""
+        signature = self.signature(body)
+        if signature is None:
+            return False
+        entry = AnsweredEmail(message_id, signature, reply, sender_name, subject)
+        with self._lock:
+            if message_id in self._entries:
+                self._remove(message_id)
+            self._entries[message_id] = entry
+            for band, key in zip(self._buckets, self._band_keys(signature)):
+                ids = band.setdefault(key, [])
+                ids.append(message_id)
+                if len(ids) > self.max_bucket_size:
+                    del ids[0]
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+        return True
+
+    def _remove(self, message_id: str) -> None:
+        entry = self._entries.pop(message_id)
+        for band, key in zip(self._buckets, self._band_keys(entry.signature)):
+            ids = band.get(key)
+            if ids and message_id in ids:
+                ids.remove(message_id)
+                if not ids:
+                    del band[key]
+
+    def query(self, body: str, threshold: float = 0.8) -> Optional[Tuple[AnsweredEmail, float]]:
+        """Return the most similar answered email with estimated Jaccard >= threshold."""
+        signature = self.signature(body)
+        if signature is None:
+            return None
+        with self._lock:
+            candidates = set()
+            for band, key in zip(self._buckets, self._band_keys(signature)):
+                candidates.update(band.get(key, ()))
+            best, best_score = None, threshold
+            for message_id in candidates:
+                entry = self._entries[message_id]
+                score = float(np.count_nonzero(entry.signature == signature)) / self.num_perm
+                if score >= best_score:
+                    best, best_score = entry, score
+        return (best, best_score) if best else None
+
+def adapt_reply(entry: AnsweredEmail, sender_name: str, subject: str) -> str:
+    """
+    Reuse an earlier reply for a new sender by swapping names and subject. The
+    old sender's full name is replaced throughout, their first name only in the
+    greeting line, since elsewhere it may refer to someone else.
+    """
+    reply = entry.reply
+    if entry.sender_name and sender_name and entry.sender_name != sender_name:
+        reply = re.sub(r'\b%s\b' % re.escape(entry.sender_name), lambda m: sender_name, reply)
+        first_old, first_new = entry.sender_name.split()[0], sender_name.split()[0]
+        greeting, newline, rest = reply.partition('\n')
+        greeting = re.sub(r'\b%s\b' % re.escape(first_old), lambda m: first_new, greeting)
+        reply = greeting + newline + rest
+    if entry.subject and subject and entry.subject != subject:
+        reply = reply.replace(entry.subject, subject)
+    return reply
+
+answered_index = NearDuplicateIndex()
@@ -0,0 +1,276 @@
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Callable, Dict, Optional
+
+# Sampling profiler built on sys._current_frames(). Nothing runs until a
+# profile is requested: no thread, no hooks, no per-request work beyond one
+# attribute check.
+
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+PROFILE_MAX_DEPTH = 128
+# Request profile sessions are written here so any worker can report or cancel them
+PROFILE_SPOOL_DIR = os.getenv("PROFILE_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "smartmail-profiles"))
+# How often a running session looks for a cancel request from another worker
+PROFILE_CANCEL_CHECK_SECONDS = 0.5
+SESSION_ID = re.compile(r"^[0-9a-f]{12}$")
+
+class ProfilerBusyError(Exception):
+    pass
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}.{getattr(code, 'co_qualname', code.co_name)}"
+
+def collapse(frame, root: str) -> str:
+    """One stack in collapsed (flamegraph.pl / speedscope) form, outermost frame first."""
+    names = []
+    while frame is not None and len(names) < PROFILE_MAX_DEPTH:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    names.append(root)
+    return ";".join(reversed(names))
+
+def format_collapsed(stacks: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+class StackSampler:
+    """
+    Samples the stacks of selected threads every `interval` seconds on a
+    background thread. `select(ident)` returns the root label for a thread,
+    or None to skip it. `on_sample` runs on the sampler thread after each sample.
+    """
+    def __init__(self, select: Callable[[int], Optional[str]], interval: float = PROFILE_INTERVAL_MS / 1000,
+                 on_sample: Optional[Callable[[], None]] = None):
+        self.select = select
+        self.interval = interval
+        self.on_sample = on_sample
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        return self.stacks
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.sample(own)
+            if self.on_sample is not None:
+                self.on_sample()
+
+    def sample(self, own: int) -> None:
+        self.samples += 1
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            root = self.select(ident)
+            if root is not None:
+                self.stacks[collapse(frame, root)] += 1
+
+def profile_process(seconds: float, interval: float = PROFILE_INTERVAL_MS / 1000,
+                    exclude: Optional[int] = None) -> Counter:
+    """Sample every thread of the process (except `exclude`) for `seconds`."""
+    names: Dict[int, str] = {}
+
+    def select(ident: int) -> Optional[str]:
+        if ident == exclude:
+            return None
+        if ident not in names:
+            names.update((t.ident, t.name) for t in threading.enumerate())
+        return names.get(ident, f"thread-{ident}")
+
+    sampler = StackSampler(select, interval)
+    sampler.start()
+    time.sleep(seconds)
+    return sampler.stop()
+
+class RequestProfileSession:
+    def __init__(self, route: str, requests: int, timeout: float, interval: float):
+        self.id = uuid.uuid4().hex[:12]
+        self.route = route
+        self.requests = requests
+        self.interval = interval
+        self.expires_at = time.monotonic() + timeout
+        self.started = 0
+        self.finished = 0
+        self.done = False
+        self.timed_out = False
+        self.pid = os.getpid()
+        self.stacks: Counter = Counter()
+        self.cancel_checked_at = time.monotonic()
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id, "route": self.route, "requests": self.requests,
+            "started": self.started, "finished": self.finished,
+            "done": self.done, "timed_out": self.timed_out, "pid": self.pid,
+        }
+
+    @classmethod
+    def from_spool(cls, data: Dict) -> "RequestProfileSession":
+        session = cls(data["route"], data["requests"], 0, 0)
+        session.id = data["id"]
+        session.started, session.finished = data["started"], data["finished"]
+        session.done, session.timed_out, session.pid = data["done"], data["timed_out"], data["pid"]
+        session.stacks = Counter(data.get("stacks", {}))
+        return session
+
+class RequestProfiler:
+    """
+    Profiles the next N requests to one route in this worker. Only the
+    threads currently serving those requests are sampled; each stack is
+    rooted at the route so the output reads as one flamegraph per route.
+    Session progress and results are spooled to `spool_dir` as <id>.json, so
+    the worker that answers a poll or cancel need not be the one profiling.
+    """
+    def __init__(self, keep: int = 8, spool_dir: str = PROFILE_SPOOL_DIR):
+        self.session: Optional[RequestProfileSession] = None
+        self.keep = keep
+        self.spool_dir = spool_dir
+        self._finished: Dict[str, RequestProfileSession] = {}
+        self._active: Dict[int, str] = {}
+        self._sampler: Optional[StackSampler] = None
+        self._lock = threading.Lock()
+
+    def start(self, route: str, requests: int, timeout: float,
+              interval: float = PROFILE_INTERVAL_MS / 1000) -> RequestProfileSession:
+        with self._lock:
+            if self.session is not None:
+                raise ProfilerBusyError(f"Already profiling {self.session.route} ({self.session.id})")
+            session = RequestProfileSession(route, requests, timeout, interval)
+            self._sampler = StackSampler(self._select, interval, lambda: self._check_expired(session))
+            self.session = session
+        self._spool(session)
+        self._sampler.start()
+        return session
+
+    def _check_expired(self, session: RequestProfileSession) -> None:
+        if session.done:
+            return
+        now = time.monotonic()
+        if now >= session.expires_at:
+            session.timed_out = True
+            self._finish(session)
+        elif now - session.cancel_checked_at >= PROFILE_CANCEL_CHECK_SECONDS:
+            session.cancel_checked_at = now
+            if os.path.exists(self._spool_path(session.id, ".cancel")):
+                self._finish(session)
+
+    def _spool_path(self, session_id: str, suffix: str = ".json") -> str:
+        return os.path.join(self.spool_dir, session_id + suffix)
+
+    def _spool(self, session: RequestProfileSession) -> None:
+        data = session.to_dict()
+        if session.done:
+            data["stacks"] = dict(session.stacks)
+        os.makedirs(self.spool_dir, exist_ok=True)
+        path = self._spool_path(session.id)
+        with open(f"{path}.{os.getpid()}.tmp", "w") as f:
+            json.dump(data, f)
+        os.replace(f"{path}.{os.getpid()}.tmp", path)
+
+    def _load(self, session_id: str) -> Optional[RequestProfileSession]:
+        if not SESSION_ID.match(session_id):
+            return None
+        try:
+            with open(self._spool_path(session_id)) as f:
+                return RequestProfileSession.from_spool(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _prune_spool(self) -> None:
+        """Keep the newest `keep` finished sessions on disk."""
+        try:
+            names = [n for n in os.listdir(self.spool_dir) if n.endswith(".json")]
+        except OSError:
+            return
+        paths = sorted((os.path.join(self.spool_dir, n) for n in names), key=os.path.getmtime, reverse=True)
+        for path in paths[self.keep:]:
+            for stale in (path, path[:-len(".json")] + ".cancel"):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+
+    def _select(self, ident: int) -> Optional[str]:
+        return self._active.get(ident)
+
+    def enter(self, route: str) -> Optional[RequestProfileSession]:
+        """Called at the start of a request while a session is active; returns the session if it is sampled."""
+        with self._lock:
+            session = self.session
+            if session is None or session.route != route or session.started >= session.requests:
+                return None
+            session.started += 1
+            self._active[threading.get_ident()] = route
+            return session
+
+    def exit(self, session: RequestProfileSession) -> None:
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+            session.finished += 1
+            complete = session.finished >= session.requests
+        if complete:
+            self._finish(session)
+        else:
+            self._spool(session)
+
+    def _finish(self, session: RequestProfileSession) -> None:
+        with self._lock:
+            if self.session is not session:
+                return
+            sampler, self._sampler = self._sampler, None
+            self.session = None
+            self._active.clear()
+            self._finished[session.id] = session
+            while len(self._finished) > self.keep:
+                self._finished.pop(next(iter(self._finished)))
+        session.stacks = sampler.stop()
+        session.done = True
+        self._spool(session)
+        self._prune_spool()
+
+    def get(self, session_id: str) -> Optional[RequestProfileSession]:
+        """A session started by this or any other worker sharing the spool directory."""
+        with self._lock:
+            session = self.session
+            if session is not None and session.id == session_id:
+                return session
+            session = self._finished.get(session_id)
+        return session or self._load(session_id)
+
+    def cancel(self) -> Optional[RequestProfileSession]:
+        """Stop this worker's session, or ask the worker running one to stop it."""
+        session = self.session
+        if session is not None:
+            self._finish(session)
+            return session
+        try:
+            names = [n[:-len(".json")] for n in os.listdir(self.spool_dir) if n.endswith(".json")]
+        except OSError:
+            return None
+        for session_id in names:
+            spooled = self._load(session_id)
+            if spooled is not None and not spooled.done:
+                open(self._spool_path(session_id, ".cancel"), "w").close()
+                return spooled
+        return None
+
+request_profiler = RequestProfiler()
@@ -0,0 +1,98 @@
+import os
+import re
+import threading
+import time
+from email.utils import parseaddr
+from string import Template
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .aio import run_async
+from .db import DatabaseService
+from .models import EmailTemplate
+from .text_vectors import TfidfVectorizer
+
+# Minimum cosine similarity for a template to be used instead of Gemini
+TEMPLATE_MATCH_THRESHOLD = float(os.getenv("TEMPLATE_MATCH_THRESHOLD", "0.35"))
+# ...and the number of distinct (non stop word) terms the email must share with it
+TEMPLATE_MIN_SHARED_TERMS = int(os.getenv("TEMPLATE_MIN_SHARED_TERMS", "2"))
+
+def compile_template(content: str) -> Template:
+    """Accept both {{ name }} and $name / ${name} placeholders."""
+    return Template(re.sub(r'\{\{\s*(\w+)\s*\}\}', r'${\1}', content))
+
+class CompiledTemplates:
+    """A user's templates with their TF-IDF matrix and parsed placeholders."""
+    def __init__(self, templates: List[EmailTemplate]):
+        self.templates = templates
+        self.compiled = [compile_template(t.content) for t in templates]
+        self.vectorizer = TfidfVectorizer()
+        documents = [f"{t.name} {t.content}" for t in templates]
+        self.matrix = self.vectorizer.fit_transform(documents)
+        self.terms = [self.vectorizer.known_terms(doc) for doc in documents]
+
+    def best_match(self, text: str) -> Optional[Tuple[int, float, int]]:
+        """(template index, cosine score, distinct shared terms) of the closest template."""
+        if not self.templates or not self.vectorizer.vocabulary:
+            return None
+        scores = self.matrix @ self.vectorizer.transform([text])[0]
+        index = int(np.argmax(scores))
+        shared = len(self.terms[index] & self.vectorizer.known_terms(text))
+        return index, float(scores[index]), shared
+
+class TemplateEngine:
+    """
+    Matches incoming mail to a user's saved templates and renders replies
+    locally. Compiled templates are cached per user for `ttl_seconds`.
+    """
+    def __init__(self, threshold: float = TEMPLATE_MATCH_THRESHOLD,
+                 min_shared_terms: int = TEMPLATE_MIN_SHARED_TERMS, ttl_seconds: float = 300):
+        self.threshold = threshold
+        self.min_shared_terms = min_shared_terms
+        self.ttl_seconds = ttl_seconds
+        self._cache: Dict[str, Tuple[float, CompiledTemplates]] = {}
+        self._lock = threading.Lock()
+
+    def get_compiled(self, user_id: str) -> CompiledTemplates:
+        with self._lock:
+            cached = self._cache.get(user_id)
+        if cached and time.monotonic() - cached[0] < self.ttl_seconds:
+            return cached[1]
+
+        templates = run_async(DatabaseService.get_user_templates(user_id))
+        compiled = CompiledTemplates(templates)
+        with self._lock:
+            self._cache[user_id] = (time.monotonic(), compiled)
+        return compiled
+
+    def invalidate(self, user_id: str) -> None:
+        with self._lock:
+            self._cache.pop(user_id, None)
+
+    def render_reply(self, user_id: str, subject: str, body: str, from_header: str,
+                     user_name: str) -> Optional[Tuple[EmailTemplate, str, float]]:
+        """
+        Return (template, rendered reply, score) for the best template above the
+        threshold and sharing at least `min_shared_terms` terms with the email,
+        or None when the email should go to Gemini.
+        """
+        compiled = self.get_compiled(user_id)
+        match = compiled.best_match(f"{subject}\n{body}")
+        if not match or match[1] < self.threshold or match[2] < self.min_shared_terms:
+            return None
+
+        index, score, _ = match
+        sender_name, sender_email = parseaddr(from_header)
+        sender_name = sender_name or sender_email.split('@')[0]
+        variables = {
+            'sender_name': sender_name,
+            'sender_first_name': sender_name.split()[0] if sender_name else "",
+            'sender_email': sender_email,
+            'subject': subject,
+            'user_name': user_name,
+        }
+        reply = compiled.compiled[index].safe_substitute(variables)
+        return compiled.templates[index], reply, score
+
+template_engine = TemplateEngine()
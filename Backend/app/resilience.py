@@ -0,0 +1,222 @@
+import logging
+import os
+import socket
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from . import tracing
+from .metrics import record_gmail
+
+logger = logging.getLogger(__name__)
+
+# Default time budget for one HTTP request, and the most a client may ask for
+# with the X-Request-Timeout header (seconds)
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "30"))
+MAX_REQUEST_DEADLINE_SECONDS = float(os.getenv("MAX_REQUEST_DEADLINE_SECONDS", "120"))
+
+class UpstreamUnavailableError(Exception):
+    """Base for errors that should reach the client as a fast 5xx."""
+    status_code = 503
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class CircuitOpenError(UpstreamUnavailableError):
+    status_code = 503
+
+class DeadlineExceededError(UpstreamUnavailableError):
+    status_code = 504
+
+# ---------------- Deadlines ----------------
+# Absolute time.monotonic() by which the current request must finish
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+def start_deadline(seconds: float):
+    """Set the deadline for the current context. Returns a token for reset_deadline."""
+    return _deadline.set(time.monotonic() + seconds)
+
+def reset_deadline(token) -> None:
+    _deadline.reset(token)
+
+def current_deadline() -> Optional[float]:
+    return _deadline.get()
+
+def remaining() -> Optional[float]:
+    """Seconds left before the deadline, or None when there is no deadline."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+def check_deadline(operation: str = "request") -> None:
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceededError(f"Deadline exceeded before {operation}")
+
+def timeout_for(default: Optional[float]) -> Optional[float]:
+    """Per-call timeout: `default` capped by the time left on the deadline."""
+    check_deadline()
+    left = remaining()
+    if left is None:
+        return default
+    return left if default is None else min(default, left)
+
+def deadline_from_header(value: Optional[str]) -> float:
+    try:
+        seconds = float(value) if value else REQUEST_DEADLINE_SECONDS
+    except ValueError:
+        seconds = REQUEST_DEADLINE_SECONDS
+    return max(0.1, min(seconds, MAX_REQUEST_DEADLINE_SECONDS))
+
+# ---------------- Failure classification ----------------
+def status_code_of(error: Exception) -> Optional[int]:
+    """HTTP status carried by googleapiclient, httpx or google.api_core errors."""
+    resp = getattr(error, "resp", None)              # googleapiclient HttpError
+    if resp is not None and getattr(resp, "status", None):
+        return int(resp.status)
+    response = getattr(error, "response", None)      # httpx.HTTPStatusError
+    if response is not None and getattr(response, "status_code", None):
+        return int(response.status_code)
+    code = getattr(error, "code", None)              # google.api_core exceptions
+    return code if isinstance(code, int) else None
+
+def is_upstream_failure(error: Exception) -> bool:
+    """Timeouts, connection problems, 429s and 5xx count against a breaker; 4xx do not."""
+    if isinstance(error, (TimeoutError, socket.timeout, ConnectionError)):
+        return True
+    if type(error).__name__ in ("DeadlineExceeded", "ServiceUnavailable", "ConnectError",
+                                "ConnectTimeout", "ReadTimeout", "WriteTimeout", "PoolTimeout",
+                                "RemoteProtocolError", "ServerNotFoundError"):
+        return True
+    status = status_code_of(error)
+    return status is not None and (status == 429 or status >= 500)
+
+# ---------------- Circuit breaker ----------------
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+class CircuitBreaker:
+    """
+    Per-dependency circuit breaker.
+    Opens after `failure_threshold` consecutive upstream failures and rejects
+    calls with CircuitOpenError for `recovery_timeout` seconds. It then lets
+    up to `half_open_max_calls` probe calls through: one success closes it,
+    one failure opens it again.
+    """
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30,
+                 half_open_max_calls: int = 1,
+                 is_failure: Callable[[Exception], bool] = is_upstream_failure):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.is_failure = is_failure
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    def _before_call(self) -> None:
+        with self._lock:
+            if self.state == OPEN:
+                waited = time.monotonic() - self.opened_at
+                if waited < self.recovery_timeout:
+                    self.rejected += 1
+                    raise CircuitOpenError(
+                        f"{self.name} is unavailable (circuit open)", retry_after=self.recovery_timeout - waited
+                    )
+                self.state = HALF_OPEN
+                self._probes = 0
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_max_calls:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"{self.name} is recovering (circuit half-open)", retry_after=1)
+                self._probes += 1
+
+    def _on_success(self) -> None:
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._probes = 0
+
+    def _on_error(self, error: Exception) -> None:
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+            if isinstance(error, UpstreamUnavailableError):
+                # Rejected or out of time before reaching the dependency
+                return
+            if not self.is_failure(error):
+                # The dependency answered; a bad request says nothing about its health
+                if self.state == HALF_OPEN:
+                    self.state = CLOSED
+                    self.failures = 0
+                return
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    logger.warning("Circuit for %s opened after %d failure(s): %s", self.name, self.failures, error)
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        self._before_call()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self._on_error(e)
+            raise
+        self._on_success()
+        return result
+
+    async def call_async(self, make_coro: Callable[[], Awaitable]) -> Any:
+        self._before_call()
+        try:
+            result = await make_coro()
+        except Exception as e:
+            self._on_error(e)
+            raise
+        self._on_success()
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"state": self.state, "failures": self.failures, "rejected": self.rejected}
+
+gmail_breaker = CircuitBreaker("gmail")
+gemini_breaker = CircuitBreaker("gemini", failure_threshold=3, recovery_timeout=20)
+supabase_breaker = CircuitBreaker("supabase")
+
+BREAKERS = {b.name: b for b in (gmail_breaker, gemini_breaker, supabase_breaker)}
+
+# ---------------- Gmail (googleapiclient) ----------------
+GMAIL_TIMEOUT_SECONDS = float(os.getenv("GMAIL_TIMEOUT_SECONDS", "20"))
+
+_guarded_request_class = None
+
+def guarded_request_class():
+    """HttpRequest subclass that checks the deadline and goes through the Gmail breaker."""
+    global _guarded_request_class
+    if _guarded_request_class is None:
+        from googleapiclient.http import HttpRequest
+
+        class GuardedHttpRequest(HttpRequest):
+            def execute(self, http=None, num_retries=0):
+                method = (self.methodId or "unknown").replace("gmail.", "", 1)
+                check_deadline("Gmail call")
+                started = time.perf_counter()
+                outcome = "error"
+                try:
+                    with tracing.span(f"gmail.{method}", **{"gmail.method": self.method}):
+                        result = gmail_breaker.call(super().execute, http=http, num_retries=num_retries)
+                    outcome = "ok"
+                    return result
+                except CircuitOpenError:
+                    outcome = "rejected"
+                    raise
+                finally:
+                    record_gmail(method, time.perf_counter() - started, outcome)
+
+        _guarded_request_class = GuardedHttpRequest
+    return _guarded_request_class
@@ -0,0 +1,112 @@
+import gzip
+import os
+from typing import Any, Optional
+
+from flask import Response, request
+from flask.json.provider import DefaultJSONProvider
+
+from .metrics import RESPONSE_BYTES
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this go out as they are; below one packet compression saves nothing
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+# Brotli's default (11) is meant for static assets; 4-5 suits per-request bodies
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "5"))
+COMPRESSIBLE_MIMETYPES = {"application/json", "text/plain", "text/html", "text/csv"}
+
+def _default(obj: Any) -> Any:
+    # Model records (User, EmailTemplate, ...) know their own JSON shape
+    to_dict = getattr(obj, "to_dict", None)
+    if callable(to_dict):
+        return to_dict()
+    return DefaultJSONProvider.default(obj)
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider that serializes with orjson when it is installed, with
+    the same output rules as Flask's default (sorted keys, HTTP dates for
+    datetimes). Objects with a to_dict() method can be returned directly.
+    """
+    default = staticmethod(_default)
+
+    def _options(self, pretty: bool) -> int:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def _dumps_bytes(self, obj: Any, pretty: bool) -> Optional[bytes]:
+        try:
+            return orjson.dumps(obj, default=_default, option=self._options(pretty))
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bits, which the stdlib encoder handles
+            return None
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if orjson is None or kwargs.keys() - {"separators"}:
+            return super().dumps(obj, **kwargs)
+        body = self._dumps_bytes(obj, pretty=False)
+        if body is None:
+            return super().dumps(obj, **dict(kwargs, separators=(",", ":")))
+        return body.decode()
+
+    def response(self, *args: Any, **kwargs: Any) -> Response:
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = self.compact is False or (self.compact is None and self._app.debug)
+        body = self._dumps_bytes(obj, pretty)
+        if body is None:
+            return super().response(obj)
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
+
+def available_encodings() -> list:
+    """Content codings this process can produce, in order of preference."""
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=COMPRESS_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=COMPRESS_GZIP_LEVEL, mtime=0)
+
+def compress_response(response: Response) -> Response:
+    """
+    Compress a buffered text/JSON body with the best coding the client accepts
+    (brotli when installed, else gzip). Streams (e.g. the change feed), bodies
+    under COMPRESS_MIN_BYTES and already-encoded responses are left alone.
+    """
+    if (response.is_streamed or response.direct_passthrough or response.status_code in (204, 206, 304)
+            or response.status_code < 200 or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add("Accept-Encoding")
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+    encoding = request.accept_encodings.best_match(available_encodings())
+    if encoding is None:
+        return response
+    compressed = compress(body, encoding)
+    if len(compressed) >= len(body):
+        return response
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        # A strong validator names exact bytes, so each coding needs its own
+        response.set_etag(f"{etag}-{encoding}")
+    RESPONSE_BYTES.inc(encoding, "uncompressed", amount=len(body))
+    RESPONSE_BYTES.inc(encoding, "sent", amount=len(compressed))
+    return response
@@ -0,0 +1,286 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from .aio import run_async
+from .db import DatabaseService
+from .llm import DEFAULT_MODEL, get_model
+from .resilience import gemini_breaker, timeout_for
+from . import tracing
+from .metrics import record_gemini
+
+logger = logging.getLogger(__name__)
+
+FAST_MODEL = os.getenv("GEMINI_FAST_MODEL", "gemini-1.5-flash-8b")
+STRONG_MODEL = os.getenv("GEMINI_STRONG_MODEL", "gemini-1.5-pro")
+# Target end-to-end latency for one generation attempt
+LATENCY_SLO_MS = float(os.getenv("REPLY_LATENCY_SLO_MS", "8000"))
+# Latency is judged over this recent window only, so a slow spell is forgotten
+LATENCY_WINDOW_SECONDS = float(os.getenv("ROUTER_LATENCY_WINDOW_SECONDS", "300"))
+# A model skipped for being over the SLO still gets one request this often,
+# so the router notices when it is fast again
+PROBE_INTERVAL_SECONDS = float(os.getenv("ROUTER_PROBE_INTERVAL_SECONDS", "30"))
+
+# Output token limits: a reply cut off mid-sentence is worse than a slow one
+MIN_OUTPUT_TOKENS = 1024
+MAX_OUTPUT_TOKENS = 2048
+# Limit for the single retry after a response stopped at MAX_TOKENS
+TRUNCATED_RETRY_OUTPUT_TOKENS = 8192
+
+DEFAULT_TIER = "standard"
+PREMIUM_TIER = "premium"
+
+# Prompt sizes (characters) and thread depths that separate the routes
+SHORT_INPUT_CHARS = 1500
+LONG_INPUT_CHARS = 6000
+DEEP_THREAD_MESSAGES = 6
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = [100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, float("inf")]
+
+class LatencyHistogram:
+    """
+    Fixed-bucket latency histogram with approximate quantiles over a sliding
+    window of `window_seconds`, kept as `slots` rotating sub-histograms.
+    """
+    def __init__(self, buckets: List[float] = LATENCY_BUCKETS_MS,
+                 window_seconds: float = LATENCY_WINDOW_SECONDS, slots: int = 5):
+        self.buckets = buckets
+        self.slot_seconds = window_seconds / slots
+        # (slot number, counts, sample count, sum of ms), oldest first
+        self._slots: Deque[Tuple[int, List[int], int, float]] = deque(maxlen=slots)
+        self._lock = threading.Lock()
+
+    def _current_slot(self) -> int:
+        return int(time.monotonic() // self.slot_seconds)
+
+    def _live(self) -> List[Tuple[int, List[int], int, float]]:
+        oldest = self._current_slot() - self._slots.maxlen + 1
+        return [slot for slot in self._slots if slot[0] >= oldest]
+
+    def observe(self, ms: float) -> None:
+        number = self._current_slot()
+        with self._lock:
+            if not self._slots or self._slots[-1][0] != number:
+                self._slots.append((number, [0] * len(self.buckets), 0, 0.0))
+            _, counts, total, sum_ms = self._slots[-1]
+            counts[bisect.bisect_left(self.buckets, ms)] += 1
+            self._slots[-1] = (number, counts, total + 1, sum_ms + ms)
+
+    def _merged(self) -> Tuple[List[int], int, float]:
+        with self._lock:
+            live = self._live()
+        counts = [sum(column) for column in zip(*(slot[1] for slot in live))] or [0] * len(self.buckets)
+        return counts, sum(slot[2] for slot in live), sum(slot[3] for slot in live)
+
+    @property
+    def total(self) -> int:
+        return self._merged()[1]
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th quantile, or None if empty."""
+        counts, total, _ = self._merged()
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for bound, count in zip(self.buckets, counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def to_dict(self) -> Dict:
+        counts, total, sum_ms = self._merged()
+        return {
+            "count": total,
+            "meanMs": round(sum_ms / total, 1) if total else None,
+            "p50Ms": self.quantile(0.5),
+            "p95Ms": self.quantile(0.95),
+            "buckets": {str(b): c for b, c in zip(self.buckets, counts)},
+        }
+
+class ModelStats:
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.errors = 0
+        self.timeouts = 0
+        self.rate_limited = 0
+        self.truncated = 0
+        self.cooldown_until = 0.0
+        self.next_probe_at = 0.0
+
+class RouteDecision:
+    def __init__(self, candidates: List[str], generation_config: Dict, reason: str):
+        self.candidates = candidates
+        self.generation_config = generation_config
+        self.reason = reason
+
+def _is_rate_limited(error: Exception) -> bool:
+    return getattr(error, "code", None) == 429 or type(error).__name__ in ("ResourceExhausted", "TooManyRequests")
+
+def _is_timeout(error: Exception) -> bool:
+    return isinstance(error, TimeoutError) or type(error).__name__ in ("DeadlineExceeded", "ReadTimeout", "Timeout")
+
+def _hit_token_limit(response) -> bool:
+    candidates = getattr(response, "candidates", None)
+    if not candidates:
+        return False
+    reason = candidates[0].finish_reason
+    return getattr(reason, "name", reason) == "MAX_TOKENS"
+
+class ModelRouter:
+    """
+    Picks the model and generation config for a reply from the prompt size,
+    thread depth and user tier, skips models whose recent p95 latency is over
+    the SLO (apart from a probe request every `probe_interval` seconds), and
+    falls back to the next candidate when a model times out or is rate-limited.
+    """
+    def __init__(self, latency_slo_ms: float = LATENCY_SLO_MS, min_samples: int = 20,
+                 rate_limit_cooldown: float = 60, tier_ttl_seconds: float = 300,
+                 probe_interval: float = PROBE_INTERVAL_SECONDS):
+        self.latency_slo_ms = latency_slo_ms
+        self.min_samples = min_samples
+        self.probe_interval = probe_interval
+        self.rate_limit_cooldown = rate_limit_cooldown
+        self.tier_ttl_seconds = tier_ttl_seconds
+        self._stats: Dict[str, ModelStats] = {}
+        self._tiers: Dict[str, Tuple[float, str]] = {}
+        self._lock = threading.Lock()
+
+    def _model_stats(self, model_name: str) -> ModelStats:
+        with self._lock:
+            return self._stats.setdefault(model_name, ModelStats())
+
+    def user_tier(self, user_id: Optional[str]) -> str:
+        """The user's tier from their settings, cached for `tier_ttl_seconds`."""
+        if not user_id:
+            return DEFAULT_TIER
+        cached = self._tiers.get(user_id)
+        if cached and time.monotonic() - cached[0] < self.tier_ttl_seconds:
+            return cached[1]
+        try:
+            settings = run_async(DatabaseService.get_user_settings(user_id))
+            tier = (settings.tier if settings else None) or DEFAULT_TIER
+        except Exception as e:
+            logger.warning("Error loading user tier: %s", e)
+            tier = DEFAULT_TIER
+        self._tiers[user_id] = (time.monotonic(), tier)
+        return tier
+
+    def decide(self, input_chars: int, thread_depth: int = 1, user_tier: str = DEFAULT_TIER) -> RouteDecision:
+        if (input_chars > LONG_INPUT_CHARS or thread_depth >= DEEP_THREAD_MESSAGES) and user_tier == PREMIUM_TIER:
+            candidates, reason = [STRONG_MODEL, DEFAULT_MODEL, FAST_MODEL], "long_or_deep_premium"
+        elif input_chars <= SHORT_INPUT_CHARS and thread_depth <= 2:
+            candidates, reason = [FAST_MODEL, DEFAULT_MODEL], "short"
+        else:
+            candidates, reason = [DEFAULT_MODEL, FAST_MODEL], "default"
+
+        # Drop models that are cooling down after a 429 or are too slow for the
+        # SLO, but always keep at least the last resort
+        now = time.monotonic()
+        usable = []
+        for model_name in candidates:
+            stats = self._model_stats(model_name)
+            if stats.cooldown_until > now:
+                continue
+            if stats.latency.total >= self.min_samples and stats.latency.quantile(0.95) > self.latency_slo_ms:
+                with self._lock:
+                    probe = now >= stats.next_probe_at
+                    if probe:
+                        stats.next_probe_at = now + self.probe_interval
+                if not probe:
+                    continue
+                reason += "+probe"
+            usable.append(model_name)
+        candidates = list(dict.fromkeys(usable or candidates[-1:]))
+
+        generation_config = {
+            # Replies are usually a few hundred words; the limit only has to
+            # keep a runaway generation in check
+            "max_output_tokens": min(MAX_OUTPUT_TOKENS, max(MIN_OUTPUT_TOKENS, input_chars // 2)),
+            "temperature": 0.6,
+        }
+        return RouteDecision(candidates, generation_config, reason)
+
+    def generate(self, prompt: str, system_instruction: Optional[str] = None, thread_depth: int = 1,
+                 user_tier: str = DEFAULT_TIER) -> Tuple[str, str]:
+        """
+        Generate with the routed model, falling back on timeouts and 429s. A
+        response cut off at the output token limit is retried once on the same
+        model with a higher limit.
+        Returns (response text, model name). Other errors are raised.
+        The whole attempt chain counts as one call to the Gemini circuit breaker.
+        """
+        return gemini_breaker.call(self._generate, prompt, system_instruction, thread_depth, user_tier)
+
+    def _generate(self, prompt: str, system_instruction: Optional[str], thread_depth: int,
+                  user_tier: str) -> Tuple[str, str]:
+        # The system instruction is the same for every request, so only the prompt counts
+        decision = self.decide(len(prompt), thread_depth, user_tier)
+        last_error = None
+        for index, model_name in enumerate(decision.candidates):
+            is_last = index == len(decision.candidates) - 1
+            stats = self._model_stats(model_name)
+            attempt = {"gemini.model": model_name, "gemini.attempt": index, "route.reason": decision.reason}
+            started = time.perf_counter()
+            try:
+                with tracing.span("gemini.generate", **attempt):
+                    # Earlier attempts get the SLO as their timeout so there is time to fall
+                    # back; all attempts are capped by the request deadline
+                    timeout = timeout_for(None if is_last else self.latency_slo_ms / 1000)
+                    response = self._attempt(model_name, prompt, system_instruction,
+                                             decision.generation_config, timeout)
+                    elapsed = time.perf_counter() - started
+                    stats.latency.observe(elapsed * 1000)
+                    record_gemini(model_name, elapsed, "ok", response)
+                if _hit_token_limit(response):
+                    stats.truncated += 1
+                    logger.warning("Model %s stopped at max_output_tokens, retrying with a higher limit", model_name)
+                    config = dict(decision.generation_config, max_output_tokens=TRUNCATED_RETRY_OUTPUT_TOKENS)
+                    with tracing.span("gemini.generate", **attempt, **{"gemini.retry": "max_tokens"}):
+                        response = self._attempt(model_name, prompt, system_instruction, config,
+                                                 timeout_for(None))
+                        record_gemini(model_name, time.perf_counter() - started - elapsed, "ok", response)
+                return response.text, model_name
+            except Exception as e:
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                last_error = e
+                record_gemini(model_name, elapsed_ms / 1000, "rate_limited" if _is_rate_limited(e)
+                              else "timeout" if _is_timeout(e) else "error")
+                if _is_rate_limited(e):
+                    stats.rate_limited += 1
+                    stats.cooldown_until = time.monotonic() + self.rate_limit_cooldown
+                elif _is_timeout(e):
+                    stats.timeouts += 1
+                    stats.latency.observe(elapsed_ms)
+                else:
+                    stats.errors += 1
+                    raise
+                logger.warning("Model %s %s, falling back (%s)", model_name,
+                               "rate-limited" if _is_rate_limited(e) else "timed out", decision.reason)
+        raise last_error
+
+    @staticmethod
+    def _attempt(model_name: str, prompt: str, system_instruction: Optional[str], generation_config: Dict,
+                 timeout: Optional[float]):
+        model = get_model(model_name, system_instruction, generation_config)
+        # The call itself runs on the I/O loop, over the async client's pooled channel
+        return run_async(model.generate_content_async(
+            prompt, request_options={"timeout": timeout} if timeout else None
+        ))
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            items = list(self._stats.items())
+        return {
+            name: dict(s.latency.to_dict(), errors=s.errors, timeouts=s.timeouts, rateLimited=s.rate_limited,
+                        truncated=s.truncated)
+            for name, s in items
+        }
+
+model_router = ModelRouter()
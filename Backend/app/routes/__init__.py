@@ -1,3 +1,6 @@
 from .email import email_bp
+from .health import health_bp
+from .metrics import metrics_bp
+from .admin import admin_bp
 
-__all__ = ['email_bp'] 
\ No newline at end of file
+__all__ = ['email_bp', 'health_bp', 'metrics_bp', 'admin_bp']
\ No newline at end of file
@@ -0,0 +1,103 @@
+import hmac
+import os
+import threading
+from functools import wraps
+from typing import Optional
+from flask import Blueprint, Response, abort, jsonify, request
+from ..profiling import (
+    PROFILE_INTERVAL_MS,
+    PROFILE_MAX_SECONDS,
+    ProfilerBusyError,
+    format_collapsed,
+    profile_process,
+    request_profiler,
+)
+from ..resilience import remaining
+
+admin_bp = Blueprint("admin", __name__)
+
+# Admin endpoints are disabled (404) unless ADMIN_TOKEN is set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+def require_admin_token(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            abort(404)
+        supplied = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+        if not hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode()):
+            return jsonify({"success": False, "error": "Unauthorized"}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+def _float_arg(name: str, default: float) -> float:
+    try:
+        return float(request.args.get(name, default))
+    except ValueError:
+        abort(400)
+
+def _collapsed_response(stacks, pid: Optional[int] = None, **headers) -> Response:
+    response = Response(format_collapsed(stacks), content_type="text/plain; charset=utf-8")
+    response.headers["X-Profile-PID"] = str(pid or os.getpid())
+    response.headers.update(headers)
+    return response
+
+@admin_bp.route("/profile", methods=["POST"])
+@require_admin_token
+def profile():
+    """
+    Sample all threads of this worker for ?seconds= (default 10) and return
+    collapsed stacks. The duration is capped by PROFILE_MAX_SECONDS and by
+    this request's own deadline.
+    """
+    seconds = min(_float_arg("seconds", 10), PROFILE_MAX_SECONDS)
+    left = remaining()
+    if left is not None:
+        seconds = min(seconds, max(0.0, left - 1))
+    interval = max(_float_arg("interval_ms", PROFILE_INTERVAL_MS), 1) / 1000
+    stacks = profile_process(seconds, interval, exclude=threading.get_ident())
+    return _collapsed_response(stacks, **{"X-Profile-Seconds": f"{seconds:.3f}"})
+
+@admin_bp.route("/profile/requests", methods=["POST"])
+@require_admin_token
+def start_request_profile():
+    """
+    Profile the next N requests to a route in this worker:
+    {"route": "/api/email/generate-reply", "requests": 5, "timeout": 300}.
+    Poll GET /admin/profile/requests/<id> (answered by any worker) for the result.
+    """
+    data = request.get_json(silent=True) or {}
+    route = data.get("route")
+    if not route:
+        return jsonify({"success": False, "error": "route is required"}), 400
+    try:
+        count = max(1, int(data.get("requests", 10)))
+        timeout = min(float(data.get("timeout", 300)), 3600)
+        interval = max(float(data.get("interval_ms", PROFILE_INTERVAL_MS)), 1) / 1000
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "error": "requests, timeout and interval_ms must be numbers"}), 400
+    try:
+        session = request_profiler.start(route, count, timeout, interval)
+    except ProfilerBusyError as e:
+        return jsonify({"success": False, "error": str(e)}), 409
+    return jsonify({"success": True, "session": session.to_dict()}), 202
+
+@admin_bp.route("/profile/requests/<session_id>", methods=["GET"])
+@require_admin_token
+def request_profile_result(session_id):
+    """Collapsed stacks once the session is done; 202 with progress until then."""
+    session = request_profiler.get(session_id)
+    if session is None:
+        return jsonify({"success": False, "error": "Unknown profile session"}), 404
+    if not session.done:
+        return jsonify({"success": True, "session": session.to_dict()}), 202
+    return _collapsed_response(session.stacks, pid=session.pid, **{
+        "X-Profile-Requests": str(session.finished),
+        "X-Profile-Timed-Out": str(session.timed_out).lower(),
+    })
+
+@admin_bp.route("/profile/requests", methods=["DELETE"])
+@require_admin_token
+def cancel_request_profile():
+    session = request_profiler.cancel()
+    return jsonify({"success": True, "session": session.to_dict() if session else None})
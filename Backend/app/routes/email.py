@@ -1,20 +1,45 @@
-from flask import Blueprint, jsonify, request, redirect, session
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
+from flask import Blueprint, Response, abort, jsonify, make_response, request, redirect, session
 from googleapiclient.errors import HttpError
+import hmac
 import os
 from ..email_assistant import (
     setup_authentication,
-    get_recent_unread_messages,
+    get_unread_page_async,
+    get_message_body,
     generate_reply,
-    send_reply
+    edit_draft,
+    send_api_reply
 )
-from google.auth.transport.requests import Request
-import traceback
+from ..threads import thread_context_service, reply_deduplicator
+from ..triage import classify_message, is_certainly_automated
+from ..edits import RevisionError
+from ..auth import authenticated_user_id
+from ..near_duplicates import answered_index, adapt_reply
+from ..reply_templates import template_engine
+from ..search import search_index
+from ..few_shot import few_shot_retriever
+from ..db import DatabaseService
+from ..aio import run_async
+from ..clients import build_gmail_service
+from ..changes import PUBSUB_VERIFICATION_TOKEN, change_feed, parse_push_message
+from ..credentials import AUTHENTICATED, REFRESHING, credential_store
+from ..mailbox import decode_cursor, encode_cursor, mailbox_version, unread_etag, unread_pages
+from ..router import model_router
+from ..resilience import UpstreamUnavailableError
+from ..metrics import record_cache, stage
+from .. import tracing
+from email.utils import parseaddr
+import logging
+
+logger = logging.getLogger(__name__)
 
 email_bp = Blueprint("email", __name__)
 
+# How long clients may reuse a positive /check-auth answer (seconds)
+AUTH_STATUS_MAX_AGE = int(os.getenv("AUTH_STATUS_MAX_AGE", "30"))
+UNREAD_PAGE_SIZE = int(os.getenv("UNREAD_PAGE_SIZE", "30"))
+UNREAD_MAX_PAGE_SIZE = 100
+
 # Gmail API scopes
 SCOPES = [
     'https://www.googleapis.com/auth/gmail.compose',
@@ -26,41 +51,120 @@ SCOPES = [
 
 @email_bp.route("/check-auth")
 def check_auth():
-    """Check if Gmail authentication is valid."""
+    """
+    Report whether Gmail credentials are usable, from the in-memory credential
+    state; token refresh happens in the background (see credentials.py).
+    """
+    state = credential_store.state()
+    if state.status == REFRESHING:
+        credential_store.wake()
+    body = {"success": True, "authenticated": state.authenticated, "status": state.status}
+    seconds_left = state.seconds_left()
+    if seconds_left is not None:
+        body["expiresIn"] = max(0, int(seconds_left))
+    response = jsonify(body)
+    if state.status == AUTHENTICATED:
+        # Stable until the token nears expiry (the refresher renews it before then)
+        max_age = AUTH_STATUS_MAX_AGE if seconds_left is None else max(0, min(AUTH_STATUS_MAX_AGE, int(seconds_left)))
+        response.headers['Cache-Control'] = f"private, max-age={max_age}"
+    else:
+        # Changes as soon as the user signs in or the refresh completes
+        response.headers['Cache-Control'] = "no-cache"
+    return response
+
+@email_bp.route("/unread")
+def get_unread():
+    """
+    Get one page of unread threads. Takes `pageSize` and the opaque `cursor`
+    from the previous page's `nextCursor`. The ETag follows the mailbox
+    historyId, so a matching If-None-Match gets a 304 without loading anything.
+    """
+    page_size = min(max(request.args.get("pageSize", UNREAD_PAGE_SIZE, type=int), 1), UNREAD_MAX_PAGE_SIZE)
     try:
-        token_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "token.json")
-        print(f"Checking token at path: {token_path}")
-        
-        if not os.path.exists(token_path):
-            print("Token file does not exist")
-            return jsonify({"success": True, "authenticated": False})
-            
-        creds = Credentials.from_authorized_user_file(token_path, SCOPES)
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                print("Token expired, attempting refresh")
-                creds.refresh(Request())
-                # Save refreshed credentials
-                with open(token_path, 'w') as token:
-                    token.write(creds.to_json())
-                return jsonify({"success": True, "authenticated": True})
-            print("Invalid credentials")
-            return jsonify({"success": True, "authenticated": False})
-            
-        print("Valid credentials found")
-        return jsonify({"success": True, "authenticated": True})
+        page_token = decode_cursor(request.args.get("cursor"))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    try:
+        with stage("auth"):
+            creds = setup_authentication()
+        with stage("mailbox_version"):
+            history_id = run_async(mailbox_version.current(creds))
+        etag = unread_etag(history_id, page_token, page_size)
+        if request.if_none_match.contains_weak(etag):
+            record_cache("unread_etag", True)
+            response = make_response("", 304)
+        else:
+            record_cache("unread_etag", False)
+            page = unread_pages.get(history_id, page_token, page_size)
+            if page is None:
+                with stage("gmail_fetch"):
+                    page = run_async(get_unread_page_async(creds, page_size, page_token))
+                unread_pages.put(history_id, page_token, page_size, page)
+            messages, next_page_token = page
+            response = jsonify({
+                "success": True,
+                "messages": messages,
+                "threadCount": len(messages),
+                "nextCursor": encode_cursor(next_page_token),
+            })
+        response.set_etag(etag, weak=True)
+        # Cacheable, but always revalidated; browsers then send If-None-Match themselves
+        response.headers['Cache-Control'] = "private, no-cache"
+        return response
+    except UpstreamUnavailableError:
+        raise
     except Exception as e:
-        print(f"Error in check_auth: {str(e)}")
         return jsonify({"success": False, "error": str(e)}), 500
 
-@email_bp.route("/unread")
-def get_unread():
-    """Get unread emails."""
+@email_bp.route("/changes")
+def stream_changes():
+    """
+    Server-sent events for the unread list (see changes.py): "ready" on connect,
+    "change" with added/read/removed deltas, and "resync" when the client should
+    reload /unread. Reconnects resume after Last-Event-ID.
+    """
+    try:
+        with stage("auth"):
+            creds = setup_authentication()
+        stream = change_feed.subscribe(creds, request.headers.get("Last-Event-ID"))
+    except UpstreamUnavailableError:
+        raise
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+    if stream is None:
+        response = jsonify({"success": False, "error": "Too many open change streams"})
+        response.status_code = 503
+        response.headers['Retry-After'] = "30"
+        return response
+    response = Response(change_feed.events(stream), mimetype="text/event-stream")
+    response.headers['Cache-Control'] = "no-cache"
+    # Tell nginx-style proxies not to buffer the stream
+    response.headers['X-Accel-Buffering'] = "no"
+    return response
+
+@email_bp.route("/notifications", methods=["POST"])
+def gmail_notification():
+    """Gmail watch notification pushed by Cloud Pub/Sub (?token=PUBSUB_VERIFICATION_TOKEN)."""
+    if not PUBSUB_VERIFICATION_TOKEN:
+        abort(404)
+    if not hmac.compare_digest(request.args.get("token", "").encode(), PUBSUB_VERIFICATION_TOKEN.encode()):
+        return jsonify({"success": False, "error": "Unauthorized"}), 401
+    try:
+        history_id = parse_push_message(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    change_feed.notify(history_id)
+    return "", 204
+
+@email_bp.route("/search")
+def search_emails():
+    """Search the local mail index. Supports prefix matching on the last word."""
     try:
-        creds = setup_authentication()
-        service = build("gmail", "v1", credentials=creds)
-        messages = get_recent_unread_messages(service)
-        return jsonify({"success": True, "messages": messages})
+        query = request.args.get("q", "").strip()
+        limit = min(max(request.args.get("limit", 20, type=int), 1), 100)
+        offset = max(request.args.get("offset", 0, type=int), 0)
+        page = search_index.search(query, limit=limit, offset=offset)
+        return jsonify({"success": True, "results": page['results'], "nextOffset": page['nextOffset']})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -68,78 +172,173 @@ def get_unread():
 def generate_email_reply():
     """Generate a reply for a specific email."""
     try:
-        print("Starting generate_email_reply...")
         data = request.get_json()
-        print(f"Received data: {data}")
         
         email_id = data.get("emailId")
         user_context = data.get("userContext", "")
         user_name = data.get("userName", "User")
+        force = bool(data.get("force", False))
+        fresh = bool(data.get("fresh", False))
         
-        print(f"Email ID: {email_id}")
-        print(f"User context: {user_context}")
-        print(f"User name: {user_name}")
+        # Never log the user context or email content; ids and sizes only
+        logger.debug("Generating reply", extra={"fields": {
+            "email_id": email_id, "user_context_chars": len(user_context), "fresh": fresh, "force": force
+        }})
         
         if not email_id:
-            print("Error: Email ID is required")
             return jsonify({"success": False, "error": "Email ID is required"}), 400
+        tracing.set_attribute("email_id", email_id)
         
-        print("Setting up authentication...")
-        creds = setup_authentication()
-        service = build("gmail", "v1", credentials=creds)
+        with stage("auth"):
+            creds = setup_authentication()
+            service = build_gmail_service(creds)
         
-        print(f"Fetching email details for ID: {email_id}")
         # Get email details with full format to include the body
-        email_detail = service.users().messages().get(
-            userId='me', id=email_id, format='full'
-        ).execute()
+        with stage("gmail_fetch"):
+            email_detail = service.users().messages().get(
+                userId='me', id=email_id, format='full'
+            ).execute()
         
         # Add required fields to email_detail
         headers = email_detail.get('payload', {}).get('headers', [])
         email_detail['subject'] = next((h['value'] for h in headers if h['name'].lower() == 'subject'), "No Subject")
-        print(f"Email subject: {email_detail['subject']}")
+        
+        # Automated mail (newsletters, notifications, no-reply senders) does not
+        # get an LLM reply unless the client explicitly asks for one. Only the
+        # header heuristics can refuse; the model's label is too noisy for that.
+        with stage("triage"):
+            triage = classify_message(email_detail)
+        if is_certainly_automated(triage) and not force:
+            logger.info("Skipping reply generation for automated email",
+                        extra={"fields": {"email_id": email_id, "reason": triage['reason']}})
+            return jsonify({
+                "success": False,
+                "error": "This email looks automated and does not need a reply",
+                "triage": triage['label'],
+                "reason": triage['reason']
+            }), 422
         
         # Extract and decode email body
-        try:
-            body = ""
-            if 'parts' in email_detail.get('payload', {}):
-                for part in email_detail['payload']['parts']:
-                    if part.get('mimeType') == 'text/plain':
-                        body = part.get('body', {}).get('data', '')
-                        break
-            elif 'body' in email_detail.get('payload', {}):
-                body = email_detail['payload']['body'].get('data', '')
+        with stage("body_decode"):
+            email_detail['body'] = get_message_body(email_detail)
+        if not email_detail['body']:
+            logger.warning("No email body found", extra={"fields": {"email_id": email_id}})
+        
+        # Templates, sent-history examples and the model tier are the signed-in
+        # user's; a userId in the body is ignored
+        with stage("auth"):
+            user_id = authenticated_user_id()
+        
+        # Routine mail is answered from the user's saved templates without Gemini
+        from_header = next((h['value'] for h in headers if h['name'].lower() == 'from'), "")
+        if user_id and not fresh:
+            try:
+                with stage("template_match"):
+                    template_match = template_engine.render_reply(
+                        user_id, email_detail['subject'], email_detail['body'], from_header, user_name
+                    )
+            except Exception as e:
+                logger.warning("Error matching email templates: %s", e)
+                template_match = None
+            record_cache("template", bool(template_match))
+            if template_match:
+                template, reply, score = template_match
+                logger.info("Using template", extra={"fields": {"template_id": template.id, "similarity": round(score, 3)}})
+                return jsonify({
+                    "success": True,
+                    "reply": reply,
+                    "source": "template",
+                    "templateId": template.id,
+                    "similarity": score
+                })
+        
+        # Offer the reply sent to a near-identical email instead of a new generation
+        sender_name = sender_display_name(headers)
+        if not fresh:
+            with stage("near_duplicate"):
+                match = answered_index.query(email_detail['body'])
+            record_cache("near_duplicate", bool(match))
+            if match:
+                entry, similarity = match
+                logger.info("Reusing reply from near-duplicate email", extra={"fields": {
+                    "matched_message_id": entry.message_id, "similarity": round(similarity, 3)
+                }})
+                return jsonify({
+                    "success": True,
+                    "reply": adapt_reply(entry, sender_name, email_detail['subject']),
+                    "source": "near_duplicate",
+                    "matchedMessageId": entry.message_id,
+                    "similarity": similarity
+                })
+        
+        def generate():
+            # Summarize the earlier messages in the thread
+            try:
+                with stage("thread_context"):
+                    thread_summary = thread_context_service.get_summary(
+                        service, email_detail.get('threadId'), exclude_message_id=email_id
+                    )
+            except Exception as e:
+                logger.warning("Error loading thread context: %s", e)
+                thread_summary = ""
+            
+            # Similar past replies from the user's sent history, as style examples
+            examples = []
+            if user_id:
+                try:
+                    with stage("few_shot"):
+                        examples = few_shot_retriever.examples(user_id, email_detail['subject'], email_detail['body'])
+                except Exception as e:
+                    logger.warning("Error loading few-shot examples: %s", e)
             
-            if body:
-                import base64
-                body = base64.urlsafe_b64decode(body.encode('ASCII')).decode('utf-8')
-                print("Successfully extracted email body")
-            else:
-                print("Warning: No email body found")
-                body = email_detail.get('snippet', '')
-        except Exception as e:
-            print(f"Error extracting email body: {str(e)}")
-            body = email_detail.get('snippet', '')
-        
-        email_detail['body'] = body
-        
-        print("Generating reply...")
-        # Generate reply
-        gemini_context = f"You are helping {user_name} write professional email replies."
-        reply = generate_reply(
-            service=service,
-            email_detail=email_detail,
-            gemini_context=gemini_context,
-            user_context=user_context,
-            user_name=user_name
+            gemini_context = f"You are helping {user_name} write professional email replies."
+            return generate_reply(
+                service=service,
+                email_detail=email_detail,
+                gemini_context=gemini_context,
+                user_context=user_context,
+                user_name=user_name,
+                thread_summary=thread_summary,
+                examples=examples,
+                thread_depth=max(1, thread_context_service.message_count(email_detail.get('threadId'))),
+                user_tier=model_router.user_tier(user_id)
+            )
+        
+        # Repeated or concurrent requests for the same thread share one generation
+        reply = reply_deduplicator.run(
+            (email_detail.get('threadId', email_id), email_id, user_id, user_name, user_context),
+            generate,
+            should_cache=lambda text: not text.startswith("Error"),
+            fresh=fresh
         )
         
-        print("Reply generated successfully")
-        return jsonify({"success": True, "reply": reply})
+        return jsonify({"success": True, "reply": reply, "source": "generated"})
+    except UpstreamUnavailableError:
+        raise
+    except Exception as e:
+        logger.exception("Error generating reply")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@email_bp.route("/edit-reply", methods=["POST"])
+def edit_email_reply():
+    """Apply an edit instruction to a draft reply without regenerating it."""
+    try:
+        data = request.get_json()
+        draft = data.get("draft")
+        instruction = data.get("instruction", "").strip()
+        
+        if not draft or not instruction:
+            return jsonify({"success": False, "error": "Draft and instruction are required"}), 400
+        
+        reply, method = edit_draft(draft, instruction)
+        record_cache("local_edit", method == "local")
+        return jsonify({"success": True, "reply": reply, "source": method})
+    except UpstreamUnavailableError:
+        raise
+    except RevisionError as e:
+        # Gemini answered, but not with an edit that fits the draft
+        return jsonify({"success": False, "error": str(e)}), 502
     except Exception as e:
-        print(f"Error generating reply: {str(e)}")
-        print(f"Error type: {type(e)}")
-        print(f"Error traceback: {traceback.format_exc()}")
         return jsonify({"success": False, "error": str(e)}), 500
 
 @email_bp.route("/send-reply", methods=["POST"])
@@ -152,14 +351,49 @@ def send_email_reply():
         
         if not email_id or not reply_text:
             return jsonify({"success": False, "error": "Email ID and reply text are required"}), 400
+        tracing.set_attribute("email_id", email_id)
         
-        creds = setup_authentication()
-        service = build("gmail", "v1", credentials=creds)
+        with stage("auth"):
+            creds = setup_authentication()
+            service = build_gmail_service(creds)
+            # Sent replies become few-shot examples for the signed-in user only
+            user_id = authenticated_user_id()
         
-        success, result = send_reply(service, 'me', email_id, reply_text)
+        with stage("gmail_fetch"):
+            original_msg = service.users().messages().get(userId='me', id=email_id, format='full').execute()
+        with stage("gmail_send"):
+            success, result = send_api_reply(service, 'me', email_id, reply_text, original_msg=original_msg)
         if success:
+            # The mailbox changed; don't let /unread keep serving the old version
+            mailbox_version.invalidate()
+            # Remember the answer so near-identical emails can reuse it
+            headers = original_msg.get('payload', {}).get('headers', [])
+            subject = next((h['value'] for h in headers if h['name'].lower() == 'subject'), "")
+            answered_index.add(
+                email_id, get_message_body(original_msg), reply_text,
+                sender_name=sender_display_name(headers), subject=subject
+            )
+            # Record the sent reply so it can serve as a few-shot example later
+            if user_id:
+                try:
+                    from_header = next((h['value'] for h in headers if h['name'].lower() == 'from'), "")
+                    with stage("record_history"):
+                        history = run_async(DatabaseService.create_email_history(
+                            user_id, result, subject, reply_text, from_header
+                        ))
+                        few_shot_retriever.add(user_id, history)
+                except Exception as e:
+                    logger.warning("Error recording email history: %s", e)
             return jsonify({"success": True, "messageId": result})
         else:
             return jsonify({"success": False, "error": result}), 500
+    except UpstreamUnavailableError:
+        raise
     except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500 
\ No newline at end of file
+        return jsonify({"success": False, "error": str(e)}), 500
+
+def sender_display_name(headers):
+    """Return the display name (or address) from the From header."""
+    from_header = next((h['value'] for h in headers if h['name'].lower() == 'from'), "")
+    name, address = parseaddr(from_header)
+    return name or address.split('@')[0]
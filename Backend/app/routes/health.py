@@ -0,0 +1,28 @@
+import os
+from flask import Blueprint, jsonify
+from ..lifecycle import inflight
+from ..resilience import BREAKERS
+
+health_bp = Blueprint("health", __name__)
+
+@health_bp.route("/healthz")
+def healthz():
+    """Liveness: the process is up and serving requests."""
+    return jsonify({"status": "ok"})
+
+@health_bp.route("/readyz")
+def readyz():
+    """Readiness: configured and not shutting down."""
+    checks = {
+        "accepting_requests": not inflight.draining,
+        "gemini_api_key": bool(os.getenv("GEMINI_API_KEY")),
+        "supabase": bool(os.getenv("SUPABASE_URL") and os.getenv("SUPABASE_KEY")),
+    }
+    ready = all(checks.values())
+    return jsonify({
+        "status": "ready" if ready else "not_ready",
+        "checks": checks,
+        "inflight": inflight.count,
+        # Informational: an open breaker degrades features but does not fail readiness
+        "breakers": {name: breaker.state for name, breaker in BREAKERS.items()}
+    }), 200 if ready else 503
@@ -0,0 +1,33 @@
+from flask import Blueprint, Response
+from ..changes import change_feed
+from ..lifecycle import inflight
+from ..log import dropped_records
+from ..metrics import register_gauge, registry
+from ..resilience import BREAKERS, OPEN, HALF_OPEN
+
+metrics_bp = Blueprint("metrics", __name__)
+
+BREAKER_STATE_VALUES = {OPEN: 1.0, HALF_OPEN: 0.5}
+
+register_gauge(
+    "smartmail_circuit_breaker_state", "Circuit breaker state (0 closed, 0.5 half-open, 1 open).",
+    ["dependency"],
+    lambda: [((name,), BREAKER_STATE_VALUES.get(b.state, 0.0)) for name, b in BREAKERS.items()]
+)
+register_gauge(
+    "smartmail_inflight_generations", "Gemini calls currently in flight.", [],
+    lambda: [((), inflight.count)]
+)
+register_gauge(
+    "smartmail_change_streams", "Open unread-list change streams in this worker.", [],
+    lambda: [((), change_feed.stream_count)]
+)
+register_gauge(
+    "smartmail_log_records_dropped", "Log records dropped because the log queue was full.", [],
+    lambda: [((), dropped_records())]
+)
+
+@metrics_bp.route("/metrics")
+def metrics():
+    """Prometheus scrape endpoint."""
+    return Response(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
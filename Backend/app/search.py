@@ -0,0 +1,250 @@
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+SEARCH_INDEX_PATH = os.getenv(
+    "SEARCH_INDEX_PATH", os.path.join(os.path.dirname(__file__), "search_index.db")
+)
+
+# bm25 column weights: subject, sender, recipients, snippet, body
+BM25_WEIGHTS = (5.0, 3.0, 1.0, 2.0, 1.0)
+# Queries matching more than this many messages are returned newest first
+# instead of by relevance. bm25 reads every posting of every query term, so
+# ranking a term that is in most of the mailbox is what makes search slow.
+SEARCH_RANK_WINDOW = int(os.getenv("SEARCH_RANK_WINDOW", "1000"))
+
+# Bump when the schema changes; the index is a cache and is rebuilt from scratch
+SCHEMA_VERSION = 3
+
+# Rowids are derived from the message date (ms * 1024 plus a slot), so FTS5's
+# rowid order is date order and "newest first" needs no sort
+DATE_SLOTS = 1024
+
+DROP_SCHEMA = """
+DROP TABLE IF EXISTS message_fts;
+DROP TABLE IF EXISTS message_docs;
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS message_docs (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    thread_id TEXT,
+    subject TEXT,
+    sender TEXT,
+    recipients TEXT,
+    snippet TEXT,
+    body TEXT,
+    date INTEGER,
+    unread INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS message_docs_thread ON message_docs(thread_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS message_fts USING fts5(
+    subject, sender, recipients, snippet, body,
+    content='message_docs', content_rowid='rowid',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS message_docs_ai AFTER INSERT ON message_docs BEGIN
+    INSERT INTO message_fts(rowid, subject, sender, recipients, snippet, body)
+    VALUES (new.rowid, new.subject, new.sender, new.recipients, new.snippet, new.body);
+END;
+CREATE TRIGGER IF NOT EXISTS message_docs_ad AFTER DELETE ON message_docs BEGIN
+    INSERT INTO message_fts(message_fts, rowid, subject, sender, recipients, snippet, body)
+    VALUES ('delete', old.rowid, old.subject, old.sender, old.recipients, old.snippet, old.body);
+END;
+CREATE TRIGGER IF NOT EXISTS message_docs_au
+AFTER UPDATE OF subject, sender, recipients, snippet, body ON message_docs BEGIN
+    INSERT INTO message_fts(message_fts, rowid, subject, sender, recipients, snippet, body)
+    VALUES ('delete', old.rowid, old.subject, old.sender, old.recipients, old.snippet, old.body);
+    INSERT INTO message_fts(rowid, subject, sender, recipients, snippet, body)
+    VALUES (new.rowid, new.subject, new.sender, new.recipients, new.snippet, new.body);
+END;
+"""
+
+UPDATE = """
+UPDATE message_docs SET
+    thread_id = :threadId, subject = :subject, sender = :from, recipients = :to,
+    snippet = :snippet, body = COALESCE(:body, body)
+WHERE id = :id AND (subject IS NOT :subject OR snippet IS NOT :snippet OR body IS NOT COALESCE(:body, body))
+"""
+# A NULL body has not been loaded yet (see set_bodies)
+UPDATE_BODY = "UPDATE message_docs SET body = :body WHERE id = :id AND body IS NOT :body"
+# Read state lives outside the full-text columns, so changing it does not reindex
+UPDATE_UNREAD = "UPDATE message_docs SET unread = :unread WHERE id = :id AND unread IS NOT :unread"
+# New messages take the first free slot after their date's base rowid. Messages
+# without a date share the range below any real date.
+INSERT = """
+INSERT OR IGNORE INTO message_docs (rowid, id, thread_id, subject, sender, recipients, snippet, body, date,
+                                     unread)
+VALUES (
+    (SELECT COALESCE(MAX(rowid) + 1, :key) FROM message_docs WHERE rowid BETWEEN :key AND :key + :span),
+    :id, :threadId, :subject, :from, :to, :snippet, :body, :date, :unread
+)
+"""
+
+SEARCH = """
+SELECT d.id, d.thread_id, d.subject, d.sender, d.recipients, d.snippet, d.date, d.unread,
+       bm25(message_fts, {weights}) AS rank
+FROM message_fts JOIN message_docs d ON d.rowid = message_fts.rowid
+WHERE message_fts MATCH :query
+ORDER BY rank
+LIMIT :limit OFFSET :offset
+""".format(weights=", ".join(str(w) for w in BM25_WEIGHTS))
+# FTS5 walks matches in rowid (= date) order without sorting or scoring them
+NEWEST_MATCHES = """
+SELECT rowid FROM message_fts WHERE message_fts MATCH :query ORDER BY rowid DESC LIMIT :limit
+"""
+DOCS_BY_ROWID = """
+SELECT id, thread_id, subject, sender, recipients, snippet, date, unread, NULL
+FROM message_docs WHERE rowid IN ({}) ORDER BY rowid DESC
+"""
+
+# Prefixes shorter than this are ordered by recency rather than relevance
+MIN_RANKED_PREFIX = 3
+
+def build_match_query(text: str) -> Optional[str]:
+    """
+    Turn free text into an FTS5 query: every word must match and the last
+    word is a prefix, so results update as the user types. A trailing
+    single character is ignored until the next keystroke.
+    """
+    words = re.findall(r'\w+', text, re.UNICODE)
+    if words and len(words[-1]) < 2:
+        words.pop()
+    if not words:
+        return None
+    terms = [f'"{w}"' for w in words]
+    terms[-1] += '*'
+    return " ".join(terms)
+
+class SearchIndex:
+    """
+    Local full-text index over fetched mail, backed by SQLite FTS5. Messages
+    are added as the unread list is fetched and stay searchable once read;
+    `unread` in the results tracks their state. Each thread gets its own
+    connection; WAL mode lets searches run while the fetch path writes.
+    """
+    def __init__(self, path: str = SEARCH_INDEX_PATH, rank_window: int = SEARCH_RANK_WINDOW):
+        self.path = path
+        self.rank_window = rank_window
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._schema_lock:
+                if not self._schema_ready:
+                    if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                        conn.executescript(DROP_SCHEMA)
+                        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                    conn.executescript(SCHEMA)
+                    self._schema_ready = True
+            self._local.conn = conn
+        return conn
+
+    def upsert_many(self, messages: Iterable[Dict[str, Any]]) -> None:
+        """
+        Add or refresh messages; unchanged rows are left untouched. Records
+        without a 'body' keep the body already indexed, if any.
+        """
+        rows = [{
+            'id': m['id'],
+            'threadId': m.get('threadId'),
+            'subject': m.get('subject', ''),
+            'from': m.get('from', ''),
+            'to': m.get('to', ''),
+            'snippet': m.get('snippet', ''),
+            'body': m.get('body'),
+            'date': m.get('date'),
+            'unread': int(m.get('unread', True)),
+            'key': m['date'] * DATE_SLOTS if m.get('date') else 0,
+            'span': DATE_SLOTS - 1 if m.get('date') else 2 ** 40,
+        } for m in messages]
+        if not rows:
+            return
+        conn = self._connection()
+        with conn:
+            conn.executemany(UPDATE, rows)
+            conn.executemany(UPDATE_UNREAD, rows)
+            conn.executemany(INSERT, rows)
+
+    def delete(self, message_ids: Iterable[str]) -> None:
+        conn = self._connection()
+        with conn:
+            conn.executemany("DELETE FROM message_docs WHERE id = ?", [(i,) for i in message_ids])
+
+    def set_bodies(self, bodies: Dict[str, str]) -> None:
+        """Add the bodies of messages indexed without one."""
+        conn = self._connection()
+        with conn:
+            conn.executemany(UPDATE_BODY, [{'id': i, 'body': b} for i, b in bodies.items()])
+
+    def without_body(self, message_ids: Iterable[str]) -> List[str]:
+        """The ids among `message_ids` whose body is not indexed yet."""
+        ids = list(message_ids)
+        if not ids:
+            return []
+        conn = self._connection()
+        loaded = {row[0] for row in conn.execute(
+            f"SELECT id FROM message_docs WHERE body IS NOT NULL AND id IN ({', '.join('?' * len(ids))})", ids
+        )}
+        return [i for i in ids if i not in loaded]
+
+    def mark_threads_read(self, thread_ids: Iterable[str]) -> None:
+        """Record that every indexed message of these threads has been read; they stay searchable."""
+        conn = self._connection()
+        with conn:
+            conn.executemany("UPDATE message_docs SET unread = 0 WHERE thread_id = ? AND unread != 0",
+                             [(i,) for i in thread_ids])
+
+    def delete_threads(self, thread_ids: Iterable[str]) -> None:
+        """Drop every indexed message of these threads, once they are deleted, trashed or spam."""
+        conn = self._connection()
+        with conn:
+            conn.executemany("DELETE FROM message_docs WHERE thread_id = ?", [(i,) for i in thread_ids])
+
+    def search(self, text: str, limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+        """
+        Search with offset pagination. Results are ranked by relevance when the
+        query matches at most `rank_window` messages; broader queries, and
+        prefixes shorter than MIN_RANKED_PREFIX, are returned newest first by
+        message date with a null score.
+        Returns the page of results and the offset of the next page (or None).
+        """
+        query = build_match_query(text)
+        if not query:
+            return {'results': [], 'nextOffset': None}
+        conn = self._connection()
+        last_word = query.rsplit(' ', 1)[-1].strip('"*')
+        if len(last_word) >= MIN_RANKED_PREFIX:
+            newest_limit = max(self.rank_window, offset + limit) + 1
+        else:
+            newest_limit = offset + limit + 1
+        rowids = [row[0] for row in conn.execute(NEWEST_MATCHES, {'query': query, 'limit': newest_limit})]
+
+        if len(last_word) >= MIN_RANKED_PREFIX and len(rowids) <= self.rank_window:
+            rows = conn.execute(SEARCH, {'query': query, 'limit': limit + 1, 'offset': offset}).fetchall()
+        else:
+            page = rowids[offset:offset + limit + 1]
+            rows = conn.execute(DOCS_BY_ROWID.format(", ".join("?" * len(page))), page).fetchall() if page else []
+        results = [{
+            'id': row[0],
+            'threadId': row[1],
+            'subject': row[2],
+            'from': row[3],
+            'to': row[4],
+            'snippet': row[5],
+            'date': row[6],
+            'unread': bool(row[7]),
+            'score': -row[8] if row[8] is not None else None,
+        } for row in rows[:limit]]
+        return {'results': results, 'nextOffset': offset + limit if len(rows) > limit else None}
+
+search_index = SearchIndex()
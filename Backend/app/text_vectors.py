@@ -0,0 +1,93 @@
+import re
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, List, Set
+
+import numpy as np
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+
+# Words that carry no signal for matching mail against replies
+STOP_WORDS = frozenset("""
+a an and are as at be but by for from has have hi hello i if in is it its me my of on or our
+so that the their them there this to us was we were will with you your dear regards best thanks
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_PATTERN.findall(text.lower()) if t not in STOP_WORDS]
+
+class TfidfVectorizer:
+    """
+    Minimal TF-IDF vectorizer producing L2-normalized dense NumPy rows, so
+    cosine similarity against a fitted matrix is a single matrix product.
+    Terms outside the vocabulary have no column but still count toward a
+    row's norm, weighted like a term no fitted document contains.
+    """
+    def __init__(self):
+        self.vocabulary: Dict[str, int] = {}
+        self.idf = np.zeros(0, dtype=np.float32)
+        self.unseen_idf = 1.0
+
+    def fit_transform(self, documents: Iterable[str]) -> np.ndarray:
+        tokenized = [tokenize(doc) for doc in documents]
+        for tokens in tokenized:
+            for token in tokens:
+                self.vocabulary.setdefault(token, len(self.vocabulary))
+
+        doc_freq = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for tokens in tokenized:
+            for token in set(tokens):
+                doc_freq[self.vocabulary[token]] += 1
+        # Smoothed idf, as if one extra document contained every term
+        self.idf = np.log((1 + len(tokenized)) / (1 + doc_freq)) + 1
+        self.unseen_idf = float(np.log(1 + len(tokenized)) + 1)
+        return self._transform_tokens(tokenized)
+
+    def transform(self, documents: Iterable[str]) -> np.ndarray:
+        return self._transform_tokens([tokenize(doc) for doc in documents])
+
+    def _transform_tokens(self, tokenized: List[List[str]]) -> np.ndarray:
+        matrix = np.zeros((len(tokenized), len(self.vocabulary)), dtype=np.float32)
+        unseen = np.zeros((len(tokenized), 1), dtype=np.float32)
+        for row, tokens in enumerate(tokenized):
+            unknown = Counter()
+            for token in tokens:
+                column = self.vocabulary.get(token)
+                if column is not None:
+                    matrix[row, column] += 1
+                else:
+                    unknown[token] += 1
+            unseen[row] = sum(count * count for count in unknown.values())
+        matrix *= self.idf
+        norms = np.sqrt((matrix * matrix).sum(axis=1, keepdims=True) + unseen * self.unseen_idf ** 2)
+        norms[norms == 0] = 1
+        return matrix / norms
+
+    def known_terms(self, text: str) -> Set[str]:
+        """Distinct terms of `text` that appear in the vocabulary."""
+        return {token for token in tokenize(text) if token in self.vocabulary}
+
+class HashingVectorizer:
+    """
+    Stateless word unigram + bigram hashing into a fixed number of features.
+    Rows never change size as documents are added, so they can be appended
+    to a memory-mapped file. A hash-derived sign keeps collisions unbiased.
+    """
+    def __init__(self, n_features: int = 1024):
+        self.n_features = n_features
+
+    def transform(self, documents: Iterable[str]) -> np.ndarray:
+        documents = list(documents)
+        matrix = np.zeros((len(documents), self.n_features), dtype=np.float32)
+        for row, doc in enumerate(documents):
+            tokens = tokenize(doc)
+            grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+            for gram in grams:
+                h = zlib.crc32(gram.encode('utf-8'))
+                matrix[row, h % self.n_features] += 1.0 if h & 0x80000000 else -1.0
+        return l2_normalize(matrix)
+
+def l2_normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
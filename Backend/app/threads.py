@@ -0,0 +1,236 @@
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parseaddr
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from .email_assistant import get_message_body
+from .metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+# Headers requested when loading a thread in metadata format
+THREAD_METADATA_HEADERS = ['From', 'Date', 'Subject']
+
+class ThreadSummary:
+    def __init__(self, thread_id: str):
+        self.thread_id = thread_id
+        self.history_id: Optional[str] = None
+        self.seen_ids: set = set()
+        # Ordered (message_id, sender, line) tuples, oldest first
+        self.entries: List[tuple] = []
+        # Number of old entries folded into the "earlier messages" line
+        self.folded_count = 0
+        self.folded_senders: List[str] = []
+
+    def add_entry(self, message_id: str, sender: str, line: str) -> None:
+        if message_id in self.seen_ids:
+            return
+        self.seen_ids.add(message_id)
+        self.entries.append((message_id, sender, line))
+
+    def fold(self, message_id: str, sender: str) -> None:
+        """Count a message straight into the "earlier messages" line without summarizing it."""
+        if message_id in self.seen_ids:
+            return
+        self.seen_ids.add(message_id)
+        self._fold_sender(sender)
+
+    def _fold_sender(self, sender: str) -> None:
+        self.folded_count += 1
+        if sender not in self.folded_senders and len(self.folded_senders) < 5:
+            self.folded_senders.append(sender)
+
+    def compact(self, max_chars: int) -> None:
+        """Fold the oldest entries away until the summary fits in `max_chars`."""
+        while len(self.entries) > 1 and sum(len(line) + 1 for _, _, line in self.entries) > max_chars:
+            _, sender, _ = self.entries.pop(0)
+            self._fold_sender(sender)
+
+    def render(self, exclude_message_id: Optional[str] = None) -> str:
+        lines = []
+        if self.folded_count:
+            lines.append(f"- {self.folded_count} earlier message(s) from {', '.join(self.folded_senders)}")
+        lines.extend(line for message_id, _, line in self.entries if message_id != exclude_message_id)
+        return "\n".join(lines)
+
+class ThreadContextService:
+    """
+    Keeps a rolling, size-bounded summary per Gmail thread.
+    Threads are loaded in metadata format; message bodies are only fetched for
+    messages that have not been summarized yet, newest first, and only until
+    the summary budget is spent. Older messages are just counted, so both the
+    prompt and the Gmail cost of a thread stay flat no matter how long it gets.
+    """
+    def __init__(self, max_threads: int = 500, max_summary_chars: int = 1200, max_entry_chars: int = 240):
+        self.max_threads = max_threads
+        self.max_summary_chars = max_summary_chars
+        self.max_entry_chars = max_entry_chars
+        self._summaries: "OrderedDict[str, ThreadSummary]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_summary(self, service, thread_id: str, exclude_message_id: Optional[str] = None,
+                    user_id: str = "me") -> str:
+        """
+        Return a compact digest of the thread, leaving out `exclude_message_id`
+        (normally the message being replied to, which goes into the prompt in full).
+        """
+        if not thread_id:
+            return ""
+
+        thread = service.users().threads().get(
+            userId=user_id, id=thread_id, format='metadata',
+            metadataHeaders=THREAD_METADATA_HEADERS
+        ).execute()
+
+        summary = self._get_or_create(thread_id)
+        with self._lock:
+            unchanged = summary.history_id == thread.get('historyId')
+            unseen = [m for m in thread.get('messages', []) if m['id'] not in summary.seen_ids]
+            if unchanged:
+                record_cache("thread_summary", True)
+                return summary.render(exclude_message_id)
+        record_cache("thread_summary", False)
+
+        # Gmail lists thread messages oldest first. Summarize from the newest
+        # back until the budget is spent; anything older would be folded away
+        # by compact() anyway, so its body is never fetched.
+        budget = self.max_summary_chars
+        loaded = []
+        for message in reversed(unseen):
+            sender = self._sender_name(message)
+            if budget <= 0:
+                loaded.append((message['id'], sender, None))
+                continue
+            if message['id'] == exclude_message_id:
+                # The reply target is summarized from its snippet only; its full
+                # body is already part of the prompt.
+                gist = message.get('snippet', '')
+            else:
+                gist = self._load_gist(service, message['id'], user_id, message.get('snippet', ''))
+            line = self._format_entry(sender, gist)
+            budget -= len(line) + 1
+            loaded.append((message['id'], sender, line))
+
+        with self._lock:
+            for message_id, sender, line in reversed(loaded):
+                if line is None:
+                    summary.fold(message_id, sender)
+                else:
+                    summary.add_entry(message_id, sender, line)
+            summary.history_id = thread.get('historyId')
+            summary.compact(self.max_summary_chars)
+            return summary.render(exclude_message_id)
+
+    def message_count(self, thread_id: str) -> int:
+        """Number of messages seen in the thread by the last get_summary call."""
+        with self._lock:
+            summary = self._summaries.get(thread_id)
+            return len(summary.seen_ids) if summary else 0
+
+    def invalidate(self, thread_id: str) -> None:
+        with self._lock:
+            self._summaries.pop(thread_id, None)
+
+    def _get_or_create(self, thread_id: str) -> ThreadSummary:
+        with self._lock:
+            summary = self._summaries.get(thread_id)
+            if summary is None:
+                summary = ThreadSummary(thread_id)
+                self._summaries[thread_id] = summary
+                if len(self._summaries) > self.max_threads:
+                    self._summaries.popitem(last=False)
+            else:
+                self._summaries.move_to_end(thread_id)
+            return summary
+
+    def _load_gist(self, service, message_id: str, user_id: str, fallback: str) -> str:
+        """Fetch one message body and reduce it to its new, unquoted text."""
+        try:
+            message = service.users().messages().get(
+                userId=user_id, id=message_id, format='full'
+            ).execute()
+            body = get_message_body(message)
+        except Exception as e:
+            logger.warning("Error loading thread message %s: %s", message_id, e)
+            body = fallback
+        return strip_quoted_text(body) or fallback
+
+    @staticmethod
+    def _sender_name(message: Dict) -> str:
+        headers = message.get('payload', {}).get('headers', [])
+        from_header = next((h['value'] for h in headers if h['name'].lower() == 'from'), "")
+        name, address = parseaddr(from_header)
+        return name or address or "Unknown"
+
+    def _format_entry(self, sender: str, gist: str) -> str:
+        gist = re.sub(r'\s+', ' ', gist).strip()
+        if len(gist) > self.max_entry_chars:
+            gist = gist[:self.max_entry_chars].rsplit(' ', 1)[0] + "..."
+        return f"- {sender}: {gist}"
+
+def strip_quoted_text(body: str) -> str:
+    """
+    Drop quoted replies ("> ..." lines and everything after an "On ... wrote:"
+    marker) so only the new part of a message is summarized.
+    """
+    lines = []
+    for line in body.splitlines():
+        stripped = line.strip()
+        if stripped.startswith('>'):
+            continue
+        if re.match(r'^On .+wrote:$', stripped) or stripped.startswith('-----Original Message-----'):
+            break
+        lines.append(stripped)
+    return " ".join(line for line in lines if line)
+
+class ReplyDeduplicator:
+    """
+    Collapses reply generations for the same thread.
+    Concurrent requests for the same key wait for the one already running, and
+    finished replies are reused for `ttl_seconds`. A `fresh` run skips the
+    cached reply and replaces it with the one it generates.
+    """
+    def __init__(self, ttl_seconds: float = 600, max_entries: int = 1000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._results: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._inflight: Dict[Hashable, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    def run(self, key: Hashable, generate: Callable[[], Any],
+            should_cache: Callable[[Any], bool] = lambda result: True, fresh: bool = False) -> Any:
+        while True:
+            with self._lock:
+                cached = None if fresh else self._results.get(key)
+                if cached and time.monotonic() - cached[0] < self.ttl_seconds:
+                    record_cache("reply_dedup", True)
+                    return cached[1]
+                event = self._inflight.get(key)
+                if event is None:
+                    event = threading.Event()
+                    self._inflight[key] = event
+                    break
+            # Another request is generating this reply; wait and re-check the cache.
+            # If that generation failed, the next loop iteration takes over.
+            event.wait()
+
+        record_cache("reply_dedup", False)
+        try:
+            result = generate()
+            if should_cache(result):
+                with self._lock:
+                    self._results[key] = (time.monotonic(), result)
+                    self._results.move_to_end(key)
+                    if len(self._results) > self.max_entries:
+                        self._results.popitem(last=False)
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+thread_context_service = ThreadContextService()
+reply_deduplicator = ReplyDeduplicator()
@@ -0,0 +1,235 @@
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Fraction of requests traced regardless of duration
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+# Requests at least this slow (or failing) are always exported
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "2000"))
+# "jsonl" (TRACE_JSONL_PATH), "otlp" (TRACE_OTLP_ENDPOINT) or "off"
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "jsonl").lower()
+TRACE_JSONL_PATH = os.getenv("TRACE_JSONL_PATH", os.path.join(os.path.dirname(__file__), "traces.jsonl"))
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+SERVICE_NAME = os.getenv("SERVICE_NAME", "smart-mail-backend")
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def finish(self) -> None:
+        self.end_ns = time.time_ns()
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+class Trace:
+    """
+    All spans of one request. Spans are kept in memory until the root ends;
+    the trace is then exported if it was sampled up front, was slow or failed.
+    """
+    def __init__(self, sampled: bool):
+        self.trace_id = uuid.uuid4().hex
+        self.sampled = sampled
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+def set_attribute(key: str, value: Any) -> None:
+    """Annotate the innermost active span, if the request is being traced."""
+    span = _current_span.get()
+    if span is not None:
+        span.attributes[key] = value
+
+def start_trace(name: str, **attributes):
+    """Open the root span of a request. Returns a token for end_trace."""
+    trace = Trace(sampled=random.random() < TRACE_SAMPLE_RATE)
+    root = Span(trace, name, None, attributes)
+    trace.add(root)
+    return _current_span.set(root)
+
+def end_trace(token, error: Optional[BaseException] = None) -> None:
+    root = _current_span.get()
+    _current_span.reset(token)
+    if root is None:
+        return
+    root.finish()
+    if error is not None:
+        root.error = repr(error)
+    failed = root.error is not None or int(root.attributes.get("http.status_code", 200)) >= 500
+    if root.trace.sampled or failed or root.duration_ms >= TRACE_SLOW_MS:
+        exporter.submit(root.trace)
+
+@contextmanager
+def span(name: str, **attributes):
+    """Child span of the current span. A no-op outside a traced request."""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, parent.span_id, attributes)
+    parent.trace.add(child)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = repr(e)
+        raise
+    finally:
+        child.finish()
+        _current_span.reset(token)
+
+def wrap(fn: Callable, name: Optional[str] = None) -> Callable:
+    """
+    Bind `fn` to the caller's context so it can run on another thread (an
+    executor, a worker thread) and still report into the current trace,
+    optionally as its own span.
+    """
+    context = copy_context()
+
+    def run(*args, **kwargs):
+        if name is None:
+            return fn(*args, **kwargs)
+        with span(name):
+            return fn(*args, **kwargs)
+
+    return lambda *args, **kwargs: context.copy().run(run, *args, **kwargs)
+
+# ---------------- Export ----------------
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def to_otlp(trace: Trace) -> Dict[str, Any]:
+    """OTLP/JSON ExportTraceServiceRequest for one trace."""
+    spans = []
+    for s in trace.spans:
+        spans.append({
+            "traceId": trace.trace_id,
+            "spanId": s.span_id,
+            "parentSpanId": s.parent_id or "",
+            "name": s.name,
+            "kind": 2 if s.parent_id is None else 1,  # SERVER for the root, INTERNAL otherwise
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns or s.start_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+            "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+        })
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+        "scopeSpans": [{"scope": {"name": "app.tracing"}, "spans": spans}],
+    }]}
+
+class JsonlSink:
+    """Appends one JSON line per span."""
+    def __init__(self, path: str = TRACE_JSONL_PATH):
+        self.path = path
+
+    def export(self, trace: Trace) -> None:
+        with open(self.path, "a") as f:
+            for s in trace.spans:
+                f.write(json.dumps(s.to_dict(), default=str) + "\n")
+
+class OtlpHttpSink:
+    """POSTs OTLP/JSON to a collector (see trace_collector.py for a local stand-in)."""
+    def __init__(self, endpoint: str = TRACE_OTLP_ENDPOINT, timeout: float = 2.0):
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    def export(self, trace: Trace) -> None:
+        import httpx
+        httpx.post(self.endpoint, json=to_otlp(trace), timeout=self.timeout).raise_for_status()
+
+class BackgroundExporter:
+    """Exports finished traces on a writer thread so requests never wait on I/O."""
+    def __init__(self, sink, max_queue: int = 1000):
+        self.sink = sink
+        self.max_queue = max_queue
+        self.dropped = 0
+        self._queue: Optional[queue.Queue] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _ensure_thread(self) -> queue.Queue:
+        # Started lazily, and again in each forked worker
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue(self.max_queue)
+                    threading.Thread(target=self._run, args=(self._queue,), name="trace-exporter",
+                                     daemon=True).start()
+                    self._pid = os.getpid()
+        return self._queue
+
+    def submit(self, trace: Trace) -> None:
+        if self.sink is None:
+            return
+        try:
+            self._ensure_thread().put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self, traces: queue.Queue) -> None:
+        while True:
+            trace = traces.get()
+            try:
+                self.sink.export(trace)
+            except Exception as e:
+                logger.warning("Trace export failed: %s", e)
+
+def make_sink(kind: str = TRACE_EXPORTER):
+    if kind == "jsonl":
+        return JsonlSink()
+    if kind == "otlp":
+        return OtlpHttpSink()
+    return None
+
+exporter = BackgroundExporter(make_sink())
@@ -0,0 +1,82 @@
+"""
+Cold-start regression check for create_app().
+
+Runs `python -X importtime` in fresh interpreters, reports the median import
+time of the app package and the slowest modules, and exits non-zero when the
+median is over the budget.
+
+    python benchmarks/import_time.py --runs 5 --budget-ms 1000
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BOOT_SNIPPET = "from app import create_app; create_app()"
+
+def parse_importtime(stderr: str):
+    """Return {module: (self_us, cumulative_us)} from -X importtime output."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+def measure_once():
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", BOOT_SNIPPET],
+        cwd=BACKEND_DIR, capture_output=True, text=True
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(f"create_app() failed:\n{result.stderr[-2000:]}")
+    return wall_ms, parse_importtime(result.stderr)
+
+def run(runs: int, top: int):
+    wall_times, app_times, samples = [], [], []
+    for _ in range(runs):
+        wall_ms, modules = measure_once()
+        wall_times.append(wall_ms)
+        app_times.append(modules.get("app", (0, 0))[1] / 1000)
+        samples.append(modules)
+    # Slowest modules of the median run, by cumulative time
+    median_run = samples[app_times.index(sorted(app_times)[len(app_times) // 2])]
+    slowest = sorted(median_run.items(), key=lambda item: item[1][1], reverse=True)[:top]
+    return {
+        "runs": runs,
+        "app_import_ms": round(statistics.median(app_times), 1),
+        "process_wall_ms": round(statistics.median(wall_times), 1),
+        "slowest": [{"module": name, "cumulative_ms": round(cum / 1000, 1)} for name, (_, cum) in slowest],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="how many slow modules to list")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", "1000")),
+                        help="fail when the median app import time exceeds this")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = parser.parse_args()
+
+    result = run(args.runs, args.top)
+    result["budget_ms"] = args.budget_ms
+    result["passed"] = result["app_import_ms"] <= args.budget_ms
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"create_app() import: {result['app_import_ms']} ms median over {args.runs} runs "
+              f"(process wall {result['process_wall_ms']} ms, budget {args.budget_ms:.0f} ms)")
+        for entry in result["slowest"]:
+            print(f"  {entry['cumulative_ms']:>8.1f} ms  {entry['module']}")
+    sys.exit(0 if result["passed"] else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Open-loop HTTP load generator for the Flask API.
+
+Requests arrive as a Poisson process at --rate per second, whether or not
+earlier ones have finished, so a slow server shows up as growing latency and
+errors instead of a politely reduced request rate. Latency is measured from
+each request's scheduled arrival time.
+
+Against a running server:
+
+    python benchmarks/loadtest.py --url http://localhost:8001 --rate 20 --duration 60
+
+Or let it start gunicorn (run.py) with the fake Gmail/Gemini backends and
+sweep worker counts and rates:
+
+    python benchmarks/loadtest.py --spawn --workers 1,2,4 --threads 8 --rate 10,20,40 --json out.json
+
+The route mix is set with --mix, e.g. check-auth=40,unread=30,generate-reply=20,send-reply=10.
+Fake upstream latency and errors follow the FAKE_* environment variables (see app/fakes.py).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MIX = "check-auth=40,unread=30,generate-reply=20,send-reply=10"
+REPLY_TEXT = ("Hi,\n\nThanks for your email. Tuesday at 10am works for me; I'll send an invite.\n\n"
+              "Best regards,\nSam")
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - {"check-auth", "unread", "generate-reply", "send-reply"}
+    if unknown:
+        raise SystemExit(f"Unknown routes in --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+class Results:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.statuses: Dict[str, Dict[str, int]] = {}
+
+    def record(self, route: str, latency: float, status: str, ok: bool) -> None:
+        self.latencies.setdefault(route, []).append(latency)
+        self.errors[route] = self.errors.get(route, 0) + (0 if ok else 1)
+        counts = self.statuses.setdefault(route, {})
+        counts[status] = counts.get(status, 0) + 1
+
+    def summary(self, elapsed: float) -> Dict:
+        routes = {}
+        all_latencies, total_errors = [], 0
+        for route, values in sorted(self.latencies.items()):
+            values.sort()
+            all_latencies.extend(values)
+            total_errors += self.errors[route]
+            routes[route] = self._stats(values, self.errors[route], elapsed)
+            routes[route]["statuses"] = self.statuses[route]
+        all_latencies.sort()
+        return {"routes": routes, "total": self._stats(all_latencies, total_errors, elapsed)}
+
+    @staticmethod
+    def _stats(values: List[float], errors: int, elapsed: float) -> Dict:
+        ms = lambda v: round(v * 1000, 1) if v is not None else None
+        return {
+            "requests": len(values),
+            "throughput_rps": round(len(values) / elapsed, 2) if elapsed else None,
+            "error_rate": round(errors / len(values), 4) if values else None,
+            "p50_ms": ms(percentile(values, 0.50)),
+            "p95_ms": ms(percentile(values, 0.95)),
+            "p99_ms": ms(percentile(values, 0.99)),
+            "max_ms": ms(values[-1] if values else None),
+        }
+
+async def run_load(url: str, rate: float, duration: float, mix: Dict[str, float], timeout: float,
+                   max_inflight: int, seed: int) -> Dict:
+    import httpx
+
+    rng = random.Random(seed)
+    results = Results()
+    limits = httpx.Limits(max_connections=max_inflight, max_keepalive_connections=max_inflight)
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        unread = await client.get("/api/email/unread")
+        email_ids = [m["id"] for m in unread.json().get("messages", [])] or ["missing"]
+
+        def build(route: str, n: int):
+            if route == "check-auth":
+                return "GET", "/api/email/check-auth", None
+            if route == "unread":
+                return "GET", "/api/email/unread", None
+            email_id = rng.choice(email_ids)
+            if route == "generate-reply":
+                # A distinct user context per request keeps the reply deduplicator honest
+                return "POST", "/api/email/generate-reply", {
+                    "emailId": email_id, "userName": "Sam", "userContext": f"load {n}", "force": True,
+                }
+            return "POST", "/api/email/send-reply", {"emailId": email_id, "replyText": REPLY_TEXT}
+
+        async def fire(route: str, scheduled: float, n: int):
+            method, path, body = build(route, n)
+            try:
+                response = await client.request(method, path, json=body)
+                status, ok = str(response.status_code), response.status_code < 400
+            except httpx.TimeoutException:
+                status, ok = "timeout", False
+            except httpx.HTTPError as e:
+                status, ok = type(e).__name__, False
+            results.record(route, time.perf_counter() - scheduled, status, ok)
+
+        routes, weights = list(mix), list(mix.values())
+        tasks = set()
+        started = time.perf_counter()
+        next_at, n = started, 0
+        while next_at - started < duration:
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            route = rng.choices(routes, weights)[0]
+            if len(tasks) >= max_inflight:
+                # The client itself is saturated; count it rather than silently slowing down
+                results.record(route, 0.0, "client_overload", False)
+            else:
+                task = asyncio.create_task(fire(route, next_at, n))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            n += 1
+            next_at += rng.expovariate(rate)
+        if tasks:
+            await asyncio.wait(tasks)
+        elapsed = time.perf_counter() - started
+
+    summary = results.summary(elapsed)
+    summary.update({"offered_rps": rate, "duration_s": round(elapsed, 2)})
+    return summary
+
+# ---------------- Server management ----------------
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def spawn_server(workers: int, threads: int, port: int) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.setdefault("GMAIL_BACKEND", "fake")
+    env.setdefault("GEMINI_BACKEND", "fake")
+    env.setdefault("TRACE_EXPORTER", "off")
+    env.setdefault("LOG_LEVEL", "WARNING")
+    env.setdefault("ACCESS_LOG", os.devnull)
+    env.update({"PORT": str(port), "WEB_CONCURRENCY": str(workers), "WORKER_THREADS": str(threads)})
+    # gunicorn's own log goes to a file; an undrained pipe would eventually block the server
+    log = tempfile.TemporaryFile()
+    process = subprocess.Popen([sys.executable, "run.py"], cwd=BACKEND_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=log)
+    process.server_log = log
+    return process
+
+def wait_until_ready(url: str, process: subprocess.Popen, timeout: float = 60) -> None:
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            process.server_log.seek(0)
+            raise SystemExit(f"Server exited early:\n{process.server_log.read().decode()[-2000:]}")
+        try:
+            if httpx.get(f"{url}/healthz", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit("Server did not become ready in time")
+
+def stop_server(process: subprocess.Popen) -> None:
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+    process.server_log.close()
+
+# ---------------- CLI ----------------
+def print_summary(label: str, summary: Dict) -> None:
+    print(f"\n{label}: offered {summary['offered_rps']} rps for {summary['duration_s']} s")
+    print(f"  {'route':<16} {'reqs':>6} {'rps':>8} {'err%':>7} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for route, stats in list(summary["routes"].items()) + [("TOTAL", summary["total"])]:
+        error_pct = f"{stats['error_rate'] * 100:.1f}" if stats["error_rate"] is not None else "-"
+        print(f"  {route:<16} {stats['requests']:>6} {stats['throughput_rps']:>8} {error_pct:>7} "
+              f"{stats['p50_ms']:>9} {stats['p95_ms']:>9} {stats['p99_ms']:>9}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="base URL of a running server")
+    target.add_argument("--spawn", action="store_true", help="start run.py (gunicorn) with fake upstreams")
+    parser.add_argument("--workers", default="2", help="gunicorn worker counts to sweep with --spawn, e.g. 1,2,4")
+    parser.add_argument("--threads", type=int, default=8, help="threads per gunicorn worker with --spawn")
+    parser.add_argument("--rate", default="10", help="arrival rates (req/s) to sweep, e.g. 5,10,20")
+    parser.add_argument("--duration", type=float, default=30, help="seconds per run")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="route weights")
+    parser.add_argument("--timeout", type=float, default=30, help="client timeout per request (s)")
+    parser.add_argument("--max-inflight", type=int, default=1000, help="client-side cap on open requests")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write all run summaries to this file")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    rates = [float(r) for r in args.rate.split(",")]
+    worker_counts = [int(w) for w in args.workers.split(",")] if args.spawn else [None]
+
+    runs = []
+    for workers in worker_counts:
+        process = None
+        url = args.url
+        if args.spawn:
+            port = free_port()
+            url = f"http://127.0.0.1:{port}"
+            process = spawn_server(workers, args.threads, port)
+        try:
+            if process is not None:
+                wait_until_ready(url, process)
+            for rate in rates:
+                summary = asyncio.run(run_load(url, rate, args.duration, mix, args.timeout,
+                                               args.max_inflight, args.seed))
+                summary.update({"workers": workers, "threads": args.threads if args.spawn else None, "url": url})
+                label = f"workers={workers} threads={args.threads}" if args.spawn else url
+                print_summary(label, summary)
+                runs.append(summary)
+        finally:
+            if process is not None:
+                stop_server(process)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"mix": mix, "runs": runs}, f, indent=2)
+        print(f"\nWrote {args.json}")
+
+if __name__ == "__main__":
+    main()
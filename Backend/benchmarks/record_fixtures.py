@@ -0,0 +1,39 @@
+"""
+Record Gmail fixtures for the fake backends.
+
+Uses the real token.json credentials to capture the newest messages (with the
+rest of their threads) and the profile, and writes them in the FAKE_FIXTURES
+format. Replay them with GMAIL_BACKEND=fake FAKE_FIXTURES=<file>.
+
+    python benchmarks/record_fixtures.py --limit 50 --query "is:unread" --out fixtures.json
+
+Recorded Gemini answers can be added by hand under "gemini" -> "responses",
+keyed by app.fakes.prompt_key(prompt).
+"""
+import argparse
+import json
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--limit", type=int, default=50, help="how many recent messages to start from")
+    parser.add_argument("--query", default="", help="Gmail search query, e.g. 'is:unread'")
+    parser.add_argument("--out", default="fixtures.json")
+    args = parser.parse_args()
+
+    from app.clients import build_gmail_service
+    from app.email_assistant import setup_authentication
+    from app.fakes import record_gmail_fixtures
+
+    service = build_gmail_service(setup_authentication())
+    fixtures = record_gmail_fixtures(service, limit=args.limit, query=args.query)
+    with open(args.out, "w") as f:
+        json.dump(fixtures, f, indent=1)
+    print(f"Recorded {len(fixtures['gmail']['messages'])} messages to {args.out}")
+
+if __name__ == "__main__":
+    main()
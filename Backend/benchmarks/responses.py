@@ -0,0 +1,142 @@
+"""
+Bytes and CPU of the JSON response layer (app/responses.py).
+
+Builds representative response bodies from the fake mailbox (an /unread page,
+the same page with full message bodies included, and a generated reply) and
+reports for each:
+
+  * serialization time with Flask's stdlib encoder vs. the orjson provider
+  * size and compression time for each coding the server can send
+  * time on the wire for a few slow mobile links
+
+    python benchmarks/responses.py
+    python benchmarks/responses.py --page-size 100 --json responses.json
+
+Timings are CPU time (time.process_time) per call, median of --repeat runs.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Downlink speeds in bits per second
+LINKS = {"2g": 250_000, "slow_3g": 400_000, "3g": 1_600_000, "4g": 9_000_000}
+
+def cpu_time(fn, repeat: int) -> float:
+    """Median CPU seconds per call."""
+    fn()
+    loops = 1
+    while True:
+        started = time.process_time()
+        for _ in range(loops):
+            fn()
+        if time.process_time() - started >= 0.05 or loops >= 10_000:
+            break
+        loops *= 4
+    samples = []
+    for _ in range(repeat):
+        started = time.process_time()
+        for _ in range(loops):
+            fn()
+        samples.append((time.process_time() - started) / loops)
+    return statistics.median(samples)
+
+def build_payloads(page_size: int):
+    from app import create_app
+    from app.aio import run_async
+    from app.email_assistant import get_message_body, get_unread_page_async
+    from app.fakes import FakeCredentials, get_fake_gmail
+
+    creds = FakeCredentials()
+    messages, next_page_token = run_async(get_unread_page_async(creds, page_size=page_size))
+    page = {"success": True, "messages": messages, "threadCount": len(messages), "nextCursor": None}
+
+    mailbox = get_fake_gmail().mailbox
+    with_bodies = dict(page, messages=[
+        dict(m, body=get_message_body(mailbox.get_message(m["id"], {})[1])) for m in messages
+    ])
+
+    client = create_app().test_client()
+    reply = client.post("/api/email/generate-reply", json={
+        "emailId": messages[0]["id"], "userName": "Sam", "userContext": "benchmark", "force": True,
+    }).get_json()
+    return {
+        f"unread[{len(messages)}]": page,
+        f"unread_with_bodies[{len(messages)}]": with_bodies,
+        "generate_reply": reply,
+    }
+
+def measure(name, payload, repeat):
+    from flask.json.provider import DefaultJSONProvider
+    from app import create_app
+    from app.responses import available_encodings, compress
+
+    app = create_app()
+    stdlib = DefaultJSONProvider(app)
+    with app.app_context():
+        stdlib_body = stdlib.response(payload).get_data()
+        fast_body = app.json.response(payload).get_data()
+        row = {
+            "payload": name,
+            "json_bytes_stdlib": len(stdlib_body),
+            "json_bytes_fast": len(fast_body),
+            "encode_us_stdlib": cpu_time(lambda: stdlib.response(payload), repeat) * 1e6,
+            "encode_us_fast": cpu_time(lambda: app.json.response(payload), repeat) * 1e6,
+            "encodings": {},
+        }
+    for encoding in ["identity"] + available_encodings():
+        if encoding == "identity":
+            size, seconds = len(fast_body), 0.0
+        else:
+            size = len(compress(fast_body, encoding))
+            seconds = cpu_time(lambda: compress(fast_body, encoding), repeat)
+        row["encodings"][encoding] = {
+            "bytes": size,
+            "compress_us": seconds * 1e6,
+            "wire_ms": {link: size * 8 / bps * 1000 for link, bps in LINKS.items()},
+        }
+    return row
+
+def print_row(row):
+    saved = 1 - row["encode_us_fast"] / row["encode_us_stdlib"] if row["encode_us_stdlib"] else 0
+    print(f"\n{row['payload']}")
+    print(f"  encode   stdlib {row['encode_us_stdlib']:>9.1f} us ({row['json_bytes_stdlib']} B)   "
+          f"fast {row['encode_us_fast']:>9.1f} us ({row['json_bytes_fast']} B)   CPU saved {saved:.0%}")
+    identity = row["encodings"]["identity"]["bytes"]
+    links = "".join(f"{link:>10}" for link in LINKS)
+    print(f"  {'coding':<9} {'bytes':>9} {'ratio':>6} {'cpu us':>9} {links}   (ms on the wire)")
+    for encoding, stats in row["encodings"].items():
+        wire = "".join(f"{stats['wire_ms'][link]:>10.1f}" for link in LINKS)
+        print(f"  {encoding:<9} {stats['bytes']:>9} {stats['bytes'] / identity:>6.2f} "
+              f"{stats['compress_us']:>9.1f} {wire}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page-size", type=int, default=100, help="threads in the /unread page payloads")
+    parser.add_argument("--messages", type=int, default=400, help="messages in the fake mailbox")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="smartmail-bench-") as scratch:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        from suite import configure_environment
+
+        os.environ.setdefault("FAKE_GMAIL_MESSAGES", str(args.messages))
+        configure_environment(scratch)
+        rows = [measure(name, payload, args.repeat) for name, payload in build_payloads(args.page_size).items()]
+
+    for row in rows:
+        print_row(row)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+        print(f"\nWrote {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+"""
+Benchmark suite for the email pipeline, run against the fake Gmail and Gemini
+backends (app/fakes.py) with zero injected latency, so the numbers measure
+this code rather than the network.
+
+    python benchmarks/suite.py                       # run everything, write results JSON
+    python benchmarks/suite.py --only unread         # benchmarks whose name contains "unread"
+    python benchmarks/suite.py --save-baseline       # store this run as the baseline
+    python benchmarks/suite.py --baseline benchmarks/baseline.json --threshold 0.2
+
+With a baseline, a benchmark whose median is more than --threshold slower
+(and slower by at least --min-delta-ms) is a regression and the exit status
+is 1. Baselines are machine-specific; record them on the machine that runs
+the comparison.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from datetime import datetime, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_RESULTS = os.path.join(BACKEND_DIR, "benchmarks", "results.json")
+DEFAULT_BASELINE = os.path.join(BACKEND_DIR, "benchmarks", "baseline.json")
+
+BENCHMARKS = []
+
+def benchmark(name, repeat=7, per_call=False):
+    """
+    Register a benchmark. The decorated function does its setup and returns
+    the callable to time. Fast callables are looped (as timeit does) and
+    reported per call; `per_call` benchmarks time each call on its own.
+    """
+    def register(setup):
+        BENCHMARKS.append({"name": name, "setup": setup, "repeat": repeat, "per_call": per_call})
+        return setup
+    return register
+
+def configure_environment(scratch_dir):
+    """Fake backends, no injected latency, and no writes outside a scratch directory."""
+    defaults = {
+        "GMAIL_BACKEND": "fake",
+        "GEMINI_BACKEND": "fake",
+        "FAKE_GMAIL_LATENCY_MS": "0",
+        "FAKE_GEMINI_LATENCY_MS": "0",
+        "FAKE_GEMINI_MS_PER_TOKEN": "0",
+        "FAKE_GMAIL_ERROR_RATE": "0",
+        "FAKE_GEMINI_ERROR_RATE": "0",
+        "TRACE_EXPORTER": "off",
+        "LOG_LEVEL": "WARNING",
+        "SEARCH_INDEX_PATH": os.path.join(scratch_dir, "search_index.db"),
+        "FEW_SHOT_INDEX_DIR": os.path.join(scratch_dir, "few_shot_index"),
+    }
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+    sys.path.insert(0, BACKEND_DIR)
+
+def measure(fn, repeat, per_call):
+    """Per-call times in seconds, one sample per repeat."""
+    fn()  # warm up caches, lazy imports and pooled clients
+    if per_call:
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - started)
+        return samples, 1
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return [t / number for t in timer.repeat(repeat=repeat, number=number)], number
+
+def summarize(samples, number):
+    ordered = sorted(samples)
+    median = statistics.median(ordered)
+    return {
+        "median_ms": round(median * 1000, 4),
+        "min_ms": round(ordered[0] * 1000, 4),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 4),
+        "ops_per_sec": round(1 / median, 1) if median else None,
+        "samples": len(ordered),
+        "loops": number,
+    }
+
+# ---------------- Fixtures ----------------
+def _mailbox(unread):
+    """A fake mailbox with at least `unread` unread inbox messages."""
+    from app.fakes import FakeMailbox, synthetic_messages
+
+    messages = synthetic_messages(count=int(unread * 1.8) + 10)
+    for message in messages:
+        if "INBOX" in message["labelIds"] and "UNREAD" not in message["labelIds"]:
+            message["labelIds"].append("UNREAD")
+    return FakeMailbox(messages)
+
+def _use_mailbox(mailbox):
+    from app.fakes import get_fake_gmail
+    from app.mailbox import mailbox_version
+    get_fake_gmail().mailbox = mailbox
+    # A new mailbox can reuse the previous one's historyId
+    mailbox_version.invalidate()
+
+def _long_text(paragraphs=400):
+    sentence = ("Thanks for the update on the quarterly numbers and the revised timeline for the rollout. "
+                "I went through the attached notes, and I think we should discuss the budget on Thursday. ")
+    return "Dear Alex,\n\n" + "\n\n".join(sentence * 3 for _ in range(paragraphs)) + "\n\nBest regards,\nSam"
+
+def _mime_tree(depth=6, fanout=4, body_bytes=200_000):
+    """A deeply nested multipart payload whose text/plain part comes last."""
+    import base64
+
+    html = {"mimeType": "text/html", "body": {"data": base64.urlsafe_b64encode(b"<p>hi</p>" * 200).decode()}}
+    attachment = {"mimeType": "application/pdf", "filename": "a.pdf", "body": {"attachmentId": "x", "size": 10_000}}
+
+    def level(d):
+        if d == 0:
+            return {"mimeType": "multipart/alternative", "parts": [html, attachment]}
+        return {"mimeType": "multipart/mixed", "parts": [level(d - 1) for _ in range(fanout - 1)] + [attachment]}
+
+    text = {"mimeType": "text/plain",
+            "body": {"data": base64.urlsafe_b64encode(("x" * 99 + "\n").encode() * (body_bytes // 100)).decode()}}
+    root = level(depth)
+    root["parts"].append(text)
+    return {"id": "big", "snippet": "", "payload": root}
+
+# ---------------- Benchmarks ----------------
+def _register_unread(size):
+    repeat = 7 if size < 1000 else 3
+
+    @benchmark(f"unread_sync[{size}]", repeat=repeat, per_call=True)
+    def unread_sync():
+        from app.clients import build_gmail_service
+        from app.email_assistant import get_recent_unread_messages
+        from app.fakes import FakeCredentials
+
+        _use_mailbox(_mailbox(size))
+        service = build_gmail_service(FakeCredentials())
+        return lambda: get_recent_unread_messages(service, limit=size)
+
+    @benchmark(f"unread_async[{size}]", repeat=repeat, per_call=True)
+    def unread_async():
+        from app.aio import run_async
+        from app.email_assistant import get_recent_unread_messages_async
+        from app.fakes import FakeCredentials
+
+        _use_mailbox(_mailbox(size))
+        creds = FakeCredentials()
+        return lambda: run_async(get_recent_unread_messages_async(creds, limit=size), timeout=600)
+
+    @benchmark(f"unread_page[{size}]", repeat=repeat, per_call=True)
+    def unread_page():
+        from app.aio import run_async
+        from app.email_assistant import get_unread_page_async
+        from app.fakes import FakeCredentials
+
+        _use_mailbox(_mailbox(size))
+        creds = FakeCredentials()
+        return lambda: run_async(get_unread_page_async(creds, page_size=size), timeout=600)
+
+for _size in (30, 500, 5000):
+    _register_unread(_size)
+
+@benchmark("get_message_body[nested_mime]")
+def message_body():
+    from app.email_assistant import get_message_body
+    message = _mime_tree()
+    return lambda: get_message_body(message)
+
+@benchmark("format_email_for_mobile[long]")
+def format_mobile():
+    from app.email_assistant import format_email_for_mobile
+    text = _long_text()
+    return lambda: format_email_for_mobile(text)
+
+@benchmark("format_email_content[long]")
+def format_content():
+    from app.email_assistant import format_email_content
+    text = _long_text()
+    return lambda: format_email_content(text)
+
+@benchmark("create_mime_message")
+def mime_message():
+    from app.email_assistant import create_mime_message
+    body = _long_text(paragraphs=5)
+    return lambda: create_mime_message("Alex <alex@example.com>", "", "Re: Quarterly numbers", body)
+
+def _unread_payload(size=100):
+    from app.aio import run_async
+    from app.email_assistant import get_unread_page_async
+    from app.fakes import FakeCredentials
+
+    _use_mailbox(_mailbox(size))
+    messages, _ = run_async(get_unread_page_async(FakeCredentials(), page_size=size), timeout=600)
+    return {"success": True, "messages": messages, "threadCount": len(messages), "nextCursor": None}
+
+@benchmark("json_response[unread_100]")
+def json_response():
+    from app import create_app
+    app = create_app()
+    payload = _unread_payload()
+
+    def call():
+        with app.app_context():
+            app.json.response(payload)
+    return call
+
+@benchmark("compress_gzip[unread_100]")
+def compress_gzip():
+    from app import create_app
+    from app.responses import compress
+    app = create_app()
+    with app.app_context():
+        body = app.json.response(_unread_payload()).get_data()
+    return lambda: compress(body, "gzip")
+
+def _client():
+    from app import create_app
+    return create_app().test_client()
+
+@benchmark("http_unread_not_modified", repeat=30, per_call=True)
+def http_unread_not_modified():
+    _use_mailbox(_mailbox(30))
+    client = _client()
+    etag = client.get("/api/email/unread").headers["ETag"]
+
+    def call():
+        response = client.get("/api/email/unread", headers={"If-None-Match": etag})
+        assert response.status_code == 304, response.status_code
+    return call
+
+@benchmark("http_generate_reply", repeat=30, per_call=True)
+def http_generate_reply():
+    _use_mailbox(_mailbox(30))
+    client = _client()
+    ids = [m["id"] for m in client.get("/api/email/unread").get_json()["messages"]]
+    counter = iter(range(10 ** 9))
+
+    def call():
+        i = next(counter)
+        # A new user context each call so the reply deduplicator does not answer from cache
+        response = client.post("/api/email/generate-reply", json={
+            "emailId": ids[i % len(ids)], "userName": "Sam", "userContext": f"run {i}", "fresh": True, "force": True,
+        })
+        assert response.status_code == 200, response.get_data(as_text=True)
+    return call
+
+@benchmark("http_send_reply", repeat=30, per_call=True)
+def http_send_reply():
+    _use_mailbox(_mailbox(30))
+    client = _client()
+    ids = [m["id"] for m in client.get("/api/email/unread").get_json()["messages"]]
+    counter = iter(range(10 ** 9))
+
+    def call():
+        response = client.post("/api/email/send-reply", json={
+            "emailId": ids[next(counter) % len(ids)], "replyText": _long_text(paragraphs=3),
+        })
+        assert response.status_code == 200, response.get_data(as_text=True)
+    return call
+
+# ---------------- Running and comparing ----------------
+def run(only=None, repeat_scale=1.0):
+    results = {}
+    for bench in BENCHMARKS:
+        if only and not any(pattern in bench["name"] for pattern in only):
+            continue
+        fn = bench["setup"]()
+        repeat = max(3, int(bench["repeat"] * repeat_scale))
+        samples, number = measure(fn, repeat, bench["per_call"])
+        results[bench["name"]] = summarize(samples, number)
+        r = results[bench["name"]]
+        print(f"{bench['name']:<34} median {r['median_ms']:>10.3f} ms   p95 {r['p95_ms']:>10.3f} ms   "
+              f"({r['samples']}x{r['loops']})", flush=True)
+    return results
+
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def compare(results, baseline, threshold, min_delta_ms):
+    """Rows of (name, baseline ms, current ms, ratio, status)."""
+    rows = []
+    for name, current in results.items():
+        before = baseline.get("results", {}).get(name)
+        if before is None:
+            rows.append((name, None, current["median_ms"], None, "new"))
+            continue
+        ratio = current["median_ms"] / before["median_ms"] if before["median_ms"] else float("inf")
+        delta = current["median_ms"] - before["median_ms"]
+        if ratio > 1 + threshold and delta > min_delta_ms:
+            status = "REGRESSION"
+        elif ratio < 1 - threshold and -delta > min_delta_ms:
+            status = "faster"
+        else:
+            status = "ok"
+        rows.append((name, before["median_ms"], current["median_ms"], ratio, status))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", action="append", help="run benchmarks whose name contains this (repeatable)")
+    parser.add_argument("--quick", action="store_true", help="fewer samples per benchmark")
+    parser.add_argument("--out", default=DEFAULT_RESULTS, help="where to write the results JSON")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="also write the results to --baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown ratio (0.2 = 20%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.05,
+                        help="ignore slowdowns smaller than this, whatever the ratio")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="smartmail-bench-") as scratch:
+        configure_environment(scratch)
+        results = run(args.only, repeat_scale=0.5 if args.quick else 1.0)
+
+    report = {"meta": metadata(), "results": results}
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.out}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print("No baseline to compare against (run with --save-baseline to create one)")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    rows = compare(results, baseline, args.threshold, args.min_delta_ms)
+    print(f"\nAgainst baseline {baseline.get('meta', {}).get('commit')} "
+          f"({baseline.get('meta', {}).get('timestamp')}):")
+    for name, before, after, ratio, status in rows:
+        before_text = f"{before:.3f}" if before is not None else "-"
+        ratio_text = f"{ratio:.2f}x" if ratio is not None else ""
+        print(f"  {name:<34} {before_text:>10} -> {after:>10.3f} ms  {ratio_text:>7}  {status}")
+    regressions = [row for row in rows if row[-1] == "REGRESSION"]
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
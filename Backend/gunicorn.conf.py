@@ -0,0 +1,54 @@
+import gc
+import multiprocessing
+import os
+import signal
+
+# Production server settings. Every value can be overridden from the
+# environment so the same file works on any host size.
+bind = f"0.0.0.0:{os.getenv('PORT', '8001')}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+# gthread keeps a worker responsive while threads wait on Gmail and Gemini,
+# which the app awaits on its own I/O loop (app/aio.py). The views are WSGI;
+# an ASGI adapter would run them all on one thread per worker.
+worker_class = os.getenv("WORKER_CLASS", "gthread")
+threads = int(os.getenv("WORKER_THREADS", "8"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+# Time a worker gets after SIGTERM to finish in-flight requests
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "60"))
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+max_requests = int(os.getenv("MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "0"))
+accesslog = os.getenv("ACCESS_LOG", "-")
+
+# Import the app (and the Google, Supabase and NumPy modules it pulls in) once
+# in the master, so forked workers share those pages copy-on-write.
+preload_app = True
+
+def when_ready(server):
+    # Move everything allocated while preloading into the permanent
+    # generation, so the garbage collector does not touch those pages in
+    # workers and break copy-on-write sharing.
+    gc.freeze()
+
+def post_worker_init(worker):
+    from app.lifecycle import inflight
+
+    original_handler = signal.getsignal(signal.SIGTERM)
+
+    def handle_term(signum, frame):
+        # Fail readiness right away so the load balancer stops routing here
+        inflight.start_draining()
+        if callable(original_handler):
+            original_handler(signum, frame)
+
+    signal.signal(signal.SIGTERM, handle_term)
+
+def worker_exit(server, worker):
+    from app.lifecycle import inflight
+    from app.log import shutdown_logging
+
+    inflight.start_draining()
+    if not inflight.wait_for_drain(graceful_timeout):
+        server.log.warning("Worker %s exiting with %s Gemini call(s) still in flight", worker.pid, inflight.count)
+    # Flush log records still queued for the writer thread
+    shutdown_logging()
@@ -1,24 +1,38 @@
-from flask import Flask
-from flask_cors import CORS
-from app import create_app
+import argparse
 import os
-from threading import Thread
+import runpy
+from app import create_app
 
 # Set environment variable to allow OAuth in development
-os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
+os.environ.setdefault('OAUTHLIB_INSECURE_TRANSPORT', '1')
+
+def run_production(app):
+    """Serve the app with gunicorn using the settings in gunicorn.conf.py."""
+    from gunicorn.app.base import BaseApplication
+
+    class ProductionServer(BaseApplication):
+        def load_config(self):
+            config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gunicorn.conf.py")
+            for key, value in runpy.run_path(config_path).items():
+                if key in self.cfg.settings:
+                    self.cfg.set(key, value)
+
+        def load(self):
+            return app
 
-app = create_app()
+    ProductionServer().run()
 
-def run_oauth_server():
-    # Create a second instance of the app for OAuth
-    oauth_app = create_app()
-    oauth_app.run(host="0.0.0.0", port=8000, debug=False)
+def run_development(app):
+    """Single Flask development server with the reloader, for local work only."""
+    app.run(host="0.0.0.0", port=int(os.getenv("PORT", "8001")), debug=os.getenv("FLASK_DEBUG", "1") == "1")
 
 if __name__ == "__main__":
-    # Start OAuth server in a separate thread
-    oauth_thread = Thread(target=run_oauth_server)
-    oauth_thread.daemon = True
-    oauth_thread.start()
+    parser = argparse.ArgumentParser(description="Run the Smart Mail backend.")
+    parser.add_argument("--dev", action="store_true", help="use the Flask development server")
+    args = parser.parse_args()
 
-    # Run the app on port 8001
-    app.run(host='0.0.0.0', port=8001, debug=True) 
\ No newline at end of file
+    app = create_app()
+    if args.dev:
+        run_development(app)
+    else:
+        run_production(app)
@@ -0,0 +1,56 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRATCH_DIR = tempfile.mkdtemp(prefix="smartmail-tests-")
+
+# Fake Gmail and Gemini backends, no injected latency or errors, and no writes
+# outside a scratch directory. Set before any app module reads its config.
+for key, value in {
+    "GMAIL_BACKEND": "fake",
+    "GEMINI_BACKEND": "fake",
+    "GEMINI_API_KEY": "test",
+    "SUPABASE_URL": "https://example.supabase.co",
+    "SUPABASE_KEY": "eyJhbGciOiJIUzI1NiJ9.e30.ZRrHA1JJJW8opsbCGfG_HACGpVUMN_a9IV7pAx_Zmeo",
+    "FAKE_GMAIL_MESSAGES": "60",
+    "FAKE_GMAIL_LATENCY_MS": "0",
+    "FAKE_GEMINI_LATENCY_MS": "0",
+    "FAKE_GEMINI_MS_PER_TOKEN": "0",
+    "FAKE_GMAIL_ERROR_RATE": "0",
+    "FAKE_GEMINI_ERROR_RATE": "0",
+    "TRACE_EXPORTER": "off",
+    "LOG_LEVEL": "WARNING",
+    "SEARCH_INDEX_PATH": os.path.join(SCRATCH_DIR, "search_index.db"),
+    "FEW_SHOT_INDEX_DIR": os.path.join(SCRATCH_DIR, "few_shot_index"),
+}.items():
+    os.environ.setdefault(key, value)
+sys.path.insert(0, BACKEND_DIR)
+
+@pytest.fixture(scope="session")
+def app():
+    from app import create_app
+    return create_app()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def mailbox():
+    from app.fakes import get_fake_gmail
+    return get_fake_gmail().mailbox
+
+@pytest.fixture
+def signed_in(monkeypatch):
+    """Accept `Authorization: Bearer token-<user id>` without calling Supabase."""
+    from app.auth import AuthService, session_users
+
+    async def get_user_id(session_token):
+        return session_token.removeprefix("token-") if session_token.startswith("token-") else None
+
+    monkeypatch.setattr(AuthService, "get_user_id", staticmethod(get_user_id))
+    monkeypatch.setattr(session_users, "_users", {})
+    return lambda user_id: {"Authorization": f"Bearer token-{user_id}"}
@@ -0,0 +1,27 @@
+import asyncio
+import time
+
+from app.aio import get_gmail_client, run_async
+
+class ExpiredCredentials:
+    def __init__(self):
+        self.valid = False
+        self.token = None
+        self.refreshes = 0
+
+    def refresh(self, request):
+        time.sleep(0.05)
+        self.refreshes += 1
+        self.valid = True
+        self.token = "fresh-token"
+
+def test_concurrent_requests_refresh_once():
+    creds = ExpiredCredentials()
+    client = get_gmail_client()
+
+    async def profiles():
+        return await asyncio.gather(*(client.get_profile(creds) for _ in range(10)))
+
+    results = run_async(profiles())
+    assert len(results) == 10
+    assert creds.refreshes == 1
@@ -0,0 +1,118 @@
+import json
+import threading
+
+import pytest
+
+from app.changes import ChangeFeed, LocalSource, NotificationSource, format_event
+from app.fakes import FakeCredentials
+
+@pytest.fixture
+def feed():
+    return ChangeFeed(LocalSource())
+
+def _next(stream):
+    return stream.get(timeout=5)
+
+def _deliver_and_wait(stream, mailbox, subject):
+    mailbox.deliver("feed@example.com", subject, "Body")
+    event = _next(stream)
+    assert event["event"] == "change"
+    return event
+
+def test_reconnect_replays_missed_changes(feed, mailbox):
+    creds = FakeCredentials()
+    live = feed.subscribe(creds)
+    ready = _next(live)
+    assert ready["event"] == "ready"
+
+    first = _deliver_and_wait(live, mailbox, "One")
+    second = _deliver_and_wait(live, mailbox, "Two")
+    assert int(ready["id"]) < int(first["id"]) < int(second["id"])
+    assert [c["type"] for c in first["data"]["changes"]] == ["added"]
+
+    # A client that saw only "ready" gets both changes, in order, with the same ids
+    resumed = feed.subscribe(creds, last_event_id=ready["id"])
+    assert [_next(resumed), _next(resumed)] == [first, second]
+    assert resumed.empty()
+
+    caught_up = feed.subscribe(creds, last_event_id=second["id"])
+    assert _next(caught_up)["event"] == "ready"
+    for stream in (live, resumed, caught_up):
+        feed.unsubscribe(stream)
+
+def test_reconnect_past_the_backlog_resyncs(mailbox):
+    feed = ChangeFeed(LocalSource(), backlog=1)
+    creds = FakeCredentials()
+    live = feed.subscribe(creds)
+    ready = _next(live)
+    _deliver_and_wait(live, mailbox, "One")
+    _deliver_and_wait(live, mailbox, "Two")
+
+    resumed = feed.subscribe(creds, last_event_id=ready["id"])
+    assert _next(resumed)["event"] == "resync"
+    assert resumed.empty()
+    for stream in (live, resumed):
+        feed.unsubscribe(stream)
+
+@pytest.mark.parametrize("forged", ["999999999999", "0", "-5"])
+def test_out_of_range_ids_resync_without_moving_the_feed(feed, mailbox, forged):
+    creds = FakeCredentials()
+    stream = feed.subscribe(creds, last_event_id=forged)
+    resync = _next(stream)
+    assert resync["event"] == "resync"
+    assert int(resync["id"]) == mailbox.history_id
+    # The shared feed still follows the real mailbox
+    assert _deliver_and_wait(stream, mailbox, "After a forged id")["event"] == "change"
+
+    running = feed.subscribe(creds, last_event_id="999999999999")
+    assert _next(running)["event"] == "resync"
+    for s in (stream, running):
+        feed.unsubscribe(s)
+
+class SlowSource(NotificationSource):
+    def __init__(self):
+        self.called, self.release = threading.Event(), threading.Event()
+
+    def latest(self, creds):
+        self.called.set()
+        self.release.wait(5)
+        return "5000"
+
+def test_starting_the_feed_does_not_hold_the_lock():
+    source = SlowSource()
+    feed = ChangeFeed(source)
+    opened = []
+    subscriber = threading.Thread(target=lambda: opened.append(feed.subscribe(FakeCredentials())))
+    subscriber.start()
+    assert source.called.wait(5)
+    # getProfile (or the watch renewal) is in flight; the lock is free meanwhile
+    assert feed._lock.acquire(timeout=1)
+    feed._lock.release()
+    source.release.set()
+    subscriber.join(5)
+    assert _next(opened[0]) == {"event": "ready", "id": "5000", "data": {"historyId": "5000"}}
+    feed.unsubscribe(opened[0])
+
+def test_format_event():
+    event = {"event": "change", "id": "42", "data": {"historyId": "42", "changes": []}}
+    text = format_event(event)
+    assert text.startswith("id: 42\nevent: change\ndata: ")
+    assert text.endswith("\n\n")
+    assert json.loads(text.split("data: ", 1)[1]) == event["data"]
+
+def test_stream_endpoint_resumes_after_last_event_id(client, mailbox):
+    from app.changes import change_feed
+
+    live = change_feed.subscribe(FakeCredentials())
+    ready = _next(live)
+    change = _deliver_and_wait(live, mailbox, "Over HTTP")
+    change_feed.unsubscribe(live)
+
+    response = client.get("/api/email/changes", headers={"Last-Event-ID": ready["id"]})
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    chunks = iter(response.response)
+    assert next(chunks).startswith(b"retry: ")
+    assert next(chunks).decode() == format_event(change)
+    response.close()
+    assert change_feed.stream_count == 0
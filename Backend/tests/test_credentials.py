@@ -0,0 +1,73 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from google.oauth2.credentials import Credentials
+
+from app.credentials import AUTHENTICATED, REFRESHING, CredentialStore
+
+def _write_token(path, token, expires_in):
+    expiry = datetime.utcnow() + timedelta(seconds=expires_in)
+    path.write_text(json.dumps({
+        "token": token, "refresh_token": "refresh", "client_id": "id", "client_secret": "secret",
+        "expiry": expiry.isoformat() + "Z",
+    }))
+
+@pytest.fixture
+def refreshes(monkeypatch):
+    calls = []
+
+    def refresh(self, request):
+        calls.append(self)
+        self.token = f"fresh-{len(calls)}"
+        self.expiry = datetime.utcnow() + timedelta(hours=1)
+
+    monkeypatch.setattr(Credentials, "refresh", refresh)
+    return calls
+
+def _worker(path):
+    # One store per worker process; no background thread, the test drives it
+    store = CredentialStore(path=str(path), refresh_ahead=300)
+    store._load()
+    return store
+
+def test_only_the_lease_holder_refreshes(tmp_path, refreshes):
+    path = tmp_path / "token.json"
+    _write_token(path, "old", expires_in=60)
+    first, second = _worker(path), _worker(path)
+    assert first._state.status == second._state.status == REFRESHING
+
+    with first._refresh_lease() as leader:
+        assert leader
+        second._refresh()
+    assert refreshes == []
+    assert second._creds.token == "old"
+
+    first._refresh()
+    assert len(refreshes) == 1
+    assert first._creds.token == "fresh-1"
+    assert first._state.status == AUTHENTICATED
+
+def test_other_workers_reload_the_refreshed_token(tmp_path, refreshes):
+    path = tmp_path / "token.json"
+    _write_token(path, "old", expires_in=60)
+    first, second = _worker(path), _worker(path)
+
+    first._refresh()
+    # The second worker gets the lease afterwards, but reloads instead of refreshing again
+    second._refresh()
+    assert len(refreshes) == 1
+    assert second._creds.token == "fresh-1"
+    assert second._state.status == AUTHENTICATED
+
+def test_load_picks_up_a_rewritten_token(tmp_path, refreshes):
+    path = tmp_path / "token.json"
+    _write_token(path, "old", expires_in=3600)
+    store = _worker(path)
+    assert store._creds.token == "old"
+
+    _write_token(path, "rotated", expires_in=3600)
+    store._load()
+    assert store._creds.token == "rotated"
+    assert store._state.status == AUTHENTICATED
+    assert refreshes == []
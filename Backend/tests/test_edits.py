@@ -0,0 +1,105 @@
+import pytest
+
+from app.edits import RevisionError, apply_local_edits, apply_replacements, parse_revision
+
+DRAFT = (
+    "Hi Jon,\n\n"
+    "I hope this email finds you well. Thanks for sending the contract over. "
+    "I have signed it and attached the copy. The invoice goes out on Friday.\n\n"
+    "Please let me know if you have any questions.\n\n"
+    "Best,\nSam"
+)
+
+@pytest.mark.parametrize("instruction,greeting", [
+    ("greet John please", "Hi John,"),
+    ("Greet John Smith", "Hi John Smith,"),
+    ("change the name to Maria", "Hi Maria,"),
+    ("use John instead of Jon", "Hi John,"),
+])
+def test_name_edits_take_only_the_capitalized_name(instruction, greeting):
+    edited = apply_local_edits(DRAFT, instruction)
+    assert edited.startswith(greeting + "\n")
+
+def test_lowercase_name_goes_to_the_llm():
+    assert apply_local_edits(DRAFT, "change the name to maria please") is None
+
+def test_shorter_trims_filler_and_keeps_content():
+    edited = apply_local_edits(DRAFT, "make it shorter")
+    assert "I hope this email finds you well" not in edited
+    assert "Please let me know" not in edited
+    for sentence in ("Thanks for sending the contract over.", "I have signed it and attached the copy.",
+                     "The invoice goes out on Friday."):
+        assert sentence in edited
+    assert edited.startswith("Hi Jon,") and edited.endswith("Best,\nSam")
+
+def test_shorter_without_filler_goes_to_the_llm():
+    assert apply_local_edits("Hi Jon,\n\nThe invoice goes out on Friday. It covers March.\n\nBest,\nSam",
+                             "make it shorter") is None
+
+def test_word_limit_drops_trailing_sentences():
+    edited = apply_local_edits(DRAFT, "keep it under 15 words")
+    assert "Thanks for sending the contract over." in edited
+    assert "The invoice goes out on Friday." not in edited
+
+def test_word_limit_out_of_reach_goes_to_the_llm():
+    # One long sentence per paragraph: nothing can be dropped without rewriting
+    long_sentence = " ".join(["word"] * 58) + "."
+    draft = f"Hi Jon,\n\n{long_sentence}\n\nBest,\nSam"
+    assert apply_local_edits(draft, "keep it under 30 words") is None
+
+def test_formal_tone_swaps_the_salutation_only_in_the_greeting():
+    draft = "Hi Jon,\n\nHi again, I can't make Friday. Cheers to the team for the launch.\n\nCheers,\nSam"
+    edited = apply_local_edits(draft, "make it more formal")
+    assert edited.startswith("Dear Jon,\n\nHi again, I cannot make Friday. Cheers to the team")
+    assert edited.endswith("Kind regards,\nSam")
+
+def test_informal_tone_swaps_the_salutation_only_in_the_greeting():
+    draft = "Dear Ana,\n\nMy dear colleagues will not attend.\n\nKind regards,\nSam"
+    edited = apply_local_edits(draft, "make it more casual")
+    assert edited == "Hi Ana,\n\nMy dear colleagues won't attend.\n\nBest,\nSam"
+
+def test_replacements_skip_targets_not_in_the_draft():
+    draft = "Hi Jon,\n\nThe invoice goes out\non Friday.\n\nBest,\nSam"
+    edited = apply_replacements(draft, [
+        ("The invoice goes out on Friday.", "The invoice goes out on Monday."),   # reflowed whitespace
+        ("a sentence the model made up", "anything"),
+    ])
+    assert edited == "Hi Jon,\n\nThe invoice goes out on Monday.\n\nBest,\nSam"
+    with pytest.raises(RevisionError):
+        apply_replacements(draft, [("a sentence the model made up", "anything")])
+    assert apply_replacements(draft, []) == draft
+
+@pytest.mark.parametrize("text", ["not json", '{"find": "a", "replace": "b"}', '[{"find": "a"}]', '["a"]'])
+def test_unreadable_revisions_are_rejected(text):
+    with pytest.raises(RevisionError):
+        parse_revision(text)
+
+def test_parse_revision_accepts_fenced_json():
+    assert parse_revision('```json\n[{"find": "Friday", "replace": "Monday"}]\n```') == [("Friday", "Monday")]
+
+def test_edit_reply_reports_unusable_revisions_as_bad_gateway(client):
+    from app.clients import get_genai
+    from app.fakes import prompt_key
+
+    draft, instruction = "Hi Jon,\n\nThe invoice goes out on Friday.\n\nBest,\nSam", "mention the new deadline"
+    prompt = f"Instruction: {instruction}\n\nDraft:\n{draft}\n"
+    responses = get_genai().backend.responses
+    responses[prompt_key(prompt)] = "Sure! Here is the revised email."
+    try:
+        response = client.post("/api/email/edit-reply", json={"draft": draft, "instruction": instruction})
+    finally:
+        del responses[prompt_key(prompt)]
+    assert response.status_code == 502
+    assert not response.get_json()["success"]
+
+def test_llm_edits_go_through_the_gemini_breaker(client, monkeypatch):
+    import time
+
+    from app.resilience import OPEN, gemini_breaker
+
+    monkeypatch.setattr(gemini_breaker, "state", OPEN)
+    monkeypatch.setattr(gemini_breaker, "opened_at", time.monotonic())
+    response = client.post("/api/email/edit-reply",
+                           json={"draft": "Hi Jon,\n\nSee you Friday.\n\nBest,\nSam", "instruction": "add an agenda"})
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
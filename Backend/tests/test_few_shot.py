@@ -0,0 +1,46 @@
+import multiprocessing
+from datetime import datetime, timezone
+
+import numpy as np
+
+from app.few_shot import UserReplyIndex
+from app.models import EmailHistory
+from app.text_vectors import HashingVectorizer
+
+def _history(i):
+    return EmailHistory(id=f"h{i}", user_id="u", message_id=f"m{i}", subject=f"Invoice {i}",
+                        content=f"Thanks, invoice {i} is paid.", recipient="a@example.com",
+                        sent_at=datetime.now(timezone.utc))
+
+def _append_range(directory, start, count):
+    index = UserReplyIndex(directory, HashingVectorizer(64))
+    for i in range(start, start + count):
+        index.append([_history(i)])
+
+def test_appends_from_several_processes_stay_aligned(tmp_path):
+    directory = str(tmp_path / "user")
+    workers = [multiprocessing.get_context("fork").Process(target=_append_range, args=(directory, n * 20, 20))
+               for n in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    index = UserReplyIndex(directory, HashingVectorizer(64))
+    assert len(index.ids) == 80
+    assert len(index._vectors) == 80
+    assert sorted(index.meta) == list(range(80))
+    expected = HashingVectorizer(64).transform(f"{m['subject']}\n{m['content']}" for m in index.meta.values())
+    assert np.allclose(np.asarray(index._vectors)[sorted(index.meta)], expected)
+
+def test_reload_sees_rows_from_another_writer(tmp_path):
+    directory = str(tmp_path / "user")
+    reader = UserReplyIndex(directory, HashingVectorizer(64))
+    writer = UserReplyIndex(directory, HashingVectorizer(64))
+    writer.append([_history(1), _history(2)])
+    assert reader.top_k("invoice 2", 1) == []
+
+    reader.reload()
+    assert reader.top_k("invoice 2 paid", 1)[0]["id"] == "h2"
+    # Already indexed by the other writer, so nothing is appended twice
+    assert reader.append([_history(2)]) == 0
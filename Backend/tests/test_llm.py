@@ -0,0 +1,36 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.llm import LocalContextCache, ModelPool
+
+class SlowContextCache(LocalContextCache):
+    """Context cache whose create call takes a while, like CachedContent.create."""
+    def create_model(self, model_name, system_instruction, generation_config):
+        time.sleep(0.2)
+        return super().create_model(model_name, system_instruction, generation_config)
+
+def test_cache_creation_does_not_block_other_models():
+    pool = ModelPool(SlowContextCache())
+    started = threading.Event()
+
+    def build_cached():
+        started.set()
+        return pool.get("model-a", "long shared system instruction")
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(build_cached)
+        started.wait()
+        time.sleep(0.02)
+        began = time.perf_counter()
+        pool.get("model-b")
+        assert time.perf_counter() - began < 0.1
+        future.result()
+
+def test_concurrent_requests_share_one_cache_creation():
+    cache = SlowContextCache()
+    pool = ModelPool(cache)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        models = list(executor.map(lambda _: pool.get("model-a", "instruction"), range(8)))
+    assert cache.creates == 1
+    assert all(model is models[0] for model in models)
@@ -0,0 +1,103 @@
+import pytest
+
+from app.mailbox import decode_cursor, encode_cursor, mailbox_version, unread_etag
+
+def test_cursor_round_trip():
+    cursor = encode_cursor("09876543210 page/token+=")
+    assert "=" not in cursor and "/" not in cursor and "+" not in cursor
+    assert decode_cursor(cursor) == "09876543210 page/token+="
+    assert encode_cursor(None) is None and encode_cursor("") is None
+    assert decode_cursor(None) is None and decode_cursor("") is None
+
+@pytest.mark.parametrize("cursor", ["not base64!", "bm90IGpzb24", "eyJ4IjoxfQ", "eyJ0IjoxfQ"])
+def test_malformed_cursors_are_rejected(cursor):
+    # garbage, non-JSON, JSON without "t", and a non-string token
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+def test_etag_names_version_and_page():
+    etag = unread_etag("1234", None, 20)
+    assert etag.startswith("1234-")
+    assert etag == unread_etag("1234", None, 20)
+    assert etag != unread_etag("1235", None, 20)
+    assert etag != unread_etag("1234", "token", 20)
+    assert etag != unread_etag("1234", None, 10)
+
+def test_unread_pages_and_revalidation(client, mailbox):
+    mailbox_version.invalidate()
+    first = client.get("/api/email/unread?pageSize=5")
+    assert first.status_code == 200
+    body = first.get_json()
+    assert body["threadCount"] == 5 and body["nextCursor"]
+    etag, weak = first.get_etag()
+    assert weak and etag
+    assert "no-cache" in first.headers["Cache-Control"]
+
+    unchanged = client.get("/api/email/unread?pageSize=5", headers={"If-None-Match": f'W/"{etag}"'})
+    assert unchanged.status_code == 304
+    assert unchanged.get_data() == b""
+    assert unchanged.get_etag() == (etag, True)
+
+    second = client.get(f"/api/email/unread?pageSize=5&cursor={body['nextCursor']}")
+    assert second.status_code == 200
+    assert second.get_etag()[0] != etag
+    first_ids = {m["id"] for m in body["messages"]}
+    assert first_ids.isdisjoint(m["id"] for m in second.get_json()["messages"])
+
+    # Any mailbox change moves the historyId, and with it the ETag
+    mailbox.deliver("new@example.com", "Fresh", "Just arrived")
+    mailbox_version.invalidate()
+    changed = client.get("/api/email/unread?pageSize=5", headers={"If-None-Match": f'W/"{etag}"'})
+    assert changed.status_code == 200
+    assert changed.get_etag()[0] != etag
+
+def test_bad_cursor_is_a_client_error(client):
+    response = client.get("/api/email/unread?cursor=not-a-cursor")
+    assert response.status_code == 400
+    assert response.get_json() == {"success": False, "error": "Invalid cursor"}
+
+def test_unread_loads_metadata_and_indexes_bodies_later(client, mailbox, monkeypatch):
+    import time
+
+    from app.aio import AsyncGmailClient
+    from app.search import search_index
+
+    formats = []
+    original = AsyncGmailClient.get_thread
+
+    async def get_thread(self, creds, thread_id, user_id="me", format="metadata", metadata_headers=None):
+        formats.append(format)
+        return await original(self, creds, thread_id, user_id, format, metadata_headers)
+
+    monkeypatch.setattr(AsyncGmailClient, "get_thread", get_thread)
+    message = mailbox.deliver("Olga Petrova <olga@example.com>", "Kayak rental", "The paddles are xylograph-marked")
+    mailbox_version.invalidate()
+    body = client.get("/api/email/unread?pageSize=5").get_json()
+    assert body["messages"][0]["id"] == message["id"]
+    assert body["messages"][0]["subject"] == "Kayak rental"
+    assert formats and set(formats) == {"metadata"}
+
+    # The body is fetched after the response and then becomes searchable
+    # (the snippet matches right away, so wait on the body itself)
+    for _ in range(50):
+        if not search_index.without_body([message["id"]]):
+            break
+        time.sleep(0.05)
+    assert search_index.without_body([message["id"]]) == []
+    assert [r["id"] for r in search_index.search("xylograph")["results"]] == [message["id"]]
+
+def test_send_failures_are_logged_not_printed(monkeypatch, caplog, capsys):
+    import httplib2
+    from googleapiclient.errors import HttpError
+
+    from app import email_assistant
+
+    def create_reply_message(*args, **kwargs):
+        raise HttpError(httplib2.Response({"status": 500}), b"backend error")
+
+    monkeypatch.setattr(email_assistant, "create_reply_message", create_reply_message)
+    with caplog.at_level("ERROR", logger="app.email_assistant"):
+        success, error = email_assistant.send_api_reply(None, "me", "m1", "Thanks!")
+    assert not success and "500" in error
+    assert caplog.records[-1].getMessage() == "Error sending reply to m1"
+    assert "An error occurred" not in capsys.readouterr().out
@@ -0,0 +1,39 @@
+import pytest
+
+from app.near_duplicates import AnsweredEmail, NearDuplicateIndex, adapt_reply
+
+FORM = ("New contact form submission from {email}. Message: I would like a quote for 12 "
+        "office chairs delivered to our Leeds office next month. Please call me back. "
+        "View the submission at {link}")
+
+@pytest.fixture
+def index():
+    return NearDuplicateIndex()
+
+@pytest.mark.parametrize("answered,incoming", [
+    ("Meeting at 9pm on the 12th?", "yes 3pm works"),
+    ("Thanks!", "Thanks!"),
+    ("Meeting at 9pm on the 12th?", "Meeting at 3pm on the 14th?"),
+])
+def test_short_mail_is_never_matched(index, answered, incoming):
+    index.add("m1", answered, "Sounds good, see you then.")
+    assert index.query(incoming) is None
+
+def test_numbers_are_part_of_the_body(index):
+    index.add("m1", "Can we move the review meeting to 9pm on the 12th of March? The team "
+                    "in Singapore cannot make the current slot.", "Yes, 9pm on the 12th works.")
+    assert index.query("Can we move the review meeting to 3pm on the 14th of March? The team "
+                       "in Singapore cannot make the current slot.") is None
+
+def test_templated_mail_still_matches(index):
+    index.add("m1", FORM.format(email="ann@example.com", link="https://forms.example/s/81"),
+              "Thanks, a quote is on its way.")
+    match = index.query(FORM.format(email="bob@example.org", link="https://forms.example/s/97"))
+    assert match is not None
+    assert match[0].message_id == "m1"
+
+def test_adapt_reply_swaps_names_literally():
+    entry = AnsweredEmail("m1", None, "Hi John,\nJohn Smith from sales will call you. Ask John about pricing.",
+                          sender_name="John Smith")
+    reply = adapt_reply(entry, r"Ana \1 Ruiz", "")
+    assert reply == "Hi Ana,\nAna \\1 Ruiz from sales will call you. Ask John about pricing."
@@ -0,0 +1,42 @@
+import threading
+import time
+
+from app.profiling import RequestProfiler
+
+def _serve(profiler, route, seconds=0.05):
+    session = profiler.enter(route)
+    time.sleep(seconds)
+    profiler.exit(session)
+
+def test_sessions_are_visible_from_other_workers(tmp_path):
+    owner = RequestProfiler(spool_dir=str(tmp_path))
+    other = RequestProfiler(spool_dir=str(tmp_path))
+    session = owner.start("/api/email/unread", requests=2, timeout=30, interval=0.005)
+
+    assert other.get(session.id).to_dict() == dict(session.to_dict())
+    _serve(owner, "/api/email/unread")
+    assert other.get(session.id).finished == 1
+    _serve(owner, "/api/email/unread")
+
+    result = other.get(session.id)
+    assert result.done and result.finished == 2
+    assert result.stacks == session.stacks
+    assert any(stack.startswith("/api/email/unread;") for stack in result.stacks)
+
+def test_cancel_from_another_worker(tmp_path):
+    owner = RequestProfiler(spool_dir=str(tmp_path))
+    other = RequestProfiler(spool_dir=str(tmp_path))
+    session = owner.start("/api/email/unread", requests=5, timeout=30, interval=0.005)
+
+    assert other.cancel().id == session.id
+    deadline = time.monotonic() + 5
+    while not session.done and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert session.done and not session.timed_out
+    assert owner.session is None
+    assert other.get(session.id).done
+
+def test_unknown_and_malformed_ids(tmp_path):
+    profiler = RequestProfiler(spool_dir=str(tmp_path))
+    assert profiler.get("0123456789ab") is None
+    assert profiler.get("../../etc/passwd") is None
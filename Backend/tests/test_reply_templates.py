@@ -0,0 +1,65 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from app.db import DatabaseService
+from app.models import EmailTemplate
+from app.reply_templates import TemplateEngine
+from app.text_vectors import TfidfVectorizer
+
+TEMPLATES = [
+    ("Away", "Out of office until Monday."),
+    ("Meeting confirmation", "Thanks {{ sender_first_name }}, that meeting time works for me. See you then."),
+    ("Invoice received", "Thanks for sending the invoice, I have forwarded it to accounts for payment."),
+]
+
+@pytest.fixture
+def engine(monkeypatch):
+    async def get_user_templates(user_id):
+        created = datetime.now(timezone.utc)
+        return [EmailTemplate(str(i), user_id, name, content, created)
+                for i, (name, content) in enumerate(TEMPLATES)]
+    monkeypatch.setattr(DatabaseService, "get_user_templates", staticmethod(get_user_templates))
+    return TemplateEngine()
+
+def test_unknown_terms_count_toward_the_norm():
+    vectorizer = TfidfVectorizer()
+    matrix = vectorizer.fit_transform(["out of office until monday", "invoice for payment"])
+    short, padded = vectorizer.transform(["monday", "monday production database down"])
+    assert (matrix @ padded)[0] < (matrix @ short)[0] / 1.5
+    assert np.linalg.norm(padded) < 1
+
+def test_urgent_mail_does_not_match_out_of_office(engine):
+    match = engine.render_reply("user-1", "URGENT: production database is down",
+                                "The production database is down, can we get it fixed before Monday?",
+                                "Dana Ops <dana@example.com>", "Sam")
+    assert match is None
+
+def test_routine_mail_still_matches(engine):
+    match = engine.render_reply("user-1", "Meeting tomorrow", "Does the meeting time still work for you?",
+                                "Dana Ops <dana@example.com>", "Sam")
+    assert match is not None
+    template, reply, score = match
+    assert template.name == "Meeting confirmation"
+    assert reply.startswith("Thanks Dana,")
+    assert score >= engine.threshold
+
+def test_templates_come_from_the_signed_in_user(client, mailbox, monkeypatch, signed_in):
+    requested = []
+
+    async def get_user_templates(user_id):
+        requested.append(user_id)
+        return []
+
+    monkeypatch.setattr(DatabaseService, "get_user_templates", staticmethod(get_user_templates))
+    message = mailbox.deliver("Ana Lima <ana@example.com>", "Invoice", "Please find the invoice attached.")
+    request = {"emailId": message["id"], "userName": "Sam", "userId": "someone-else"}
+
+    assert client.post("/api/email/generate-reply", json=request).status_code == 200
+    assert client.post("/api/email/generate-reply", json=request,
+                       headers={"Authorization": "Bearer forged"}).status_code == 200
+    assert requested == []
+
+    assert client.post("/api/email/generate-reply", json=request, headers=signed_in("alice")).status_code == 200
+    assert requested == ["alice"]
@@ -0,0 +1,107 @@
+import pytest
+
+from app import resilience
+from app.resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+class FakeHttpError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.code = status
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    return now
+
+def _fail(error):
+    def fn():
+        raise error
+    return fn
+
+def test_opens_after_consecutive_failures_and_rejects(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, recovery_timeout=30)
+    for _ in range(2):
+        with pytest.raises(TimeoutError):
+            breaker.call(_fail(TimeoutError()))
+    assert breaker.state == CLOSED
+    assert breaker.call(lambda: "ok") == "ok"
+    assert breaker.failures == 0      # a success resets the count
+
+    for _ in range(3):
+        with pytest.raises(FakeHttpError):
+            breaker.call(_fail(FakeHttpError(503)))
+    assert breaker.state == OPEN
+
+    calls = []
+    clock[0] += 10
+    with pytest.raises(CircuitOpenError) as rejected:
+        breaker.call(calls.append, 1)
+    assert calls == []
+    assert rejected.value.retry_after == pytest.approx(20)
+    assert breaker.rejected == 1
+
+def test_client_errors_do_not_count(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2)
+    for _ in range(5):
+        with pytest.raises(FakeHttpError):
+            breaker.call(_fail(FakeHttpError(404)))
+    assert breaker.state == CLOSED and breaker.failures == 0
+
+def test_half_open_probe_success_closes(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=30)
+    with pytest.raises(ConnectionError):
+        breaker.call(_fail(ConnectionError()))
+    clock[0] += 30
+
+    def probe():
+        # Only one probe is let through while it is in flight
+        assert breaker.state == HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.call(lambda: None)
+        return "ok"
+
+    assert breaker.call(probe) == "ok"
+    assert breaker.state == CLOSED
+
+def test_half_open_probe_failure_reopens(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=30)
+    with pytest.raises(ConnectionError):
+        breaker.call(_fail(ConnectionError()))
+    clock[0] += 31
+    with pytest.raises(FakeHttpError):
+        breaker.call(_fail(FakeHttpError(429)))
+    assert breaker.state == OPEN
+    assert breaker.opened_at == clock[0]
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: None)
+
+def test_async_calls_share_the_state_machine(clock):
+    from app.aio import run_async
+
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=30)
+
+    async def down():
+        raise ConnectionError()
+
+    async def up():
+        return "ok"
+
+    with pytest.raises(ConnectionError):
+        run_async(breaker.call_async(down))
+    with pytest.raises(CircuitOpenError):
+        run_async(breaker.call_async(up))
+    clock[0] += 30
+    assert run_async(breaker.call_async(up)) == "ok"
+    assert breaker.to_dict() == {"state": CLOSED, "failures": 0, "rejected": 1}
+
+def test_upstream_timeouts_are_not_reported_as_deadlines():
+    from app.aio import run_async
+    from app.resilience import DeadlineExceededError
+
+    async def slow_socket():
+        raise TimeoutError("read timed out")
+
+    with pytest.raises(TimeoutError) as raised:
+        run_async(slow_socket(), timeout=5)
+    assert not isinstance(raised.value, DeadlineExceededError)
@@ -0,0 +1,80 @@
+import pytest
+
+from app import router as router_module
+from app.clients import get_genai
+from app.fakes import estimate_tokens
+from app.router import FAST_MODEL, LatencyHistogram, ModelRouter
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(router_module.time, "monotonic", clock.monotonic)
+    return clock
+
+def test_histogram_forgets_samples_outside_the_window(clock):
+    histogram = LatencyHistogram(window_seconds=300, slots=5)
+    for _ in range(10):
+        histogram.observe(20000)
+    assert histogram.quantile(0.95) == 32000
+
+    clock.now += 200
+    histogram.observe(300)
+    assert histogram.total == 11
+    clock.now += 150
+    assert histogram.total == 1
+    assert histogram.quantile(0.95) == 500
+
+def test_slow_model_is_probed_and_recovers(clock):
+    router = ModelRouter(latency_slo_ms=8000, min_samples=5, probe_interval=30)
+    for _ in range(5):
+        router._model_stats(FAST_MODEL).latency.observe(20000)
+
+    first = router.decide(input_chars=100)
+    assert FAST_MODEL in first.candidates and first.reason.endswith("+probe")
+    assert FAST_MODEL not in router.decide(input_chars=100).candidates
+
+    clock.now += 30
+    assert FAST_MODEL in router.decide(input_chars=100).candidates
+
+    clock.now += 300
+    decision = router.decide(input_chars=100)
+    assert decision.candidates[0] == FAST_MODEL and decision.reason == "short"
+
+def test_output_limit_leaves_room_for_a_reply():
+    config = ModelRouter().decide(input_chars=200).generation_config
+    assert config["max_output_tokens"] >= 1024
+
+def test_truncated_response_is_retried_with_a_higher_limit(monkeypatch):
+    backend = get_genai().backend
+    long_reply = "word " * 6000
+    monkeypatch.setattr(backend, "answer", lambda prompt, system_instruction: long_reply)
+    calls = backend.calls
+
+    text, _ = ModelRouter().generate("Please reply to this email.")
+    assert text == long_reply
+    assert estimate_tokens(long_reply) > 2048
+    assert backend.calls == calls + 2
+
+def test_tier_and_examples_come_from_the_signed_in_user(client, mailbox, monkeypatch, signed_in):
+    from app.few_shot import few_shot_retriever
+    from app.router import model_router
+
+    tiers, examples = [], []
+    monkeypatch.setattr(model_router, "user_tier", lambda user_id: tiers.append(user_id) or "standard")
+    monkeypatch.setattr(few_shot_retriever, "examples",
+                        lambda user_id, subject, body: examples.append(user_id) or [])
+    message = mailbox.deliver("Ana Lima <ana@example.com>", "Quarterly plan", "Can we move the review to Friday?")
+    request = {"emailId": message["id"], "userName": "Sam", "userId": "premium-user", "fresh": True}
+
+    assert client.post("/api/email/generate-reply", json=request).status_code == 200
+    assert "premium-user" not in tiers + examples
+
+    assert client.post("/api/email/generate-reply", json=request, headers=signed_in("alice")).status_code == 200
+    assert tiers[-1] == "alice" and examples == ["alice"]
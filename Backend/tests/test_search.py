@@ -0,0 +1,95 @@
+from app.aio import run_async
+from app.email_assistant import get_unread_changes_async, update_search_index
+from app.fakes import FakeCredentials
+from app.search import SearchIndex, search_index
+
+DAY_MS = 86_400_000
+
+def _doc(i, date, subject, body="", thread_id=None):
+    return {"id": f"m{i}", "threadId": thread_id or f"t{i}", "subject": subject, "from": "Ann <ann@example.com>",
+            "to": "me@example.com", "snippet": body[:40], "body": body, "date": date}
+
+def test_recency_follows_message_date_not_insertion_order(tmp_path):
+    index = SearchIndex(str(tmp_path / "search.db"))
+    # Indexed newest page first, as the unread list is fetched
+    index.upsert_many([_doc(i, 1_700_000_000_000 - i * DAY_MS, f"report {i}") for i in range(5)])
+    index.upsert_many([_doc(i, 1_700_000_000_000 - i * DAY_MS, f"report {i}") for i in range(5, 10)])
+    index.upsert_many([_doc(99, None, "report undated")])
+
+    ids = [r["id"] for r in index.search("re", limit=20)["results"]]
+    assert ids == [f"m{i}" for i in range(10)] + ["m99"]
+
+def test_common_terms_fall_back_to_recency(tmp_path):
+    index = SearchIndex(str(tmp_path / "search.db"), rank_window=5)
+    index.upsert_many([_doc(i, 1_700_000_000_000 + i * DAY_MS, "weekly meeting notes") for i in range(8)])
+
+    page = index.search("meeting", limit=3)
+    assert [r["id"] for r in page["results"]] == ["m7", "m6", "m5"]
+    assert all(r["score"] is None for r in page["results"])
+    assert page["nextOffset"] == 3
+    assert [r["id"] for r in index.search("meeting", limit=3, offset=6)["results"]] == ["m1", "m0"]
+
+def test_rare_terms_are_ranked(tmp_path):
+    index = SearchIndex(str(tmp_path / "search.db"), rank_window=5)
+    index.upsert_many([
+        _doc(1, 1_700_000_000_000, "lunch", "the invoice is attached"),
+        _doc(2, 1_600_000_000_000, "invoice overdue", "invoice for March"),
+    ])
+    results = index.search("invoice")["results"]
+    assert [r["id"] for r in results] == ["m2", "m1"]
+    assert results[0]["score"] > results[1]["score"] > 0
+
+def test_updates_keep_the_row(tmp_path):
+    index = SearchIndex(str(tmp_path / "search.db"))
+    index.upsert_many([_doc(1, 1_700_000_000_000, "draft budget")])
+    index.upsert_many([_doc(1, 1_700_000_000_000, "final budget")])
+    assert [r["subject"] for r in index.search("budget")["results"]] == ["final budget"]
+    assert index.search("draft")["results"] == []
+
+def test_read_state_is_tracked_without_reindexing(tmp_path):
+    index = SearchIndex(str(tmp_path / "search.db"))
+    index.upsert_many([_doc(1, 1_700_000_000_000, "budget review", thread_id="t1")])
+    assert index.search("budget")["results"][0]["unread"] is True
+    index.mark_threads_read(["t1"])
+    assert index.search("budget")["results"][0]["unread"] is False
+    # Refetched as unread again (a new message arrived, or marked unread in Gmail)
+    index.upsert_many([_doc(1, 1_700_000_000_000, "budget review", thread_id="t1") | {"unread": True}])
+    assert index.search("budget")["results"][0]["unread"] is True
+
+def _index_delivered(message, subject):
+    update_search_index([_doc(0, 1_700_000_000_000, subject, thread_id=message["threadId"])
+                         | {"id": message["id"]}])
+
+def test_read_threads_stay_searchable(mailbox):
+    creds = FakeCredentials()
+    message = mailbox.deliver("Quentin Zhao <qz@example.com>", "Zanzibar itinerary", "Flights to Zanzibar")
+    start = mailbox.profile()["historyId"]
+    _index_delivered(message, "Zanzibar itinerary")
+    assert [(r["id"], r["unread"]) for r in search_index.search("zanzibar")["results"]] == [(message["id"], True)]
+
+    mailbox.mark_read(message["id"])
+    events, _ = run_async(get_unread_changes_async(creds, start))
+    assert {"type": "read", "threadId": message["threadId"]} in events
+    assert [(r["id"], r["unread"]) for r in search_index.search("zanzibar")["results"]] == [(message["id"], False)]
+
+def test_trashed_threads_leave_the_index(mailbox):
+    creds = FakeCredentials()
+    message = mailbox.deliver("Quentin Zhao <qz@example.com>", "Quokka photos", "Photos from Rottnest")
+    start = mailbox.profile()["historyId"]
+    _index_delivered(message, "Quokka photos")
+    assert search_index.search("quokka")["results"]
+
+    mailbox.modify(message["id"], {"addLabelIds": ["TRASH"]})
+    events, _ = run_async(get_unread_changes_async(creds, start))
+    assert {"type": "removed", "threadId": message["threadId"]} in events
+    assert search_index.search("quokka")["results"] == []
+
+def test_records_without_a_body_keep_the_indexed_one(tmp_path):
+    index = SearchIndex(str(tmp_path / "search.db"))
+    entry = {k: v for k, v in _doc(1, 1_700_000_000_000, "garden party").items() if k != "body"}
+    index.upsert_many([entry])
+    assert index.without_body(["m1", "m2"]) == ["m1", "m2"]
+    index.set_bodies({"m1": "bring a hydrangea"})
+    index.upsert_many([entry])
+    assert index.without_body(["m1"]) == []
+    assert [r["id"] for r in index.search("hydrangea")["results"]] == ["m1"]
@@ -0,0 +1,37 @@
+import itertools
+
+from app.threads import ReplyDeduplicator
+
+def test_finished_replies_are_reused():
+    dedup, counter = ReplyDeduplicator(), itertools.count(1)
+    generate = lambda: f"reply {next(counter)}"
+    assert dedup.run("thread", generate) == "reply 1"
+    assert dedup.run("thread", generate) == "reply 1"
+    assert dedup.run("other", generate) == "reply 2"
+
+def test_fresh_skips_and_replaces_the_cached_reply():
+    dedup, counter = ReplyDeduplicator(), itertools.count(1)
+    generate = lambda: f"reply {next(counter)}"
+    assert dedup.run("thread", generate) == "reply 1"
+    assert dedup.run("thread", generate, fresh=True) == "reply 2"
+    assert dedup.run("thread", generate) == "reply 2"
+
+def test_uncacheable_results_are_regenerated():
+    dedup, counter = ReplyDeduplicator(), itertools.count(1)
+    generate = lambda: f"Error {next(counter)}"
+    assert dedup.run("thread", generate, should_cache=lambda r: not r.startswith("Error")) == "Error 1"
+    assert dedup.run("thread", generate, should_cache=lambda r: not r.startswith("Error")) == "Error 2"
+
+def test_generate_reply_fresh_calls_gemini_again(client, mailbox):
+    from app.clients import get_genai
+
+    gemini = get_genai().backend
+    message = mailbox.deliver("Ana Lima <ana@example.com>", "Dinner plans", "Are you free for dinner on Friday?")
+    request = {"emailId": message["id"], "userName": "Sam"}
+
+    assert client.post("/api/email/generate-reply", json=request).status_code == 200
+    calls = gemini.calls
+    assert client.post("/api/email/generate-reply", json=request).status_code == 200
+    assert gemini.calls == calls
+    assert client.post("/api/email/generate-reply", json=dict(request, fresh=True)).status_code == 200
+    assert gemini.calls > calls
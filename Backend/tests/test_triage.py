@@ -0,0 +1,63 @@
+import pytest
+
+from app.triage import AUTOMATED, MODEL_REASON, classify_message, get_model, is_certainly_automated
+
+# Ordinary mail, mostly in words the seed corpus has never seen
+HUMAN = [
+    ("Hello", "Hey"),
+    ("VPN", "Hi John, your password for the VPN account was reset by IT, can you check?"),
+    ("Lunch", "Hi again, are you free Thursday?"),
+]
+# Automated-looking text sent without any telling header
+MODEL_AUTOMATED = [
+    ("Your code", "your verification code is 482913"),
+    ("Sale", "limited time offer, sale ends tonight"),
+]
+
+def _message(sender, subject, snippet, extra_headers=()):
+    headers = [{"name": "From", "value": sender}, {"name": "Subject", "value": subject}]
+    return {"snippet": snippet, "payload": {"headers": headers + list(extra_headers)}}
+
+@pytest.mark.parametrize("subject,body", HUMAN)
+def test_unknown_words_do_not_make_mail_automated(subject, body):
+    triage = classify_message(_message("John Doe <john@example.com>", subject, body))
+    assert triage["label"] != AUTOMATED
+    assert triage["reason"] == MODEL_REASON
+
+def test_words_outside_the_vocabulary_are_ignored():
+    model = get_model()
+    assert model.predict("your verification code is") == model.predict("your verification code is zxqv plugh")
+
+@pytest.mark.parametrize("subject,body", MODEL_AUTOMATED)
+def test_model_only_automated_is_not_certain(subject, body):
+    triage = classify_message(_message("John Doe <john@example.com>", subject, body))
+    assert triage == {"label": AUTOMATED, "reason": MODEL_REASON}
+    assert not is_certainly_automated(triage)
+
+@pytest.mark.parametrize("sender,headers,reason", [
+    ("News <news@example.com>", [{"name": "List-Unsubscribe", "value": "<mailto:u@example.com>"}], "mailing-list"),
+    ("Bot <bot@example.com>", [{"name": "Auto-Submitted", "value": "auto-generated"}], "auto-submitted"),
+    ("Shop <noreply@shop.example>", [], "no-reply-sender"),
+    ("Digest <digest@example.com>", [{"name": "Precedence", "value": "bulk"}], "bulk-precedence"),
+])
+def test_header_heuristics_are_certain(sender, headers, reason):
+    triage = classify_message(_message(sender, "Can we meet?", "are you free tomorrow?", headers))
+    assert triage == {"label": AUTOMATED, "reason": reason}
+    assert is_certainly_automated(triage)
+
+@pytest.mark.parametrize("subject,body", MODEL_AUTOMATED)
+def test_generate_reply_answers_model_only_automated(client, mailbox, subject, body):
+    message = mailbox.deliver("John Doe <john@example.com>", subject, body)
+    response = client.post("/api/email/generate-reply", json={"emailId": message["id"], "userName": "Sam"})
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()["success"]
+
+def test_generate_reply_refuses_header_automated(client, mailbox):
+    message = mailbox.deliver("Alerts <no-reply@bank.example>", "Statement ready", "can you check this?")
+    response = client.post("/api/email/generate-reply", json={"emailId": message["id"], "userName": "Sam"})
+    assert response.status_code == 422
+    assert response.get_json()["reason"] == "no-reply-sender"
+
+    forced = client.post("/api/email/generate-reply",
+                         json={"emailId": message["id"], "userName": "Sam", "force": True})
+    assert forced.status_code == 200
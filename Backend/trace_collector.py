@@ -0,0 +1,86 @@
+"""
+Local stand-in for an OTLP/HTTP trace collector.
+
+Accepts OTLP/JSON on POST /v1/traces (what the app sends with
+TRACE_EXPORTER=otlp) and appends one JSON line per span to a file, so request
+timelines can be inspected without running a real collector.
+
+    python trace_collector.py --port 4318 --out traces.jsonl
+"""
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+def _attr_value(value):
+    for key in ("stringValue", "boolValue", "doubleValue"):
+        if key in value:
+            return value[key]
+    if "intValue" in value:
+        return int(value["intValue"])
+    return None
+
+def flatten(payload):
+    """Yield one flat dict per span of an ExportTraceServiceRequest."""
+    for resource_spans in payload.get("resourceSpans", []):
+        resource = {a["key"]: _attr_value(a["value"])
+                    for a in resource_spans.get("resource", {}).get("attributes", [])}
+        for scope_spans in resource_spans.get("scopeSpans", []):
+            for span in scope_spans.get("spans", []):
+                start, end = int(span["startTimeUnixNano"]), int(span["endTimeUnixNano"])
+                yield {
+                    "service": resource.get("service.name"),
+                    "trace_id": span["traceId"],
+                    "span_id": span["spanId"],
+                    "parent_id": span.get("parentSpanId") or None,
+                    "name": span["name"],
+                    "start_ns": start,
+                    "duration_ms": round((end - start) / 1e6, 3),
+                    "attributes": {a["key"]: _attr_value(a["value"]) for a in span.get("attributes", [])},
+                    "error": span.get("status", {}).get("message"),
+                }
+
+def make_handler(out_path):
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != "/v1/traces":
+                self.send_error(404)
+                return
+            try:
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                spans = list(flatten(payload))
+            except (ValueError, KeyError) as e:
+                self.send_error(400, str(e))
+                return
+            with lock, open(out_path, "a") as f:
+                for span in spans:
+                    f.write(json.dumps(span) + "\n")
+            body = b"{}"
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4318)
+    parser.add_argument("--out", default="traces.jsonl")
+    args = parser.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args.out))
+    print(f"Collecting traces on http://{args.host}:{args.port}/v1/traces -> {args.out}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -59,6 +59,11 @@ export const EmailList: React.FC<EmailListProps> = ({
             <div className="flex-1 min-w-0">
               <p className="text-sm font-medium text-white truncate">
                 {email.from}
+                {email.messageCount && email.messageCount > 1 && (
+                  <span className="ml-2 text-xs text-gray-400">
+                    ({email.messageCount})
+                  </span>
+                )}
               </p>
               <p className="text-sm text-gray-400 truncate">{email.subject}</p>
               <p className="text-xs text-gray-500 mt-1 truncate">
@@ -3,24 +3,71 @@ import { User } from "@supabase/supabase-js";
 import { EmailList } from "../components/EmailList";
 import { EmailDetail } from "../components/EmailDetail";
 import { ReplyForm } from "../components/ReplyForm";
-import { Email } from "../types/email";
+import { Email, EmailChange } from "../types/email";
 import { useNavigate } from "react-router-dom";
+import { supabase } from "../services/supabase";
 
 interface DashboardProps {
   user: User;
 }
 
+// Fallback when the server has no room for another change stream
+const POLL_INTERVAL_MS = 60000;
+
+const applyChanges = (emails: Email[], changes: EmailChange[]): Email[] => {
+  let updated = emails;
+  for (const change of changes) {
+    if (change.type === "added") {
+      const threadId = change.message.threadId;
+      // Newest first; a thread with a new message moves back to the top
+      updated = [change.message, ...updated.filter((e) => e.threadId !== threadId)];
+    } else {
+      updated = updated.filter((e) => e.threadId !== change.threadId);
+    }
+  }
+  return updated;
+};
+
 export const Dashboard: React.FC<DashboardProps> = ({ user }) => {
   const [emails, setEmails] = useState<Email[]>([]);
   const [selectedEmail, setSelectedEmail] = useState<Email | null>(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
+  const [authenticated, setAuthenticated] = useState(false);
   const navigate = useNavigate();
 
   useEffect(() => {
     checkGmailAuth();
   }, []);
 
+  // The server pushes changes to the unread list, so nothing is polled while idle
+  useEffect(() => {
+    if (!authenticated) return;
+    let poll: number | undefined;
+    const source = new EventSource(
+      `${import.meta.env.VITE_API_URL}/api/email/changes`
+    );
+    source.addEventListener("change", (event) => {
+      const { changes } = JSON.parse((event as MessageEvent).data) as {
+        changes: EmailChange[];
+      };
+      setEmails((current) => applyChanges(current, changes));
+    });
+    source.addEventListener("resync", () => {
+      fetchUnreadEmails();
+    });
+    source.onerror = () => {
+      // EventSource retries on its own unless the server refused the stream
+      if (source.readyState === EventSource.CLOSED && poll === undefined) {
+        poll = window.setInterval(fetchUnreadEmails, POLL_INTERVAL_MS);
+      }
+    };
+    return () => {
+      source.close();
+      if (poll !== undefined) window.clearInterval(poll);
+    };
+  }, [authenticated]);
+
   const checkGmailAuth = async () => {
     try {
       setLoading(true);
@@ -39,6 +86,7 @@ export const Dashboard: React.FC<DashboardProps> = ({ user }) => {
 
       // Only fetch emails if we're authenticated
       await fetchUnreadEmails();
+      setAuthenticated(true);
     } catch (err) {
       console.error("Auth check error:", err);
       setError("Unable to check Gmail authentication status");
@@ -72,12 +120,15 @@ export const Dashboard: React.FC<DashboardProps> = ({ user }) => {
     try {
       setLoading(true);  // Add loading state while generating reply
   
+      // The server reads the user (templates, sent history, tier) from the session token
+      const { data: { session } } = await supabase.auth.getSession();
       const response = await fetch(
         `${import.meta.env.VITE_API_URL}/api/email/generate-reply`,
         {
           method: "POST",
           headers: {
             "Content-Type": "application/json",
+            ...(session ? { Authorization: `Bearer ${session.access_token}` } : {}),
           },
           body: JSON.stringify({
             emailId: email.id,
@@ -121,12 +172,14 @@ export const Dashboard: React.FC<DashboardProps> = ({ user }) => {
 
   const sendReply = async (email: Email, reply: string) => {
     try {
+      const { data: { session } } = await supabase.auth.getSession();
       const response = await fetch(
         `${import.meta.env.VITE_API_URL}/api/email/send-reply`,
         {
           method: "POST",
           headers: {
             "Content-Type": "application/json",
+            ...(session ? { Authorization: `Bearer ${session.access_token}` } : {}),
           },
           body: JSON.stringify({
             emailId: email.id,
@@ -1,5 +1,8 @@
 export interface Email {
   id: string;
+  threadId?: string;
+  messageCount?: number;
+  triage?: "needs_reply" | "fyi" | "automated";
   from: string;
   to: string;
   subject: string;
@@ -8,3 +11,8 @@ export interface Email {
   date: string;
   generated_reply?: string;
 }
+
+// Delta pushed on /api/email/changes
+export type EmailChange =
+  | { type: "added"; message: Email }
+  | { type: "read" | "removed"; threadId: string };